@@ -6,14 +6,22 @@ from pathlib import Path
 import torch
 import typer
 
-from persistent_diamonds_v3.config import InfraConfig, PRESET_NAMES, PersistentDiamondsConfig
+from persistent_diamonds_v3.config import PRESET_NAMES, PersistentDiamondsConfig
 from persistent_diamonds_v3.data import (
     CachedNarratorTextDataset,
     IQTObjectiveDataStore,
     ObjectiveRequest,
     ObjectiveTensorDataset,
+    StreamingObjectiveDataset,
+    TeacherCachedDataset,
+    TeacherLogitCache,
+    TokenizedCorpus,
     build_code_cache,
+    build_teacher_cache,
+    build_tokenized_corpus,
+    find_teacher_cache,
 )
+from persistent_diamonds_v3.data.env.gridworld import GridWorldConfig
 from persistent_diamonds_v3.evaluation import compute_iqt_bundle
 from persistent_diamonds_v3.evaluation.protocols import (
     result_to_dict,
@@ -21,8 +29,13 @@ from persistent_diamonds_v3.evaluation.protocols import (
     run_protocol2,
     run_protocol3,
 )
-from persistent_diamonds_v3.models import ControlHead, DiscreteNarrator, ModularSSMWorldModel, ReportHead
-from persistent_diamonds_v3.data.env.gridworld import GridWorldConfig
+from persistent_diamonds_v3.models import (
+    ControlHead,
+    DiscreteNarrator,
+    InferenceSession,
+    ModularSSMWorldModel,
+    ReportHead,
+)
 from persistent_diamonds_v3.training import (
     DistillationTrainer,
     NarratorTextDataset,
@@ -30,6 +43,7 @@ from persistent_diamonds_v3.training import (
     Stage2ShapingTrainer,
     Stage4EmbodiedTrainer,
     build_synthetic_distillation_corpus,
+    load_teacher,
     load_tokenizer,
 )
 
@@ -71,6 +85,46 @@ def _apply_infra_overrides(
         cfg.infra.use_accelerate = use_accelerate
 
 
+def _objective_store(cfg: PersistentDiamondsConfig) -> IQTObjectiveDataStore:
+    return IQTObjectiveDataStore(
+        cfg.data.cache_dir,
+        workers=cfg.data.generation_workers,
+        shard_size=cfg.data.generation_shard_size,
+        storage_format=cfg.data.storage_format,
+        chunk_rows=cfg.data.chunk_rows,
+        chunk_codec=cfg.data.chunk_codec,
+        compact=cfg.data.compact_storage,
+        memory_limit_mb=cfg.data.memory_limit_mb,
+    )
+
+
+def _stage_dataset(cfg: PersistentDiamondsConfig, objective: str, *, batch_size: int):
+    request = ObjectiveRequest(
+        objective=objective,  # type: ignore[arg-type]
+        num_sequences=cfg.data.default_num_sequences,
+        sequence_length=cfg.data.default_sequence_length,
+        feature_dim=cfg.data.feature_dim,
+    )
+    if cfg.data.streaming:
+        return StreamingObjectiveDataset(request, batch_size=batch_size)
+    return ObjectiveTensorDataset(_objective_store(cfg).materialize(request).dataset_path)
+
+
+def _loader_kwargs(cfg: PersistentDiamondsConfig) -> dict[str, object]:
+    return {
+        "num_workers": cfg.data.loader_workers,
+        "prefetch_factor": cfg.data.prefetch_factor,
+        "persistent_workers": cfg.data.persistent_workers,
+        "device_prefetch": cfg.data.device_prefetch,
+    }
+
+
+def _echo_pipeline_timing(result) -> None:
+    typer.echo(
+        f"Input pipeline wait={result.data_wait_seconds:.1f}s compute={result.compute_seconds:.1f}s"
+    )
+
+
 def _build_world_narrator(cfg: PersistentDiamondsConfig):
     world = ModularSSMWorldModel(
         input_dim=cfg.world_model.input_dim,
@@ -79,6 +133,7 @@ def _build_world_narrator(cfg: PersistentDiamondsConfig):
         overlap_ratio=cfg.world_model.overlap_ratio,
         hidden_dim=cfg.world_model.hidden_dim,
         action_dim=cfg.world_model.action_dim,
+        fused=cfg.world_model.fused_dynamics,
     )
     narrator = DiscreteNarrator(
         latent_dim=cfg.world_model.latent_dim,
@@ -88,6 +143,10 @@ def _build_world_narrator(cfg: PersistentDiamondsConfig):
         codebook_size=cfg.narrator.codebook_size,
         codes_per_step=cfg.narrator.codes_per_step,
         code_dim=cfg.narrator.code_dim,
+        vq_search=cfg.narrator.vq_search,
+        vq_memory_budget_mb=cfg.narrator.vq_memory_budget_mb,
+        vq_coarse_clusters=cfg.narrator.vq_coarse_clusters,
+        vq_probe=cfg.narrator.vq_probe,
     )
     return world, narrator
 
@@ -144,9 +203,21 @@ def prepare_data(
     feature_dim: int | None = None,
     seed: int = 17,
     force_generate: bool = False,
+    workers: int | None = typer.Option(None, help="Processes used to generate objective data"),
+    shard_size: int | None = typer.Option(None, help="Sequences per generation shard"),
+    storage_format: str | None = typer.Option(None, help="npz (compressed), npy (memory-mapped) or chunked"),
+    memory_limit_mb: int | None = typer.Option(None, help="Memory ceiling for writing/ingesting data"),
 ):
     cfg = _load_config(config_path)
-    store = IQTObjectiveDataStore(cfg.data.cache_dir)
+    if workers is not None:
+        cfg.data.generation_workers = workers
+    if shard_size is not None:
+        cfg.data.generation_shard_size = shard_size
+    if storage_format is not None:
+        cfg.data.storage_format = storage_format
+    if memory_limit_mb is not None:
+        cfg.data.memory_limit_mb = memory_limit_mb
+    store = _objective_store(cfg)
 
     request = ObjectiveRequest(
         objective=objective,  # type: ignore[arg-type]
@@ -172,20 +243,17 @@ def train_stage1(
     grad_accum: int | None = typer.Option(None, help="Gradient accumulation steps"),
     activation_ckpt: bool | None = typer.Option(None, help="Enable activation checkpointing"),
     use_accelerate: bool | None = typer.Option(None, help="Use HF Accelerate"),
+    streaming: bool | None = typer.Option(None, help="Generate objective batches on the fly"),
+    tbptt_chunk: int | None = typer.Option(None, help="Truncated-BPTT window length (0: whole sequences)"),
+    start_step: int = typer.Option(0, help="Resume a streaming run at this batch (previous start-step + batches)"),
 ):
     cfg = _load_config(config_path, preset=preset)
     _apply_infra_overrides(cfg, bf16=bf16, grad_accum=grad_accum, activation_ckpt=activation_ckpt, use_accelerate=use_accelerate)
-    store = IQTObjectiveDataStore(cfg.data.cache_dir)
-    data = store.materialize(
-        ObjectiveRequest(
-            objective=objective,  # type: ignore[arg-type]
-            num_sequences=cfg.data.default_num_sequences,
-            sequence_length=cfg.data.default_sequence_length,
-            feature_dim=cfg.data.feature_dim,
-        )
-    )
-
-    dataset = ObjectiveTensorDataset(data.dataset_path)
+    if streaming is not None:
+        cfg.data.streaming = streaming
+    if tbptt_chunk is not None:
+        cfg.data.tbptt_chunk_length = tbptt_chunk
+    dataset = _stage_dataset(cfg, objective, batch_size=16)
     world, _ = _build_world_narrator(cfg)
 
     trainer = Stage1JEPATrainer(
@@ -194,17 +262,24 @@ def train_stage1(
         learning_rate=cfg.train.learning_rate,
         weight_decay=cfg.train.weight_decay,
         device=cfg.train.device,
+        infra=cfg.infra,
     )
     result = trainer.train(
         dataset,
         batch_size=16,
         max_steps=min(cfg.train.max_steps, 2000),
+        chunk_length=cfg.data.tbptt_chunk_length or None,
+        start_step=start_step,
+        **_loader_kwargs(cfg),
     )
 
     checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
     torch.save(world.state_dict(), checkpoint_path)
 
-    typer.echo(f"Stage 1 complete. loss={result.final_loss:.4f} steps={result.steps}")
+    typer.echo(
+        f"Stage 1 complete. loss={result.final_loss:.4f} steps={result.steps} batches={result.batches}"
+    )
+    _echo_pipeline_timing(result)
     typer.echo(f"Saved: {checkpoint_path}")
 
 
@@ -219,21 +294,17 @@ def train_stage2(
     grad_accum: int | None = typer.Option(None, help="Gradient accumulation steps"),
     activation_ckpt: bool | None = typer.Option(None, help="Enable activation checkpointing"),
     use_accelerate: bool | None = typer.Option(None, help="Use HF Accelerate"),
+    streaming: bool | None = typer.Option(None, help="Generate objective batches on the fly"),
+    tbptt_chunk: int | None = typer.Option(None, help="Truncated-BPTT window length (0: whole sequences)"),
+    start_step: int = typer.Option(0, help="Resume a streaming run at this batch (previous start-step + batches)"),
 ):
     cfg = _load_config(config_path, preset=preset)
     _apply_infra_overrides(cfg, bf16=bf16, grad_accum=grad_accum, activation_ckpt=activation_ckpt, use_accelerate=use_accelerate)
-    store = IQTObjectiveDataStore(cfg.data.cache_dir)
-
-    data = store.materialize(
-        ObjectiveRequest(
-            objective=objective,  # type: ignore[arg-type]
-            num_sequences=cfg.data.default_num_sequences,
-            sequence_length=cfg.data.default_sequence_length,
-            feature_dim=cfg.data.feature_dim,
-        )
-    )
-
-    dataset = ObjectiveTensorDataset(data.dataset_path)
+    if streaming is not None:
+        cfg.data.streaming = streaming
+    if tbptt_chunk is not None:
+        cfg.data.tbptt_chunk_length = tbptt_chunk
+    dataset = _stage_dataset(cfg, objective, batch_size=8)
     world, narrator = _build_world_narrator(cfg)
 
     if world_checkpoint and world_checkpoint.exists():
@@ -248,12 +319,16 @@ def train_stage2(
         learning_rate=cfg.train.learning_rate,
         weight_decay=cfg.train.weight_decay,
         device=cfg.train.device,
+        infra=cfg.infra,
     )
 
     result = trainer.train(
         dataset,
         batch_size=8,
         max_steps=min(cfg.train.max_steps, 2000),
+        chunk_length=cfg.data.tbptt_chunk_length or None,
+        start_step=start_step,
+        **_loader_kwargs(cfg),
     )
 
     save_dir.mkdir(parents=True, exist_ok=True)
@@ -264,12 +339,90 @@ def train_stage2(
 
     typer.echo(
         "Stage 2 complete. "
-        f"loss={result.final_loss:.4f} rate={result.final_rate_bits_per_sec:.2f}bps steps={result.steps}"
+        f"loss={result.final_loss:.4f} rate={result.final_rate_bits_per_sec:.2f}bps steps={result.steps} "
+        f"batches={result.batches}"
     )
+    _echo_pipeline_timing(result)
     typer.echo(f"Saved: {world_out}")
     typer.echo(f"Saved: {narrator_out}")
 
 
+def _resolve_distill_inputs(
+    cfg: PersistentDiamondsConfig,
+    objective_data: Path | None,
+    corpus_path: Path,
+) -> Path:
+    """Materialize default objective data and the synthetic corpus if missing."""
+    if objective_data is None:
+        store = _objective_store(cfg)
+        materialized = store.materialize(
+            ObjectiveRequest(
+                objective="mixed",
+                num_sequences=cfg.data.default_num_sequences,
+                sequence_length=cfg.data.default_sequence_length,
+                feature_dim=cfg.data.feature_dim,
+            )
+        )
+        objective_data = materialized.dataset_path
+
+    if not corpus_path.exists():
+        corpus_path.parent.mkdir(parents=True, exist_ok=True)
+        build_synthetic_distillation_corpus(objective_data, corpus_path)
+    return objective_data
+
+
+def _maybe_pretokenize(cfg: PersistentDiamondsConfig, corpus_path: Path, tokenizer) -> TokenizedCorpus | None:
+    if not cfg.distillation.pretokenize:
+        return None
+    tokens_path = build_tokenized_corpus(
+        corpus_path,
+        tokenizer,
+        cfg.distillation.tokenized_corpus_dir,
+        max_text_length=256,
+    )
+    typer.echo(f"Tokenized corpus: {tokens_path}")
+    return TokenizedCorpus(tokens_path)
+
+
+@app.command("cache-teacher")
+def cache_teacher(
+    config_path: Path = Path("pdv3.yaml"),
+    objective_data: Path | None = None,
+    corpus_path: Path = Path("artifacts/distill/corpus.jsonl"),
+    batch_size: int = 8,
+    preset: str | None = typer.Option(None, help=f"Size preset: {', '.join(PRESET_NAMES)}"),
+):
+    """Run the teacher once over the corpus and store top-k logits for distillation."""
+    cfg = _load_config(config_path, preset=preset)
+    _resolve_distill_inputs(cfg, objective_data, corpus_path)
+
+    tokenizer = load_tokenizer(cfg.distillation)
+    tokenized_corpus = _maybe_pretokenize(cfg, corpus_path, tokenizer)
+    teacher, teacher_name = load_teacher(cfg.distillation, device=cfg.train.device)
+
+    hidden_layers = tuple(cfg.distillation.teacher_hidden_layers)
+    if cfg.distillation.hidden_alignment and not hidden_layers:
+        # Same middle layer the online trainer aligns against.
+        hidden_layers = ((teacher.config.num_hidden_layers + 1) // 2,)
+
+    cache_path = build_teacher_cache(
+        corpus_path=corpus_path,
+        teacher_model=teacher,
+        tokenizer=tokenizer,
+        cache_dir=cfg.distillation.teacher_cache_dir,
+        teacher_name=teacher_name,
+        top_k=cfg.distillation.teacher_top_k,
+        hidden_layers=hidden_layers,
+        max_text_length=256,
+        temperature=cfg.distillation.temperature,
+        batch_size=batch_size,
+        device=cfg.train.device,
+        tokenized_corpus=tokenized_corpus,
+    )
+    typer.echo(f"Teacher cache complete. teacher={teacher_name} top_k={cfg.distillation.teacher_top_k}")
+    typer.echo(f"Cache: {cache_path}")
+
+
 @app.command("train-distill")
 def train_distill(
     config_path: Path = Path("pdv3.yaml"),
@@ -279,6 +432,7 @@ def train_distill(
     corpus_path: Path = Path("artifacts/distill/corpus.jsonl"),
     report_out: Path = Path("artifacts/report_head.pt"),
     use_cache: bool = True,
+    teacher_cache: bool = typer.Option(False, help="Train from a `cache-teacher` run; the teacher is not loaded"),
     preset: str | None = typer.Option(None, help=f"Size preset: {', '.join(PRESET_NAMES)}"),
     bf16: bool | None = typer.Option(None, help="Enable bfloat16 mixed precision"),
     grad_accum: int | None = typer.Option(None, help="Gradient accumulation steps"),
@@ -287,18 +441,7 @@ def train_distill(
 ):
     cfg = _load_config(config_path, preset=preset)
     _apply_infra_overrides(cfg, bf16=bf16, grad_accum=grad_accum, activation_ckpt=activation_ckpt, use_accelerate=use_accelerate)
-    store = IQTObjectiveDataStore(cfg.data.cache_dir)
-
-    if objective_data is None:
-        materialized = store.materialize(
-            ObjectiveRequest(
-                objective="mixed",
-                num_sequences=cfg.data.default_num_sequences,
-                sequence_length=cfg.data.default_sequence_length,
-                feature_dim=cfg.data.feature_dim,
-            )
-        )
-        objective_data = materialized.dataset_path
+    objective_data = _resolve_distill_inputs(cfg, objective_data, corpus_path)
 
     world, narrator = _build_world_narrator(cfg)
 
@@ -307,10 +450,6 @@ def train_distill(
     if narrator_checkpoint and narrator_checkpoint.exists():
         narrator.load_state_dict(_load_weights(narrator_checkpoint))
 
-    if not corpus_path.exists():
-        corpus_path.parent.mkdir(parents=True, exist_ok=True)
-        build_synthetic_distillation_corpus(objective_data, corpus_path)
-
     tokenizer = load_tokenizer(cfg.distillation)
     tokenizer_vocab = len(tokenizer)
     if cfg.report_head.vocab_size != tokenizer_vocab:
@@ -318,6 +457,7 @@ def train_distill(
             "Adjusting report-head vocab size to match teacher tokenizer: "
             f"{cfg.report_head.vocab_size} -> {tokenizer_vocab}"
         )
+    tokenized_corpus = _maybe_pretokenize(cfg, corpus_path, tokenizer)
 
     if use_cache:
         typer.echo("Building/loading code cache...")
@@ -328,6 +468,7 @@ def train_distill(
             narrator=narrator,
             cache_dir=cfg.distillation.code_cache_dir,
             device=cfg.train.device,
+            batch_size=cfg.distillation.code_cache_batch_size,
         )
         typer.echo(f"Code cache: {cache_path}")
         dataset = CachedNarratorTextDataset(
@@ -335,6 +476,7 @@ def train_distill(
             corpus_path=corpus_path,
             tokenizer=tokenizer,
             max_text_length=256,
+            tokenized_corpus=tokenized_corpus,
         )
     else:
         dataset = NarratorTextDataset(
@@ -344,11 +486,39 @@ def train_distill(
             narrator=narrator,
             tokenizer=tokenizer,
             device=cfg.train.device,
+            tokenized_corpus=tokenized_corpus,
+            code_memo_size=cfg.distillation.code_memo_size,
+            encode_batch_size=cfg.distillation.code_cache_batch_size,
         )
 
+    cache = None
+    if teacher_cache:
+        cache_path = find_teacher_cache(
+            corpus_path,
+            cfg.distillation.teacher_cache_dir,
+            [cfg.distillation.teacher_model_name, *cfg.distillation.teacher_model_fallbacks],
+            top_k=cfg.distillation.teacher_top_k,
+            max_text_length=256,
+            temperature=cfg.distillation.temperature,
+        )
+        if cache_path is None:
+            raise FileNotFoundError(
+                f"No teacher cache for {corpus_path} in {cfg.distillation.teacher_cache_dir}; "
+                "run `pdv3 cache-teacher` first."
+            )
+        typer.echo(f"Teacher cache: {cache_path}")
+        cache = TeacherLogitCache(cache_path)
+        dataset = TeacherCachedDataset(dataset, cache)
+
     report_head = _build_report_head(cfg, vocab_size_override=tokenizer_vocab)
-    trainer = DistillationTrainer(report_head, cfg.distillation, device=cfg.train.device)
-    result = trainer.train(dataset)
+    trainer = DistillationTrainer(
+        report_head,
+        cfg.distillation,
+        device=cfg.train.device,
+        teacher_cache=cache,
+        infra=cfg.infra,
+    )
+    result = trainer.train(dataset, **_loader_kwargs(cfg))
 
     report_out.parent.mkdir(parents=True, exist_ok=True)
     torch.save(report_head.state_dict(), report_out)
@@ -362,9 +532,12 @@ def train_distill(
                 "final_loss_ce": result.final_loss_ce,
                 "final_loss_hidden": result.final_loss_hidden,
                 "steps": result.steps,
+                "data_wait_seconds": result.data_wait_seconds,
+                "compute_seconds": result.compute_seconds,
                 "objective_data": str(objective_data),
                 "corpus": str(corpus_path),
                 "hidden_alignment": cfg.distillation.hidden_alignment,
+                "teacher_cache": str(cache.cache_path) if cache is not None else None,
             },
             indent=2,
         )
@@ -375,6 +548,7 @@ def train_distill(
     )
     if cfg.distillation.hidden_alignment:
         typer.echo(f"  KL={result.final_loss_kl:.4f} CE={result.final_loss_ce:.4f} hidden={result.final_loss_hidden:.4f}")
+    _echo_pipeline_timing(result)
     typer.echo(f"Saved: {report_out}")
     typer.echo(f"Metadata: {metadata}")
 
@@ -417,6 +591,7 @@ def train_stage4(
         learning_rate=cfg.train.learning_rate,
         weight_decay=cfg.train.weight_decay,
         device=cfg.train.device,
+        infra=cfg.infra,
     )
 
     env_config = GridWorldConfig(
@@ -469,7 +644,7 @@ def evaluate(
     world_checkpoint: Path | None = None,
 ):
     cfg = _load_config(config_path)
-    store = IQTObjectiveDataStore(cfg.data.cache_dir)
+    store = _objective_store(cfg)
     data = store.materialize(
         ObjectiveRequest(
             objective=objective,  # type: ignore[arg-type]
@@ -481,7 +656,7 @@ def evaluate(
 
     dataset = ObjectiveTensorDataset(data.dataset_path)
     batch_count = min(32, len(dataset))
-    obs = torch.stack([dataset[i]["observations"] for i in range(batch_count)], dim=0)
+    obs = dataset[:batch_count]["observations"]
 
     world, _ = _build_world_narrator(cfg)
     if world_checkpoint is not None:
@@ -516,9 +691,57 @@ def evaluate(
     typer.echo(json.dumps(payload, indent=2))
 
 
+@app.command("bench-session")
+def bench_session(
+    config_path: Path = Path("pdv3.yaml"),
+    preset: str | None = typer.Option(None, help=f"Size preset: {', '.join(PRESET_NAMES)}"),
+    world_checkpoint: Path | None = None,
+    narrator_checkpoint: Path | None = None,
+    ticks: int = 1000,
+    warmup_ticks: int = 50,
+    batch_size: int = 1,
+):
+    """Measure streaming per-tick latency against the world-step deadline."""
+    cfg = _load_config(config_path, preset=preset)
+    world, narrator = _build_world_narrator(cfg)
+    if world_checkpoint and world_checkpoint.exists():
+        world.load_state_dict(_load_weights(world_checkpoint))
+    if narrator_checkpoint and narrator_checkpoint.exists():
+        narrator.load_state_dict(_load_weights(narrator_checkpoint))
+
+    session = InferenceSession(
+        world,
+        narrator,
+        control_head=_build_control_head(cfg),
+        world_step_hz=cfg.narrator.world_step_hz,
+        batch_size=batch_size,
+        device=cfg.train.device,
+    )
+    observations = torch.randn(warmup_ticks + ticks, batch_size, cfg.world_model.input_dim)
+    for obs in observations[:warmup_ticks]:
+        session.tick(obs)
+    session.reset()
+    for obs in observations[warmup_ticks:]:
+        session.tick(obs)
+
+    report = session.latency_report()
+    payload = {
+        "ticks": report.ticks,
+        "deadline_misses": report.deadline_misses,
+        "miss_rate": report.miss_rate,
+        "budget_ms": report.budget_ms,
+        "mean_ms": report.mean_ms,
+        "p50_ms": report.p50_ms,
+        "p90_ms": report.p90_ms,
+        "p99_ms": report.p99_ms,
+        "max_ms": report.max_ms,
+    }
+    typer.echo(json.dumps(payload, indent=2))
+
+
 def _prepare_eval_obs(cfg: PersistentDiamondsConfig, objective: str = "mixed") -> torch.Tensor:
     """Prepare a small observation batch for protocol evaluation."""
-    store = IQTObjectiveDataStore(cfg.data.cache_dir)
+    store = _objective_store(cfg)
     data = store.materialize(
         ObjectiveRequest(
             objective=objective,  # type: ignore[arg-type]
@@ -529,7 +752,7 @@ def _prepare_eval_obs(cfg: PersistentDiamondsConfig, objective: str = "mixed") -
     )
     dataset = ObjectiveTensorDataset(data.dataset_path)
     batch_count = min(32, len(dataset))
-    return torch.stack([dataset[i]["observations"] for i in range(batch_count)], dim=0)
+    return dataset[:batch_count]["observations"]
 
 
 @app.command("protocol1")
@@ -18,6 +18,8 @@ class WorldModelConfig:
     overlap_ratio: float = 0.25
     hidden_dim: int = 2048
     action_dim: int = 0
+    # Run all module dynamics as one batched matmul per layer.
+    fused_dynamics: bool = False
 
 
 @dataclass(slots=True)
@@ -29,6 +31,13 @@ class NarratorConfig:
     codebook_size: int = 1024
     codes_per_step: int = 8
     code_dim: int = 64
+    # Nearest-code search: "exact" (chunked full scan) or "ivf" (approximate
+    # two-level search for very large codebooks; eval or frozen codebook only,
+    # exact search is used while the codebook trains).
+    vq_search: str = "exact"
+    vq_memory_budget_mb: float = 64.0
+    vq_coarse_clusters: int = 0  # 0 = round(sqrt(codebook_size))
+    vq_probe: int = 8
 
 
 @dataclass(slots=True)
@@ -78,6 +87,22 @@ class DistillationConfig:
     hidden_projection_dim: int = 256
     # Cached narrator code-sequence path (skip recompute when set)
     code_cache_dir: str = ".cache/pdv3/distill_codes"
+    code_cache_batch_size: int = 64
+    # On-the-fly encoding (no code cache): LRU memo size, in trajectories
+    code_memo_size: int = 1024
+    # Offline teacher-logit cache (`pdv3 cache-teacher`)
+    teacher_cache_dir: str = ".cache/pdv3/teacher_logits"
+    teacher_top_k: int = 64
+    # Teacher hidden layers to store; empty = middle layer when hidden_alignment is on
+    teacher_hidden_layers: tuple[int, ...] = ()
+    # KL mode: "dense" (full-vocab softmax) or "topk" (teacher top-k + tail
+    # bucket, chunked over positions; always used with a teacher cache)
+    kl_mode: str = "dense"
+    loss_chunk_size: int = 1024
+    # Tokenize the corpus once (unpadded) and batch records of similar length
+    pretokenize: bool = True
+    length_bucketing: bool = True
+    tokenized_corpus_dir: str = ".cache/pdv3/distill_tokens"
 
 
 @dataclass(slots=True)
@@ -103,6 +128,31 @@ class DataConfig:
     default_num_sequences: int = 512
     default_sequence_length: int = 256
     feature_dim: int = 256
+    # Objective generation: processes and sequences per shard.  Output is
+    # identical for any setting.
+    generation_workers: int = 1
+    generation_shard_size: int = 256
+    # "npz" (compressed archive), "npy" (memory-mapped per-array files) or
+    # "chunked" (per-chunk zlib/lzma with random access).
+    storage_format: str = "npz"
+    chunk_rows: int = 16
+    chunk_codec: str = "zlib"
+    # Persist only irreducible arrays; targets and zero signals are derived on load.
+    compact_storage: bool = True
+    # Peak memory for chunked writes (e.g. ingesting .npy sources larger than RAM).
+    memory_limit_mb: int = 512
+    # Stage 1/2: generate batches on the fly instead of materializing.
+    streaming: bool = False
+    # Input pipeline for stages 1-3: DataLoader worker processes, batches
+    # each worker keeps in flight, and workers kept alive across epochs.
+    loader_workers: int = 0
+    prefetch_factor: int = 2
+    persistent_workers: bool = True
+    # Batches staged on the training device by a background thread (0: inline).
+    device_prefetch: int = 1
+    # Stage 1/2 truncated BPTT: train on windows of this many steps with the
+    # world state carried across windows of each sequence (0: whole sequences).
+    tbptt_chunk_length: int = 0
 
 
 @dataclass(slots=True)
@@ -120,6 +170,11 @@ class InfraConfig:
     bf16: bool = False
     gradient_accumulation_steps: int = 1
     activation_checkpointing: bool = False
+    # World-model time-axis checkpointing (with activation_checkpointing):
+    # steps per recomputed segment, or 0 to pick it per forward, fitting
+    # activation_memory_mb if set, else sqrt(T).
+    checkpoint_segment_steps: int = 0
+    activation_memory_mb: float = 0.0
     use_accelerate: bool = False
 
 
@@ -1,19 +1,57 @@
+from persistent_diamonds_v3.data.chunked_store import ChunkedArray, write_chunked_arrays
 from persistent_diamonds_v3.data.distill_cache import (
     CachedNarratorTextDataset,
     build_code_cache,
 )
 from persistent_diamonds_v3.data.objectives import (
     IQTObjectiveDataStore,
+    ObjectiveBatchSampler,
     ObjectiveMaterialization,
     ObjectiveRequest,
     ObjectiveTensorDataset,
+    SequenceChunkSampler,
+    StreamingObjectiveDataset,
+    convert_npz_to_npy,
+    load_objective_arrays,
+    objective_loader,
+)
+from persistent_diamonds_v3.data.prefetch import DevicePrefetcher, loader_options
+from persistent_diamonds_v3.data.teacher_cache import (
+    TeacherCachedDataset,
+    TeacherLogitCache,
+    build_teacher_cache,
+    find_teacher_cache,
+)
+from persistent_diamonds_v3.data.tokenized_corpus import (
+    DynamicPaddingCollator,
+    LengthBucketBatchSampler,
+    TokenizedCorpus,
+    build_tokenized_corpus,
 )
 
 __all__ = [
+    "ChunkedArray",
+    "write_chunked_arrays",
     "CachedNarratorTextDataset",
     "build_code_cache",
     "IQTObjectiveDataStore",
+    "ObjectiveBatchSampler",
     "ObjectiveMaterialization",
     "ObjectiveRequest",
     "ObjectiveTensorDataset",
+    "SequenceChunkSampler",
+    "StreamingObjectiveDataset",
+    "convert_npz_to_npy",
+    "load_objective_arrays",
+    "objective_loader",
+    "DevicePrefetcher",
+    "loader_options",
+    "TeacherCachedDataset",
+    "TeacherLogitCache",
+    "build_teacher_cache",
+    "find_teacher_cache",
+    "DynamicPaddingCollator",
+    "LengthBucketBatchSampler",
+    "TokenizedCorpus",
+    "build_tokenized_corpus",
 ]
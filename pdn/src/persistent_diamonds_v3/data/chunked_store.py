@@ -0,0 +1,171 @@
+"""Chunk-compressed array container with per-row random access.
+
+Each array is split along its first axis into chunks of ``chunk_rows``
+rows, every chunk compressed independently with stdlib ``zlib`` or
+``lzma`` and appended to one ``.bin`` file.  A per-array offset index
+locates each chunk, so reading one sequence inflates only its chunk;
+:class:`ChunkedArray` keeps recently decoded chunks in a small LRU cache.
+"""
+
+from __future__ import annotations
+
+import json
+import lzma
+import shutil
+import zlib
+from collections import OrderedDict
+from collections.abc import Callable, Mapping
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import numpy as np
+
+INDEX_FILENAME = "index.json"
+CODECS = ("zlib", "lzma")
+
+
+def _compress(data: bytes, codec: str, level: int) -> bytes:
+    if codec == "zlib":
+        return zlib.compress(data, level)
+    return lzma.compress(data, preset=level)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    return lzma.decompress(data)
+
+
+def is_chunked_store(path: str | Path) -> bool:
+    return (Path(path) / INDEX_FILENAME).exists()
+
+
+def write_chunked_arrays(
+    arrays: Mapping[str, np.ndarray],
+    out_dir: str | Path,
+    *,
+    chunk_rows: int = 16,
+    codec: str = "zlib",
+    level: int = 6,
+    dtype: np.dtype | type | None = None,
+    progress: Callable[[int], Any] | None = None,
+) -> Path:
+    """Write ``arrays`` (sharing a first-axis length) as a chunked store.
+
+    Arrays are read ``chunk_rows`` rows at a time, so memory-mapped inputs
+    are never loaded whole; each chunk is cast to ``dtype`` if given and
+    ``progress`` is called with its row count.  The index is written last
+    into a temporary directory that is renamed into place, so partial
+    stores are never read.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"codec must be one of {CODECS}, got {codec!r}")
+    out_dir = Path(out_dir)
+    tmp_dir = out_dir.with_name(out_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    index: dict[str, Any] = {"codec": codec, "chunk_rows": chunk_rows, "arrays": {}}
+    for name, array in arrays.items():
+        rows = int(array.shape[0])
+        out_dtype = np.dtype(dtype if dtype is not None else array.dtype)
+        offsets = np.zeros(-(-rows // chunk_rows) + 1, dtype=np.int64)
+        with (tmp_dir / f"{name}.bin").open("wb") as f:
+            for i, start in enumerate(range(0, rows, chunk_rows)):
+                chunk = np.ascontiguousarray(array[start : start + chunk_rows], dtype=out_dtype)
+                f.write(_compress(chunk.tobytes(), codec, level))
+                offsets[i + 1] = f.tell()
+                if progress is not None:
+                    progress(chunk.shape[0])
+        np.save(tmp_dir / f"{name}.offsets.npy", offsets)
+        index["arrays"][name] = {"dtype": out_dtype.str, "shape": list(array.shape)}
+
+    (tmp_dir / INDEX_FILENAME).write_text(json.dumps(index, indent=2))
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    tmp_dir.rename(out_dir)
+    return out_dir
+
+
+class ChunkedArray:
+    """Read-only array view over one array of a chunked store.
+
+    Supports integer, slice and integer-array indexing along the first
+    axis; only the chunks covering the requested rows are decompressed.
+    """
+
+    def __init__(
+        self,
+        store_dir: str | Path,
+        name: str,
+        *,
+        cache_chunks: int = 8,
+    ):
+        self.store_dir = Path(store_dir)
+        self.name = name
+        index = json.loads((self.store_dir / INDEX_FILENAME).read_text())
+        meta = index["arrays"][name]
+        self.codec = str(index["codec"])
+        self.chunk_rows = int(index["chunk_rows"])
+        self.dtype = np.dtype(meta["dtype"])
+        self.shape = tuple(int(s) for s in meta["shape"])
+        self.offsets = np.load(self.store_dir / f"{name}.offsets.npy")
+        self.cache_chunks = cache_chunks
+        self._chunks: OrderedDict[int, np.ndarray] = OrderedDict()
+        self._file: BinaryIO | None = None
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def chunk(self, i: int) -> np.ndarray:
+        """Decoded rows of chunk ``i`` (read-only, LRU-cached)."""
+        cached = self._chunks.get(i)
+        if cached is not None:
+            self._chunks.move_to_end(i)
+            return cached
+        if self._file is None:
+            self._file = (self.store_dir / f"{self.name}.bin").open("rb")
+        start, stop = int(self.offsets[i]), int(self.offsets[i + 1])
+        self._file.seek(start)
+        raw = _decompress(self._file.read(stop - start), self.codec)
+        decoded = np.frombuffer(raw, dtype=self.dtype).reshape(-1, *self.shape[1:])
+        if self.cache_chunks > 0:
+            self._chunks[i] = decoded
+            while len(self._chunks) > self.cache_chunks:
+                self._chunks.popitem(last=False)
+        return decoded
+
+    def __getitem__(self, idx) -> np.ndarray:
+        if isinstance(idx, (int, np.integer)):
+            row = int(idx) + self.shape[0] if idx < 0 else int(idx)
+            if not 0 <= row < self.shape[0]:
+                raise IndexError(f"index {idx} out of range for {self.shape[0]} rows")
+            return self.chunk(row // self.chunk_rows)[row % self.chunk_rows]
+
+        rows = np.arange(self.shape[0])[idx]
+        out = np.empty((rows.size, *self.shape[1:]), dtype=self.dtype)
+        chunk_ids = rows // self.chunk_rows
+        for c in np.unique(chunk_ids):
+            sel = chunk_ids == c
+            out[sel] = self.chunk(int(c))[rows[sel] % self.chunk_rows]
+        return out
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        out = self[:]
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = dict(self.__dict__)
+        state["_chunks"] = OrderedDict()
+        state["_file"] = None
+        return state
+
+
+def open_chunked_arrays(store_dir: str | Path, *, cache_chunks: int = 8) -> dict[str, ChunkedArray]:
+    index = json.loads((Path(store_dir) / INDEX_FILENAME).read_text())
+    return {name: ChunkedArray(store_dir, name, cache_chunks=cache_chunks) for name in index["arrays"]}
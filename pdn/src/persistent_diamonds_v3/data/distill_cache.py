@@ -8,12 +8,15 @@ from __future__ import annotations
 
 import hashlib
 import json
+import zipfile
 from pathlib import Path
 
 import numpy as np
 import torch
 from torch.utils.data import Dataset
 
+from persistent_diamonds_v3.data.objectives import load_objective_arrays
+from persistent_diamonds_v3.data.tokenized_corpus import TokenizedCorpus, tokenize_record
 from persistent_diamonds_v3.models import DiscreteNarrator, ModularSSMWorldModel
 
 
@@ -26,14 +29,33 @@ def _cache_key(
     """Deterministic hash from corpus + model parameter checksums."""
     h = hashlib.sha256()
     h.update(Path(corpus_path).read_bytes())
-    h.update(str(Path(objective_npz_path).stat().st_size).encode())
+    h.update(str(_payload_size(Path(objective_npz_path))).encode())
     # Include a fingerprint of model weights for invalidation
-    for name, param in list(world_model.named_parameters())[:4]:
-        h.update(name.encode())
-        h.update(param.data.cpu().numpy().tobytes()[:256])
-    for name, param in list(narrator.named_parameters())[:4]:
+    _update_weight_fingerprint(h, world_model)
+    _update_weight_fingerprint(h, narrator)
+    return h.hexdigest()[:16]
+
+
+def _payload_size(path: Path) -> int:
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.glob("*.npy"))
+    return path.stat().st_size
+
+
+def _update_weight_fingerprint(h, model: torch.nn.Module) -> None:
+    # First 256 bytes of the first 4 parameters; sliced on-device so only
+    # those bytes are copied to host.
+    for name, param in list(model.named_parameters())[:4]:
+        flat = param.detach().reshape(-1)[: 256 // param.element_size()]
         h.update(name.encode())
-        h.update(param.data.cpu().numpy().tobytes()[:256])
+        h.update(flat.cpu().numpy().tobytes())
+
+
+def model_fingerprint(world_model: ModularSSMWorldModel, narrator: DiscreteNarrator) -> str:
+    """Cheap weight checksum used to invalidate memoized narrator codes."""
+    h = hashlib.sha256()
+    _update_weight_fingerprint(h, world_model)
+    _update_weight_fingerprint(h, narrator)
     return h.hexdigest()[:16]
 
 
@@ -45,11 +67,19 @@ def build_code_cache(
     cache_dir: str | Path,
     *,
     device: str = "cpu",
+    batch_size: int = 64,
 ) -> Path:
     """Encode all corpus items and persist code indices to an .npz file.
 
     Returns the path to the cache file.  If a valid cache already exists
     (matching hash), it is returned immediately without recomputation.
+
+    Each distinct ``trajectory_index`` is encoded once, ``batch_size``
+    trajectories per world-model + narrator call, and its codes are
+    scattered to every record that references it.  Codes are written into
+    an on-disk ``.npy`` as batches complete and then stored (uncompressed,
+    as ``np.savez`` does) into the ``.npz``, so memory stays bounded by one
+    batch.
     """
     cache_dir = Path(cache_dir)
     cache_dir.mkdir(parents=True, exist_ok=True)
@@ -66,43 +96,54 @@ def build_code_cache(
         for line in Path(corpus_path).read_text().splitlines()
         if line.strip()
     ]
-    payload = np.load(str(objective_npz_path))
-    observations = torch.from_numpy(payload["observations"]).float()
+    trajectory_indices = np.array([int(r["trajectory_index"]) for r in records], dtype=np.int64)
+    unique, inverse = np.unique(trajectory_indices, return_inverse=True)
+    # Records grouped by unique trajectory: rows for unique j are
+    # record_order[bounds[j] : bounds[j + 1]].
+    record_order = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[record_order], np.arange(unique.size + 1))
+
+    observations = load_objective_arrays(objective_npz_path)["observations"]
+    seq_len = int(observations.shape[1])
 
     world_model = world_model.to(device).eval()
     narrator_model = narrator.to(device).eval()
 
-    all_codes: list[np.ndarray] = []
-    trajectory_indices: list[int] = []
+    codes_tmp = cache_dir / f"codes_{key}.codes.npy"
+    codes = np.lib.format.open_memmap(
+        codes_tmp,
+        mode="w+",
+        dtype=np.int64,
+        shape=(len(records), seq_len, narrator_model.codes_per_step),
+    )
 
     with torch.no_grad():
-        for record in records:
-            traj_idx = int(record["trajectory_index"])
-            obs = observations[traj_idx : traj_idx + 1].to(device)
+        for start in range(0, unique.size, batch_size):
+            stop = min(start + batch_size, unique.size)
+            obs = torch.from_numpy(np.asarray(observations[unique[start:stop]])).float().to(device)
             world_out = world_model(obs)
-            states = world_out.states
-
-            step_indices: list[torch.Tensor] = []
-            for t in range(states.size(1)):
-                start = max(0, t + 1 - narrator_model.window_size)
-                out = narrator_model(states[:, start : t + 1])
-                step_indices.append(out.code_indices)
-
-            code_seq = torch.stack(step_indices, dim=1).squeeze(0).cpu().numpy()
-            all_codes.append(code_seq)
-            trajectory_indices.append(traj_idx)
-
-    np.savez(
-        cache_path,
-        codes=np.array(all_codes),
-        trajectory_indices=np.array(trajectory_indices),
-    )
+            out = narrator_model.forward_all_windows(world_out.states)
+            batch_codes = out.code_indices.cpu().numpy()
+
+            rows = record_order[bounds[start] : bounds[stop]]
+            codes[rows] = batch_codes[inverse[rows] - start]
+
+    codes.flush()
+    del codes
+
+    # Same layout np.savez produces, but the codes member is streamed from disk.
+    with zipfile.ZipFile(cache_path, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        zf.write(codes_tmp, arcname="codes.npy")
+        with zf.open("trajectory_indices.npy", mode="w", force_zip64=True) as f:
+            np.lib.format.write_array(f, trajectory_indices)
+    codes_tmp.unlink()
 
     manifest_path.write_text(
         json.dumps(
             {
                 "cache_key": key,
-                "num_items": len(all_codes),
+                "num_items": len(records),
+                "num_unique_trajectories": int(unique.size),
                 "corpus_path": str(corpus_path),
                 "objective_npz_path": str(objective_npz_path),
             },
@@ -123,6 +164,7 @@ class CachedNarratorTextDataset(Dataset):
         tokenizer,
         *,
         max_text_length: int = 256,
+        tokenized_corpus: TokenizedCorpus | None = None,
     ):
         cache = np.load(str(cache_path))
         self.all_codes = torch.from_numpy(cache["codes"]).long()
@@ -138,26 +180,36 @@ class CachedNarratorTextDataset(Dataset):
                 f"{len(self.records)} records — cache is stale."
             )
 
+        if tokenized_corpus is not None and len(tokenized_corpus) != len(self.records):
+            raise ValueError(
+                f"Tokenized corpus has {len(tokenized_corpus)} items but corpus has "
+                f"{len(self.records)} records — cache is stale."
+            )
+
         self.tokenizer = tokenizer
         self.max_text_length = max_text_length
+        self.tokenized_corpus = tokenized_corpus
 
     def __len__(self) -> int:
         return len(self.records)
 
-    def __getitem__(self, idx: int) -> dict[str, torch.Tensor]:
-        record = self.records[idx]
-        codes = self.all_codes[idx]
-
-        tokenized = self.tokenizer(
-            record["text"],
-            truncation=True,
-            max_length=self.max_text_length,
-            padding="max_length",
-            return_tensors="pt",
-        )
+    @property
+    def lengths(self) -> np.ndarray | None:
+        """Per-record token counts when pre-tokenized (for length bucketing)."""
+        return self.tokenized_corpus.lengths if self.tokenized_corpus is not None else None
+
+    def codes(self, idx: int) -> torch.Tensor:
+        """Code indices of record ``idx`` without tokenizing its text."""
+        return self.all_codes[idx]
 
+    def __getitem__(self, idx: int) -> dict[str, torch.Tensor]:
         return {
-            "code_indices": codes,
-            "input_ids": tokenized["input_ids"].squeeze(0),
-            "attention_mask": tokenized["attention_mask"].squeeze(0),
+            "code_indices": self.codes(idx),
+            **tokenize_record(
+                self.records[idx]["text"],
+                idx,
+                self.tokenizer,
+                self.tokenized_corpus,
+                max_text_length=self.max_text_length,
+            ),
         }
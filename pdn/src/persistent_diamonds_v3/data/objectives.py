@@ -1,15 +1,46 @@
 from __future__ import annotations
 
+import copy
 import hashlib
 import json
 import shutil
+import warnings
+import zipfile
+from collections.abc import Iterator, Mapping
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import asdict, dataclass
 from pathlib import Path
 from typing import Literal
 
 import numpy as np
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import DataLoader, Dataset, IterableDataset, Sampler, get_worker_info
+from tqdm.auto import tqdm
+
+from persistent_diamonds_v3.data.chunked_store import (
+    is_chunked_store,
+    open_chunked_arrays,
+    write_chunked_arrays,
+)
+from persistent_diamonds_v3.data.prefetch import loader_options
+
+# Each block of this many sequences draws from its own spawned seed stream,
+# so generated data does not depend on how the work is sharded.
+SEQUENCES_PER_STREAM = 64
+# Bumped when generated content changes for an unchanged request.
+GENERATOR_VERSION = 2
+# Spawn-key prefix for streamed batches, far above the store's stream
+# children so streamed and materialized sequences never share a seed.
+STREAMING_SPAWN_KEY = 2**31
+
+ARRAY_NAMES = ("observations", "targets", "external_drive", "task_signal")
+# Compact stores may omit these: targets are observations shifted by one
+# step, and a missing drive/task signal means all zeros.
+DERIVABLE_ARRAYS = ("targets", "external_drive", "task_signal")
+# "npz": one compressed archive.  "npy": a directory of uncompressed
+# per-array ``.npy`` files that are memory-mapped on load.  "chunked":
+# per-chunk compressed arrays with random access (see ``chunked_store``).
+STORAGE_FORMATS = ("npz", "npy", "chunked")
 
 ObjectiveName = Literal[
     "persistence",
@@ -38,37 +69,408 @@ class ObjectiveMaterialization:
     reused: bool
 
 
+def shift_targets(observations):
+    """Next-step targets ``[..., T, D]``: observations advanced one step, last step repeated."""
+    if isinstance(observations, torch.Tensor):
+        return torch.cat((observations[..., 1:, :], observations[..., -1:, :]), dim=-2)
+    return np.concatenate((observations[..., 1:, :], observations[..., -1:, :]), axis=-2)
+
+
+class ShiftedTargets:
+    """Array-like ``targets`` derived on access from stored observations."""
+
+    def __init__(self, observations):
+        self.observations = observations
+        self.shape = tuple(observations.shape)
+        self.dtype = observations.dtype
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, idx) -> np.ndarray:
+        rows = np.asarray(self.observations[idx])
+        if rows.ndim < 2:
+            raise IndexError("ShiftedTargets only supports indexing along the sequence axis.")
+        return shift_targets(rows)
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        out = self[:]
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+
+def load_objective_arrays(path: str | Path, *, derive: bool = True) -> Mapping[str, np.ndarray]:
+    """Open an objective dataset: a ``.npz`` archive, ``.npy`` or chunked directory.
+
+    ``.npy`` directories are memory-mapped read-only and chunked stores
+    decompress only the chunks that are indexed, so neither is read up
+    front; ``.npz`` arrays are decompressed whole on access.
+
+    Arrays omitted by a compact store are filled in when ``derive`` is set:
+    ``targets`` as :class:`ShiftedTargets` and zero signals as broadcast
+    views, so none of them allocates a full ``[N, T, D]`` array.
+    """
+    path = Path(path)
+    if is_chunked_store(path):
+        arrays: Mapping[str, np.ndarray] = open_chunked_arrays(path)
+    elif path.is_dir():
+        arrays = {
+            name: np.load(path / f"{name}.npy", mmap_mode="r")
+            for name in ARRAY_NAMES
+            if (path / f"{name}.npy").exists()
+        }
+    else:
+        arrays = np.load(path)
+
+    if not derive or all(name in arrays for name in ARRAY_NAMES):
+        return arrays
+    arrays = {name: arrays[name] for name in ARRAY_NAMES if name in arrays}
+    observations = arrays["observations"]
+    if "targets" not in arrays:
+        arrays["targets"] = ShiftedTargets(observations)
+    zero = np.zeros((), dtype=np.float32)
+    arrays.setdefault("external_drive", np.broadcast_to(zero, observations.shape))
+    arrays.setdefault("task_signal", np.broadcast_to(zero, (*observations.shape[:-1], 1)))
+    return arrays
+
+
+def convert_npz_to_npy(npz_path: str | Path, out_dir: str | Path) -> Path:
+    """Rewrite a ``.npz`` objective dataset as an ``.npy`` directory.
+
+    Arrays are converted one at a time into a temporary directory that is
+    renamed into place last, so an interrupted conversion leaves no
+    partial ``out_dir``.
+    """
+    out_dir = Path(out_dir)
+    tmp_dir = out_dir.with_name(out_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+    with np.load(npz_path) as payload:
+        for name in payload.files:
+            np.save(tmp_dir / f"{name}.npy", payload[name])
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    tmp_dir.rename(out_dir)
+    return out_dir
+
+
+def _as_tensor(array: np.ndarray) -> torch.Tensor:
+    # Read-only memmaps are shared as-is; torch warns they are not writable.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.from_numpy(array)
+
+
 class ObjectiveTensorDataset(Dataset):
-    """Torch dataset backed by cached `.npz` objective files."""
+    """Torch dataset backed by cached objective files.
+
+    Accepts a ``.npz`` archive (decompressed into memory) or an ``.npy``
+    directory, whose arrays are wrapped as zero-copy tensors over read-only
+    memory maps.  DataLoader workers reopen the maps instead of receiving
+    pickled copies, so they share pages through the OS cache.  Chunked
+    stores stay compressed; each item decompresses only its own chunk.
+
+    Arrays missing from compact stores are derived per item: ``targets``
+    from the observations, zero signals as expanded (unallocated) tensors.
+    Their attributes are ``None``.
+
+    Indexing with a slice or an index array returns a whole batch
+    (``[B, T, ...]`` tensors, see :class:`ObjectiveBatchSampler`): slices
+    are views of the stored tensors (copies inside DataLoader workers),
+    index arrays one ``index_select`` gather per array, so no per-item
+    dicts or collate copies are made.
+    A ``(rows, steps)`` tuple further restricts the batch to the time
+    window ``steps`` (see :class:`SequenceChunkSampler`); derived targets
+    then reach one step past the window, and the batch carries the
+    window's start as ``"chunk_start"``.
+    """
 
     def __init__(self, npz_path: str | Path):
-        payload = np.load(npz_path)
-        self.observations = torch.from_numpy(payload["observations"])
-        self.targets = torch.from_numpy(payload["targets"])
-        self.external_drive = torch.from_numpy(payload["external_drive"])
-        self.task_signal = torch.from_numpy(payload["task_signal"])
+        self.path = Path(npz_path)
+        self._open()
+
+    def _open(self) -> None:
+        payload = load_objective_arrays(self.path, derive=False)
+        self.chunked = is_chunked_store(self.path)
+        wrap = (lambda array: array) if self.chunked else _as_tensor
+        self.observations = wrap(payload["observations"])
+        for name in DERIVABLE_ARRAYS:
+            setattr(self, name, wrap(payload[name]) if name in payload else None)
 
     def __len__(self) -> int:
         return int(self.observations.shape[0])
 
-    def __getitem__(self, idx: int) -> dict[str, torch.Tensor]:
-        return {
-            "observations": self.observations[idx],
-            "targets": self.targets[idx],
-            "external_drive": self.external_drive[idx],
-            "task_signal": self.task_signal[idx],
-        }
+    @property
+    def sequence_length(self) -> int:
+        return int(self.observations.shape[1])
+
+    def __getitem__(self, idx) -> dict[str, torch.Tensor]:
+        rows, steps = idx if isinstance(idx, tuple) else (idx, slice(None))
+        take = self._take(rows, steps)
+        observations = take(self.observations)
+        item = {"observations": observations}
+        for name in DERIVABLE_ARRAYS:
+            array = getattr(self, name)
+            if array is not None:
+                item[name] = take(array)
+            elif name == "targets" and steps.stop is not None and steps.stop < self.sequence_length:
+                # The window's last target is the first observation after it.
+                following = self._take(rows, slice(steps.stop, steps.stop + 1))(self.observations)
+                item[name] = torch.cat((observations[..., 1:, :], following), dim=-2)
+            else:
+                item[name] = self._derive(name, observations)
+        if isinstance(idx, tuple):
+            item["chunk_start"] = steps.start or 0
+        return item
+
+    def _take(self, rows: int | slice | np.ndarray, steps: slice):
+        if self.chunked:
+            # Single rows are views into a cached chunk; batches are fresh arrays.
+            if isinstance(rows, (int, np.integer)):
+                return lambda array: torch.from_numpy(np.array(array[rows][..., steps, :]))
+            return lambda array: torch.from_numpy(array[rows][..., steps, :])
+        if isinstance(rows, np.ndarray):
+            index = torch.from_numpy(rows.astype(np.int64, copy=False))
+            return lambda tensor: tensor[..., steps, :].index_select(0, index)
+        if get_worker_info() is not None:
+            # Worker batches are pickled with their whole storage, so a view
+            # would ship (and copy into shared memory) the entire dataset.
+            return lambda tensor: tensor[rows][..., steps, :].clone()
+        return lambda tensor: tensor[rows][..., steps, :]
+
+    @staticmethod
+    def _derive(name: str, observations: torch.Tensor) -> torch.Tensor:
+        if name == "targets":
+            return shift_targets(observations)
+        zero = observations.new_zeros(())
+        if name == "task_signal":
+            return zero.expand(*observations.shape[:-1], 1)
+        return zero.expand_as(observations)
+
+    def __getstate__(self) -> dict[str, object]:
+        if self.path.is_dir():
+            return {"path": self.path}
+        return dict(self.__dict__)
+
+    def __setstate__(self, state: dict[str, object]) -> None:
+        self.__dict__.update(state)
+        if "observations" not in state:
+            self._open()
+
+
+class StreamingObjectiveDataset(IterableDataset):
+    """Unbounded objective data generated on the fly, never materialized.
+
+    Yields whole batches (``[batch_size, T, ...]`` tensors), so wrap it with
+    ``DataLoader(batch_size=None)``; :func:`objective_loader` does this.
+    Batch ``step`` is seeded from ``(request.seed, step)`` alone, and
+    DataLoader worker ``w`` of ``W`` produces steps ``w, w + W, ...``, which
+    the loader interleaves back into step order.  The stream is therefore
+    identical for any worker count, and ``start_step`` resumes it exactly.
+    """
+
+    def __init__(self, request: ObjectiveRequest, *, batch_size: int, start_step: int = 0):
+        if request.source_path:
+            raise ValueError("Streaming generates data; source_path requests must be materialized.")
+        self.request = request
+        self.batch_size = batch_size
+        self.start_step = start_step
+        self._basis = IQTObjectiveDataStore._shared_basis(request)
+
+    def resumed(self, start_step: int) -> StreamingObjectiveDataset:
+        """This stream restarted at batch ``start_step``."""
+        stream = copy.copy(self)
+        stream.start_step = start_step
+        return stream
+
+    def batch(self, step: int) -> dict[str, torch.Tensor]:
+        seq = np.random.SeedSequence(self.request.seed, spawn_key=(STREAMING_SPAWN_KEY, step))
+        arrays = IQTObjectiveDataStore._generate_stream(
+            self.request, np.random.default_rng(seq), self.batch_size, self._basis
+        )
+        return {name: torch.from_numpy(arrays[name]) for name in ARRAY_NAMES}
+
+    def __iter__(self):
+        worker = get_worker_info()
+        step = self.start_step + (worker.id if worker is not None else 0)
+        stride = worker.num_workers if worker is not None else 1
+        while True:
+            yield self.batch(step)
+            step += stride
+
+
+class ObjectiveBatchSampler(Sampler):
+    """Yield whole-batch keys for :class:`ObjectiveTensorDataset`.
+
+    Unshuffled batches are ``slice(start, stop)`` ranges, so the dataset
+    returns views; shuffled batches are sorted index arrays from a
+    per-epoch permutation (sorted for locality in memory maps and chunks).
+    """
+
+    def __init__(
+        self,
+        num_items: int,
+        batch_size: int,
+        *,
+        shuffle: bool = False,
+        drop_last: bool = False,
+        seed: int = 0,
+    ):
+        self.num_items = num_items
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self) -> int:
+        n = self.num_items
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def __iter__(self) -> Iterator[slice | np.ndarray]:
+        order = None
+        if self.shuffle:
+            order = np.random.default_rng(self.seed + self.epoch).permutation(self.num_items)
+        self.epoch += 1
+        for start in range(0, len(self) * self.batch_size, self.batch_size):
+            stop = min(start + self.batch_size, self.num_items)
+            yield slice(start, stop) if order is None else np.sort(order[start:stop])
+
+
+class SequenceChunkSampler(Sampler):
+    """Yield ``(rows, steps)`` keys that walk long sequences in time chunks.
+
+    Each epoch deals sequences to ``batch_size`` streams (in a fresh random
+    order when ``shuffle``); row ``b`` of every batch is stream ``b``.  All
+    streams advance ``chunk_length`` steps per batch, so they start new
+    sequences together, at batches whose window starts at step 0, and the
+    batch size never changes.  Sequences beyond the last full set of
+    ``batch_size`` are left out of that epoch.
+    """
+
+    def __init__(
+        self,
+        num_sequences: int,
+        sequence_length: int,
+        batch_size: int,
+        chunk_length: int,
+        *,
+        shuffle: bool = False,
+        seed: int = 0,
+    ):
+        if num_sequences < batch_size:
+            raise ValueError(
+                f"Need at least batch_size={batch_size} sequences to fill every stream, got {num_sequences}."
+            )
+        if chunk_length < 1:
+            raise ValueError(f"chunk_length must be >= 1, got {chunk_length}.")
+        self.num_sequences = num_sequences
+        self.sequence_length = sequence_length
+        self.batch_size = batch_size
+        self.chunk_length = chunk_length
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self) -> int:
+        chunks = -(-self.sequence_length // self.chunk_length)
+        return (self.num_sequences // self.batch_size) * chunks
+
+    def __iter__(self) -> Iterator[tuple[np.ndarray, slice]]:
+        if self.shuffle:
+            order = np.random.default_rng(self.seed + self.epoch).permutation(self.num_sequences)
+        else:
+            order = np.arange(self.num_sequences)
+        self.epoch += 1
+        for start in range(0, self.num_sequences - self.batch_size + 1, self.batch_size):
+            rows = order[start : start + self.batch_size]
+            for t in range(0, self.sequence_length, self.chunk_length):
+                yield rows, slice(t, min(t + self.chunk_length, self.sequence_length))
+
+
+def objective_loader(
+    dataset: Dataset | StreamingObjectiveDataset,
+    *,
+    batch_size: int,
+    shuffle: bool,
+    num_workers: int = 0,
+    prefetch_factor: int | None = None,
+    persistent_workers: bool = False,
+    pin_memory: bool = False,
+    chunk_length: int | None = None,
+    start_step: int = 0,
+) -> DataLoader:
+    """DataLoader for a materialized or streaming objective dataset.
+
+    ``prefetch_factor`` and ``persistent_workers`` only apply with
+    ``num_workers > 0``; see :func:`loader_options`.  ``chunk_length``
+    batches consecutive time windows per stream via
+    :class:`SequenceChunkSampler` (materialized datasets only).
+    ``start_step`` resumes a streaming dataset at that batch.
+    """
+    options = loader_options(
+        num_workers,
+        prefetch_factor=prefetch_factor,
+        persistent_workers=persistent_workers,
+        pin_memory=pin_memory,
+    )
+    if isinstance(dataset, StreamingObjectiveDataset):
+        if dataset.batch_size != batch_size:
+            raise ValueError(
+                f"Streaming dataset yields batches of {dataset.batch_size}, trainer expects {batch_size}."
+            )
+        if chunk_length:
+            raise ValueError("chunk_length needs a materialized ObjectiveTensorDataset, not a stream.")
+        if start_step:
+            dataset = dataset.resumed(start_step)
+        return DataLoader(dataset, batch_size=None, **options)
+    if start_step:
+        raise ValueError("start_step resumes streaming datasets only; materialized data restarts by epoch.")
+    if chunk_length:
+        if not isinstance(dataset, ObjectiveTensorDataset):
+            raise ValueError("chunk_length needs a materialized ObjectiveTensorDataset.")
+        sampler = SequenceChunkSampler(
+            len(dataset), dataset.sequence_length, batch_size, chunk_length, shuffle=shuffle
+        )
+        return DataLoader(dataset, sampler=sampler, batch_size=None, **options)
+    if isinstance(dataset, ObjectiveTensorDataset):
+        # The dataset assembles each batch itself; batch_size=None skips collation.
+        sampler = ObjectiveBatchSampler(len(dataset), batch_size, shuffle=shuffle)
+        return DataLoader(dataset, sampler=sampler, batch_size=None, **options)
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, drop_last=False, **options)
 
 
 class IQTObjectiveDataStore:
     """Caches objective data so runs can reuse exact datasets or generate them on demand."""
 
     DATA_FILENAME = "data.npz"
+    DATA_DIRNAME = "data"
+    CHUNKED_DIRNAME = "chunks"
     MANIFEST_FILENAME = "manifest.json"
 
-    def __init__(self, cache_dir: str | Path):
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        *,
+        workers: int = 1,
+        shard_size: int = 256,
+        storage_format: str = "npz",
+        chunk_rows: int = 16,
+        chunk_codec: str = "zlib",
+        compact: bool = True,
+        memory_limit_mb: int = 512,
+    ):
+        if storage_format not in STORAGE_FORMATS:
+            raise ValueError(f"storage_format must be one of {STORAGE_FORMATS}, got {storage_format!r}")
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.shard_size = shard_size
+        self.storage_format = storage_format
+        self.chunk_rows = chunk_rows
+        self.chunk_codec = chunk_codec
+        self.compact = compact
+        self.memory_limit_mb = memory_limit_mb
 
     def materialize(
         self,
@@ -76,12 +478,32 @@ class IQTObjectiveDataStore:
         *,
         force_generate: bool = False,
     ) -> ObjectiveMaterialization:
+        """Return the cached dataset for ``request``, generating it if needed.
+
+        Generation is split into shards of ``shard_size`` sequences, run on
+        ``workers`` processes.  Output depends only on the request, never on
+        the worker count or shard size.
+
+        With ``storage_format`` ``"npy"`` or ``"chunked"``, an existing
+        ``.npz`` cache for the same request is converted in place rather
+        than regenerated.
+
+        With ``compact`` only irreducible arrays are written: ``targets``
+        (observations shifted one step) never, and the all-zero drive and
+        task signal of ``.npy`` sources neither; see ``DERIVABLE_ARRAYS``.
+        """
         run_key = self._request_key(request)
         target_dir = self.cache_dir / f"{request.objective}-{run_key}"
-        dataset_path = target_dir / self.DATA_FILENAME
+        npz_path = target_dir / self.DATA_FILENAME
+        dataset_path = target_dir / {
+            "npz": self.DATA_FILENAME,
+            "npy": self.DATA_DIRNAME,
+            "chunked": self.CHUNKED_DIRNAME,
+        }[self.storage_format]
         manifest_path = target_dir / self.MANIFEST_FILENAME
 
-        if dataset_path.exists() and manifest_path.exists() and not force_generate:
+        reused = dataset_path.exists() and manifest_path.exists() and not force_generate
+        if reused:
             return ObjectiveMaterialization(
                 request=request,
                 dataset_path=dataset_path,
@@ -91,15 +513,32 @@ class IQTObjectiveDataStore:
 
         target_dir.mkdir(parents=True, exist_ok=True)
 
-        if request.source_path:
+        convertible = npz_path.exists() and manifest_path.exists() and not force_generate
+        if self.storage_format != "npz" and convertible:
+            self._convert_npz(npz_path, dataset_path)
+            npz_path.unlink()
+            reused = True
+        elif request.source_path:
             self._materialize_from_source(request, dataset_path)
         else:
-            arrays = self._generate_objective_arrays(request)
-            np.savez_compressed(dataset_path, **arrays)
+            scratch_dir = target_dir / "generate.tmp"
+            arrays = self._generate_objective_arrays(request, scratch_dir)
+            if self.storage_format == "npy":
+                del arrays
+                if dataset_path.exists():
+                    shutil.rmtree(dataset_path)
+                scratch_dir.rename(dataset_path)
+            else:
+                self._write_arrays(arrays, dataset_path)
+                del arrays
+                shutil.rmtree(scratch_dir)
 
         manifest = {
             "request": asdict(request),
             "dataset": str(dataset_path),
+            "storage_format": self.storage_format,
+            "compact": self.compact,
+            "stored_arrays": self._stored_names(dataset_path),
             "dataset_sha256": self._sha256(dataset_path),
         }
         manifest_path.write_text(json.dumps(manifest, indent=2))
@@ -108,78 +547,237 @@ class IQTObjectiveDataStore:
             request=request,
             dataset_path=dataset_path,
             manifest_path=manifest_path,
-            reused=False,
+            reused=reused,
         )
 
     def list_cached(self) -> list[Path]:
-        return sorted(self.cache_dir.glob(f"*/{self.DATA_FILENAME}"))
+        dirs = [
+            p
+            for name in (self.DATA_DIRNAME, self.CHUNKED_DIRNAME)
+            for p in self.cache_dir.glob(f"*/{name}")
+            if p.is_dir()
+        ]
+        return sorted([*self.cache_dir.glob(f"*/{self.DATA_FILENAME}"), *dirs])
 
     @staticmethod
     def _request_key(request: ObjectiveRequest) -> str:
-        raw = json.dumps(asdict(request), sort_keys=True).encode("utf-8")
+        payload = asdict(request)
+        if not request.source_path:
+            payload["generator_version"] = GENERATOR_VERSION
+        raw = json.dumps(payload, sort_keys=True).encode("utf-8")
         return hashlib.sha256(raw).hexdigest()[:16]
 
     @staticmethod
     def _sha256(path: Path) -> str:
         digest = hashlib.sha256()
-        with path.open("rb") as f:
-            for chunk in iter(lambda: f.read(1024 * 1024), b""):
-                digest.update(chunk)
+        files = sorted(p for p in path.iterdir() if p.is_file()) if path.is_dir() else [path]
+        for file in files:
+            if path.is_dir():
+                digest.update(file.name.encode())
+            with file.open("rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
         return digest.hexdigest()
 
+    @staticmethod
+    def _stored_names(dataset_path: Path) -> list[str]:
+        return [name for name in ARRAY_NAMES if name in load_objective_arrays(dataset_path, derive=False)]
+
+    def _convert_npz(self, npz_path: Path, destination: Path) -> None:
+        if self.storage_format == "npy":
+            convert_npz_to_npy(npz_path, destination)
+            return
+        # Unpack one array at a time, then stream the memmaps.
+        scratch_dir = destination.with_name(destination.name + ".npy.tmp")
+        convert_npz_to_npy(npz_path, scratch_dir)
+        self._write_arrays(dict(load_objective_arrays(scratch_dir, derive=False)), destination)
+        shutil.rmtree(scratch_dir)
+
+    def _rows_per_chunk(self, arrays: Mapping[str, np.ndarray]) -> int:
+        # A chunk holds the source rows, their float32 copy and (for
+        # derived targets) one shifted temporary.
+        row_bytes = max(
+            3 * int(np.prod(array.shape[1:])) * max(np.dtype(array.dtype).itemsize, 4)
+            for array in arrays.values()
+        )
+        return max(1, self.memory_limit_mb * 2**20 // row_bytes)
+
+    def _write_arrays(self, arrays: Mapping[str, np.ndarray], destination: Path) -> None:
+        """Write float32 ``arrays`` in the store format, streaming row chunks.
+
+        Inputs may be memmaps or lazy views (``ShiftedTargets``, broadcast
+        zeros); they are read ``_rows_per_chunk`` rows at a time so peak
+        memory stays under ``memory_limit_mb`` regardless of dataset size.
+        """
+        rows = self._rows_per_chunk(arrays)
+        total = sum(int(array.shape[0]) for array in arrays.values())
+        with tqdm(total=total, desc=f"write {destination.name}", unit="seq", disable=None) as bar:
+            if self.storage_format == "chunked":
+                write_chunked_arrays(
+                    arrays,
+                    destination,
+                    chunk_rows=self.chunk_rows,
+                    codec=self.chunk_codec,
+                    dtype=np.float32,
+                    progress=bar.update,
+                )
+                return
+
+            if self.storage_format == "npz":
+                # Same layout as np.savez_compressed, with members streamed.
+                with zipfile.ZipFile(
+                    destination, mode="w", compression=zipfile.ZIP_DEFLATED, allowZip64=True
+                ) as zf:
+                    for name, array in arrays.items():
+                        with zf.open(f"{name}.npy", mode="w", force_zip64=True) as f:
+                            header = {
+                                "descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+                                "fortran_order": False,
+                                "shape": tuple(array.shape),
+                            }
+                            np.lib.format.write_array_header_1_0(f, header)
+                            for start in range(0, array.shape[0], rows):
+                                chunk = np.ascontiguousarray(array[start : start + rows], dtype=np.float32)
+                                f.write(chunk.tobytes())
+                                bar.update(chunk.shape[0])
+                return
+
+            destination.mkdir(parents=True, exist_ok=True)
+            for name, array in arrays.items():
+                out = np.lib.format.open_memmap(
+                    destination / f"{name}.npy", mode="w+", dtype=np.float32, shape=tuple(array.shape)
+                )
+                for start in range(0, array.shape[0], rows):
+                    out[start : start + rows] = array[start : start + rows]
+                    bar.update(min(rows, array.shape[0] - start))
+                out.flush()
+                del out
+
     def _materialize_from_source(self, request: ObjectiveRequest, destination: Path) -> None:
         source = Path(request.source_path or "")
         if not source.exists():
             raise FileNotFoundError(f"Source path not found: {source}")
 
         if source.suffix == ".npz":
-            shutil.copy2(source, destination)
+            if self.storage_format == "npz":
+                shutil.copy2(source, destination)
+            else:
+                self._convert_npz(source, destination)
             return
 
         if source.suffix == ".npy":
-            observations = np.load(source)
+            # Memory-mapped and written in row chunks, so sources larger
+            # than RAM ingest within ``memory_limit_mb``.
+            observations = np.load(source, mmap_mode="r")
             if observations.ndim != 3:
                 raise ValueError("Expected source `.npy` to have shape [N, T, D].")
-            arrays = self._build_targets_from_observations(observations)
-            np.savez_compressed(destination, **arrays)
+            arrays: dict[str, np.ndarray] = {"observations": observations}
+            if not self.compact:
+                zero = np.zeros((), dtype=np.float32)
+                arrays["targets"] = ShiftedTargets(observations)
+                arrays["external_drive"] = np.broadcast_to(zero, observations.shape)
+                arrays["task_signal"] = np.broadcast_to(zero, (*observations.shape[:-1], 1))
+            self._write_arrays(arrays, destination)
             return
 
         raise ValueError(
             "Unsupported source format. Use `.npz` for reusable full payloads or `.npy` [N,T,D] arrays."
         )
 
-    def _generate_objective_arrays(self, request: ObjectiveRequest) -> dict[str, np.ndarray]:
-        rng = np.random.default_rng(request.seed)
+    def _generate_objective_arrays(
+        self,
+        request: ObjectiveRequest,
+        scratch_dir: Path,
+    ) -> dict[str, np.ndarray]:
+        """Generate ``request`` into ``.npy`` files under ``scratch_dir``.
+
+        Shards write their rows straight into shared memory-mapped arrays,
+        so worker output is never pickled back; the returned arrays are
+        read-only memmaps over those files.  Compact stores skip ``targets``.
+        """
         n = request.num_sequences
         t = request.sequence_length
         d = request.feature_dim
+        stream_count = -(-n // SEQUENCES_PER_STREAM)
+        # Child 0 seeds dataset-wide parameters; child i + 1 seeds sequences
+        # [i * SEQUENCES_PER_STREAM, (i + 1) * SEQUENCES_PER_STREAM).
+        stream_seqs = np.random.SeedSequence(request.seed).spawn(1 + stream_count)[1:]
+        basis = self._shared_basis(request)
+
+        scratch_dir.mkdir(parents=True, exist_ok=True)
+        shapes = {
+            "observations": (n, t, d),
+            "targets": (n, t, d),
+            "external_drive": (n, t, d),
+            "task_signal": (n, t, 1),
+        }
+        if self.compact:
+            del shapes["targets"]
+        for key, shape in shapes.items():
+            np.lib.format.open_memmap(scratch_dir / f"{key}.npy", mode="w+", dtype=np.float32, shape=shape)
+
+        streams_per_shard = max(1, -(-self.shard_size // SEQUENCES_PER_STREAM))
+        tasks = []
+        for first in range(0, stream_count, streams_per_shard):
+            seqs = stream_seqs[first : first + streams_per_shard]
+            start = first * SEQUENCES_PER_STREAM
+            count = min(n, start + len(seqs) * SEQUENCES_PER_STREAM) - start
+            tasks.append((request, scratch_dir, start, count, seqs, basis))
+
+        if self.workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                list(pool.map(_generate_objective_shard, *zip(*tasks)))
+        else:
+            for task in tasks:
+                _generate_objective_shard(*task)
+
+        return {key: np.load(scratch_dir / f"{key}.npy", mmap_mode="r") for key in shapes}
+
+    @staticmethod
+    def _shared_basis(request: ObjectiveRequest) -> np.ndarray | None:
+        """Dataset-wide compression basis, drawn from seed child 0."""
+        if request.objective != "compression":
+            return None
+        d = request.feature_dim
+        shared_rng = np.random.default_rng(np.random.SeedSequence(request.seed).spawn(1)[0])
+        return shared_rng.standard_normal(size=(d, max(8, d // 8)), dtype=np.float32)
+
+    @classmethod
+    def _generate_stream(
+        cls,
+        request: ObjectiveRequest,
+        rng: np.random.Generator,
+        n: int,
+        basis: np.ndarray | None,
+    ) -> dict[str, np.ndarray]:
+        t = request.sequence_length
+        d = request.feature_dim
 
-        observations = self._multi_timescale_latents(rng, n=n, t=t, d=d)
-        external_drive = rng.normal(0.0, 0.5, size=(n, t, d)).astype(np.float32)
+        observations = cls._multi_timescale_latents(rng, n=n, t=t, d=d)
+        external_drive = rng.standard_normal(size=(n, t, d), dtype=np.float32)
+        external_drive *= np.float32(0.5)
 
         if request.objective in {"autonomy", "mixed"}:
             # Keep internal dynamics dominant but still grounded in external signal.
             observations = (0.75 * observations + 0.25 * external_drive).astype(np.float32)
         elif request.objective == "compression":
-            observations = self._low_rank_compressible_view(observations, rank=max(8, d // 8), rng=rng)
+            observations = cls._low_rank_compressible_view(observations, basis=basis)
         elif request.objective == "self_prediction":
-            observations = self._add_self_predictive_loops(observations)
+            observations = cls._add_self_predictive_loops(observations)
 
-        arrays = self._build_targets_from_observations(observations)
+        arrays = cls._build_targets_from_observations(observations)
         arrays["external_drive"] = external_drive
 
         if request.objective in {"autonomy", "mixed"}:
-            arrays["task_signal"] = self._task_signal_from_observation(observations, external_drive)
+            arrays["task_signal"] = cls._task_signal_from_observation(observations, external_drive)
         else:
-            arrays["task_signal"] = self._task_signal_from_observation(observations, 0.5 * external_drive)
+            arrays["task_signal"] = cls._task_signal_from_observation(observations, 0.5 * external_drive)
 
         return arrays
 
     @staticmethod
     def _build_targets_from_observations(observations: np.ndarray) -> dict[str, np.ndarray]:
-        targets = np.zeros_like(observations)
-        targets[:, :-1] = observations[:, 1:]
-        targets[:, -1] = observations[:, -1]
+        targets = shift_targets(observations)
         return {
             "observations": observations.astype(np.float32),
             "targets": targets.astype(np.float32),
@@ -194,17 +792,47 @@ class IQTObjectiveDataStore:
         n: int,
         t: int,
         d: int,
+        block_size: int = 32,
     ) -> np.ndarray:
-        x = np.zeros((n, t, d), dtype=np.float32)
-        slow = rng.normal(0.0, 0.15, size=(n, d)).astype(np.float32)
-        mid = rng.normal(0.0, 0.15, size=(n, d)).astype(np.float32)
-        fast = rng.normal(0.0, 0.15, size=(n, d)).astype(np.float32)
-
-        for step in range(t):
-            slow = 0.995 * slow + rng.normal(0.0, 0.01, size=(n, d)).astype(np.float32)
-            mid = 0.97 * mid + rng.normal(0.0, 0.04, size=(n, d)).astype(np.float32)
-            fast = 0.85 * fast + rng.normal(0.0, 0.12, size=(n, d)).astype(np.float32)
-            x[:, step] = slow + mid + fast
+        """Sum of slow/mid/fast AR(1) processes, ``x = a * x + noise``.
+
+        Each block of ``block_size`` steps is solved in closed form rather
+        than stepped: with ``s`` the per-process state entering the block,
+        step ``j`` of the summed output is
+        ``sum_p a_p**(j+1) * s_p + sum_{i<=j} a_p**(j-i) * noise_{i,p}``,
+        i.e. one ``[L, 3L] @ [3L, n*d]`` matmul against a lower-triangular
+        kernel of decay powers plus a rank-3 carry term.  The noise stream is
+        the same as stepping the recurrence, so outputs agree to rounding.
+        """
+        x = np.empty((n, t, d), dtype=np.float32)
+        state = rng.standard_normal(size=(3, n * d), dtype=np.float32)
+        state *= np.float32(0.15)
+
+        decay = np.array([0.995, 0.97, 0.85], dtype=np.float32)
+        noise_scale = np.array([0.01, 0.04, 0.12], dtype=np.float32)
+
+        steps = np.arange(block_size)
+        lags = steps[:, None] - steps[None, :]
+        # kernel[j, i, p] = scale_p * a_p**(j - i) for i <= j, else 0.
+        kernel = np.where(
+            (lags >= 0)[..., None],
+            decay ** np.maximum(lags, 0)[..., None] * noise_scale,
+            0.0,
+        ).astype(np.float32)
+        # carry[j, p] = a_p**(j + 1): decay of the incoming state.
+        carry = (decay ** (steps[:, None] + 1)).astype(np.float32)
+
+        for start in range(0, t, block_size):
+            length = min(block_size, t - start)
+            noise = rng.standard_normal(size=(length, 3, n * d), dtype=np.float32)
+            block_kernel = kernel[:length, :length]
+            block = block_kernel.reshape(length, 3 * length) @ noise.reshape(3 * length, n * d)
+            block += carry[:length] @ state
+            # Per-process state after the block's last step.
+            state = carry[length - 1, :, None] * state + np.einsum(
+                "ip,ipm->pm", block_kernel[-1], noise
+            )
+            x[:, start : start + length] = block.reshape(length, n, d).transpose(1, 0, 2)
 
         return x
 
@@ -212,11 +840,9 @@ class IQTObjectiveDataStore:
     def _low_rank_compressible_view(
         observations: np.ndarray,
         *,
-        rank: int,
-        rng: np.random.Generator,
+        basis: np.ndarray,
     ) -> np.ndarray:
-        d = observations.shape[-1]
-        basis = rng.normal(0.0, 1.0, size=(d, rank)).astype(np.float32)
+        rank = basis.shape[1]
         coeffs = observations @ basis
         recon = coeffs @ basis.T
         return recon / np.sqrt(rank)
@@ -235,3 +861,25 @@ class IQTObjectiveDataStore:
         corr = (observations * external_drive).mean(axis=-1, keepdims=True)
         norm = np.tanh(corr)
         return norm.astype(np.float32)
+
+
+def _generate_objective_shard(
+    request: ObjectiveRequest,
+    scratch_dir: Path,
+    start: int,
+    count: int,
+    stream_seqs: list[np.random.SeedSequence],
+    basis: np.ndarray | None,
+) -> None:
+    """Fill rows ``[start, start + count)`` of the scratch arrays (module-level so it pickles)."""
+    outputs = {
+        path.stem: np.load(path, mmap_mode="r+") for path in scratch_dir.glob("*.npy")
+    }
+    for i, seq in enumerate(stream_seqs):
+        row = start + i * SEQUENCES_PER_STREAM
+        n = min(SEQUENCES_PER_STREAM, start + count - row)
+        arrays = IQTObjectiveDataStore._generate_stream(request, np.random.default_rng(seq), n, basis)
+        for key, out in outputs.items():
+            out[row : row + n] = arrays[key]
+    for out in outputs.values():
+        out.flush()
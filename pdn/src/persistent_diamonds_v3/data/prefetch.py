@@ -0,0 +1,158 @@
+"""Background staging of batches onto the training device.
+
+:class:`DevicePrefetcher` pulls batches from a loader on a daemon thread
+and copies them to the device, keeping up to ``depth`` batches ready while
+the current step computes.  On CUDA the copies run on a side stream from
+pinned memory, so they overlap with kernels as well as with host work.
+Time the training loop spends blocked on the next batch is accumulated in
+``wait_seconds``.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+import torch
+
+_END = object()
+
+
+class _Failure:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def _to_device(batch: Any, device: torch.device) -> Any:
+    if isinstance(batch, torch.Tensor):
+        return batch.to(device, non_blocking=True)
+    if isinstance(batch, dict):
+        return {key: _to_device(value, device) for key, value in batch.items()}
+    if isinstance(batch, (list, tuple)):
+        return type(batch)(_to_device(value, device) for value in batch)
+    return batch
+
+
+def _record_stream(batch: Any, stream) -> None:
+    if isinstance(batch, torch.Tensor):
+        batch.record_stream(stream)
+    elif isinstance(batch, dict):
+        for value in batch.values():
+            _record_stream(value, stream)
+    elif isinstance(batch, (list, tuple)):
+        for value in batch:
+            _record_stream(value, stream)
+
+
+class DevicePrefetcher:
+    """Iterate ``loader`` with the next ``depth`` batches already on ``device``.
+
+    ``depth=0`` iterates the loader inline (batches still moved to the
+    device), which keeps ``wait_seconds`` comparable between settings.
+    Each ``iter()`` starts a fresh pass over ``loader``; leaving the loop
+    early stops the staging thread.
+    """
+
+    def __init__(self, loader: Iterable, device: str | torch.device, *, depth: int = 1):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.depth = depth
+        self.wait_seconds = 0.0
+        self.batches = 0
+
+    def __iter__(self) -> Iterator[Any]:
+        if self.depth <= 0:
+            return self._inline()
+        return self._staged()
+
+    def _inline(self) -> Iterator[Any]:
+        it = iter(self.loader)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = _to_device(next(it), self.device)
+            except StopIteration:
+                return
+            finally:
+                self.wait_seconds += time.perf_counter() - start
+            self.batches += 1
+            yield batch
+
+    def _staged(self) -> Iterator[Any]:
+        ready: queue.Queue = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        cuda = self.device.type == "cuda"
+        stream = torch.cuda.Stream(self.device) if cuda else None
+
+        def _put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    ready.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def _stage() -> None:
+            try:
+                for batch in self.loader:
+                    if stop.is_set():
+                        return
+                    if cuda:
+                        with torch.cuda.stream(stream):
+                            batch = _to_device(batch, self.device)
+                            event = torch.cuda.Event()
+                            event.record(stream)
+                    else:
+                        batch, event = _to_device(batch, self.device), None
+                    if not _put((batch, event)):
+                        return
+            except BaseException as exc:  # noqa: BLE001 - re-raised on the training thread
+                _put(_Failure(exc))
+                return
+            _put(_END)
+
+        thread = threading.Thread(target=_stage, name="pdv3-prefetch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                start = time.perf_counter()
+                item = ready.get()
+                self.wait_seconds += time.perf_counter() - start
+                if item is _END:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.exc
+                batch, event = item
+                if event is not None:
+                    current = torch.cuda.current_stream(self.device)
+                    current.wait_event(event)
+                    _record_stream(batch, current)
+                self.batches += 1
+                yield batch
+        finally:
+            stop.set()
+            thread.join()
+
+
+def loader_options(
+    num_workers: int,
+    *,
+    prefetch_factor: int | None = None,
+    persistent_workers: bool = False,
+    pin_memory: bool = False,
+) -> dict[str, Any]:
+    """``DataLoader`` keyword arguments for the worker settings.
+
+    ``DataLoader`` rejects ``prefetch_factor`` and ``persistent_workers``
+    without worker processes, so they are dropped when ``num_workers`` is 0.
+    """
+    options: dict[str, Any] = {"num_workers": num_workers, "pin_memory": pin_memory}
+    if num_workers > 0:
+        options["persistent_workers"] = persistent_workers
+        if prefetch_factor is not None:
+            options["prefetch_factor"] = prefetch_factor
+    return options
@@ -0,0 +1,330 @@
+"""Offline teacher-logit cache for distillation (Stage 3).
+
+Runs the teacher once over the distillation corpus and stores its top-k
+logits (plus optional hidden layers) as memory-mapped ``.npy`` arrays, so
+student runs can train without loading the teacher at all.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from persistent_diamonds_v3.data.tokenized_corpus import DynamicPaddingCollator, TokenizedCorpus
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def teacher_cache_key(
+    corpus_path: str | Path,
+    teacher_name: str,
+    *,
+    top_k: int,
+    max_text_length: int,
+    temperature: float,
+) -> str:
+    """Deterministic hash from corpus contents + teacher identity."""
+    h = hashlib.sha256()
+    h.update(Path(corpus_path).read_bytes())
+    h.update(teacher_name.encode())
+    h.update(f"top_k={top_k};max_text_length={max_text_length};T={temperature}".encode())
+    return h.hexdigest()[:16]
+
+
+def _hidden_name(layer: int) -> str:
+    return f"hidden_{layer}"
+
+
+def _read_manifest(cache_path: Path) -> dict[str, Any] | None:
+    manifest_path = cache_path / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return None
+    return json.loads(manifest_path.read_text())
+
+
+def find_teacher_cache(
+    corpus_path: str | Path,
+    cache_dir: str | Path,
+    teacher_names: Sequence[str],
+    *,
+    top_k: int,
+    max_text_length: int,
+    temperature: float,
+) -> Path | None:
+    """Return the first complete cache for any of ``teacher_names``, if one exists."""
+    for name in teacher_names:
+        key = teacher_cache_key(
+            corpus_path, name, top_k=top_k, max_text_length=max_text_length, temperature=temperature
+        )
+        cache_path = Path(cache_dir) / f"teacher_{key}"
+        if _read_manifest(cache_path) is not None:
+            return cache_path
+    return None
+
+
+def build_teacher_cache(
+    corpus_path: str | Path,
+    teacher_model: torch.nn.Module,
+    tokenizer,
+    cache_dir: str | Path,
+    *,
+    teacher_name: str,
+    top_k: int = 64,
+    hidden_layers: Sequence[int] = (),
+    max_text_length: int = 256,
+    temperature: float = 1.0,
+    batch_size: int = 8,
+    device: str = "cpu",
+    tokenized_corpus: TokenizedCorpus | None = None,
+) -> Path:
+    """Run the teacher over the corpus and persist top-k logits to disk.
+
+    Alongside the top-k, ``logsumexp(logits / temperature)`` is stored per
+    position so the trainer can recover the teacher's tail mass exactly.
+
+    With ``tokenized_corpus`` the teacher runs on length-sorted,
+    dynamically padded batches instead of ``max_text_length`` rows.
+
+    Returns the cache directory.  An existing cache for the same corpus and
+    teacher is reused as long as it already holds every requested hidden
+    layer; the manifest is written last, so interrupted builds are redone.
+    """
+    key = teacher_cache_key(
+        corpus_path,
+        teacher_name,
+        top_k=top_k,
+        max_text_length=max_text_length,
+        temperature=temperature,
+    )
+    cache_path = Path(cache_dir) / f"teacher_{key}"
+    hidden_layers = [int(layer) for layer in hidden_layers]
+
+    manifest = _read_manifest(cache_path)
+    if manifest is not None and set(hidden_layers) <= set(manifest["hidden_layers"]):
+        return cache_path
+    if cache_path.exists():
+        shutil.rmtree(cache_path)
+    cache_path.mkdir(parents=True)
+
+    texts = [
+        json.loads(line)["text"]
+        for line in Path(corpus_path).read_text().splitlines()
+        if line.strip()
+    ]
+    n, length = len(texts), max_text_length
+    if tokenized_corpus is not None and len(tokenized_corpus) != n:
+        raise ValueError(
+            f"Tokenized corpus has {len(tokenized_corpus)} items but corpus has "
+            f"{n} records — cache is stale."
+        )
+
+    input_ids = np.lib.format.open_memmap(
+        cache_path / "input_ids.npy", mode="w+", dtype=np.int64, shape=(n, length)
+    )
+    attention_mask = np.lib.format.open_memmap(
+        cache_path / "attention_mask.npy", mode="w+", dtype=np.int64, shape=(n, length)
+    )
+    topk_logits = np.lib.format.open_memmap(
+        cache_path / "topk_logits.npy", mode="w+", dtype=np.float16, shape=(n, length, top_k)
+    )
+    topk_indices = np.lib.format.open_memmap(
+        cache_path / "topk_indices.npy", mode="w+", dtype=np.int32, shape=(n, length, top_k)
+    )
+    logsumexp = np.lib.format.open_memmap(
+        cache_path / "logsumexp.npy", mode="w+", dtype=np.float32, shape=(n, length)
+    )
+    hidden: dict[int, np.ndarray] = {}
+    hidden_size = int(teacher_model.config.hidden_size)
+    for layer in hidden_layers:
+        hidden[layer] = np.lib.format.open_memmap(
+            cache_path / f"{_hidden_name(layer)}.npy",
+            mode="w+",
+            dtype=np.float16,
+            shape=(n, length, hidden_size),
+        )
+
+    teacher_model = teacher_model.to(device).eval()
+    vocab_size = 0
+
+    # Pre-tokenized rows are visited shortest-first and padded per batch,
+    # so the teacher only runs over each batch's longest report.
+    if tokenized_corpus is not None:
+        order = np.argsort(tokenized_corpus.lengths, kind="stable")
+        collate = DynamicPaddingCollator()
+    else:
+        order = np.arange(n)
+
+    with torch.no_grad():
+        for start in range(0, n, batch_size):
+            rows = order[start : start + batch_size]
+            if tokenized_corpus is not None:
+                tokenized = collate([tokenized_corpus[int(i)] for i in rows])
+            else:
+                tokenized = tokenizer(
+                    [texts[i] for i in rows],
+                    truncation=True,
+                    max_length=max_text_length,
+                    padding="max_length",
+                    return_tensors="pt",
+                )
+            ids = tokenized["input_ids"].to(device)
+            mask = tokenized["attention_mask"].to(device)
+            width = ids.size(1)
+            out = teacher_model(
+                input_ids=ids,
+                attention_mask=mask,
+                output_hidden_states=bool(hidden_layers),
+            )
+            logits = out.logits.float()
+            vocab_size = int(logits.size(-1))
+            values, indices = logits.topk(top_k, dim=-1)
+
+            # Columns past ``width`` stay zero (masked padding).
+            input_ids[rows, :width] = ids.cpu().numpy()
+            attention_mask[rows, :width] = mask.cpu().numpy()
+            topk_logits[rows, :width] = values.cpu().numpy().astype(np.float16)
+            topk_indices[rows, :width] = indices.cpu().numpy().astype(np.int32)
+            logsumexp[rows, :width] = torch.logsumexp(logits / temperature, dim=-1).cpu().numpy()
+            for layer, array in hidden.items():
+                array[rows, :width] = (
+                    out.hidden_states[layer].float().cpu().numpy().astype(np.float16)
+                )
+
+    for array in (input_ids, attention_mask, topk_logits, topk_indices, logsumexp, *hidden.values()):
+        array.flush()
+
+    (cache_path / MANIFEST_FILENAME).write_text(
+        json.dumps(
+            {
+                "cache_key": key,
+                "teacher_model": teacher_name,
+                "num_items": n,
+                "max_text_length": max_text_length,
+                "top_k": top_k,
+                "temperature": temperature,
+                "vocab_size": vocab_size,
+                "hidden_size": hidden_size,
+                "hidden_layers": hidden_layers,
+                "corpus_path": str(corpus_path),
+            },
+            indent=2,
+        )
+    )
+
+    return cache_path
+
+
+class TeacherLogitCache:
+    """Read-only view over a cache written by :func:`build_teacher_cache`.
+
+    Arrays are opened lazily with ``mmap_mode="r"`` so the cache can be
+    shared across DataLoader workers without copying it into memory.
+    """
+
+    def __init__(self, cache_path: str | Path):
+        self.cache_path = Path(cache_path)
+        manifest = _read_manifest(self.cache_path)
+        if manifest is None:
+            raise FileNotFoundError(f"No complete teacher cache at {self.cache_path}")
+        self.manifest = manifest
+        self._arrays: dict[str, np.ndarray] = {}
+
+    @property
+    def teacher_name(self) -> str:
+        return str(self.manifest["teacher_model"])
+
+    @property
+    def temperature(self) -> float:
+        return float(self.manifest["temperature"])
+
+    @property
+    def hidden_size(self) -> int:
+        return int(self.manifest["hidden_size"])
+
+    @property
+    def hidden_layers(self) -> list[int]:
+        return [int(layer) for layer in self.manifest["hidden_layers"]]
+
+    def __len__(self) -> int:
+        return int(self.manifest["num_items"])
+
+    def array(self, name: str) -> np.ndarray:
+        if name not in self._arrays:
+            self._arrays[name] = np.load(self.cache_path / f"{name}.npy", mmap_mode="r")
+        return self._arrays[name]
+
+    def hidden(self, layer: int) -> np.ndarray:
+        if layer not in self.hidden_layers:
+            raise KeyError(f"Hidden layer {layer} not cached (have {self.hidden_layers}).")
+        return self.array(_hidden_name(layer))
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"cache_path": self.cache_path, "manifest": self.manifest}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.cache_path = state["cache_path"]
+        self.manifest = state["manifest"]
+        self._arrays = {}
+
+
+class TeacherCachedDataset(Dataset):
+    """Attach cached teacher targets to a code/text dataset.
+
+    Token ids and attention masks come from the cache so the student sees
+    exactly the sequences the teacher was run on; bases exposing
+    ``codes(idx)`` are never asked to tokenize.  Rows are trimmed to
+    their unpadded length; batch them with ``DynamicPaddingCollator``.
+    """
+
+    def __init__(
+        self,
+        base: Dataset,
+        cache: TeacherLogitCache,
+        *,
+        hidden_layer: int | None = None,
+    ):
+        if len(base) != len(cache):
+            raise ValueError(
+                f"Teacher cache has {len(cache)} items but dataset has "
+                f"{len(base)} records — cache is stale."
+            )
+        if hidden_layer is None and cache.hidden_layers:
+            hidden_layer = cache.hidden_layers[0]
+        self.base = base
+        self.cache = cache
+        self.hidden_layer = hidden_layer
+        self.lengths = np.asarray(cache.array("attention_mask")).sum(axis=1)
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    def __getitem__(self, idx: int) -> dict[str, torch.Tensor]:
+        # Token ids are replaced from the cache below, so skip the base's
+        # tokenizer when it can hand out codes alone.
+        codes = getattr(self.base, "codes", None)
+        item = {"code_indices": codes(idx)} if codes is not None else dict(self.base[idx])
+        cache = self.cache
+        # Right-padded causal teacher: positions past the mask are never needed.
+        n = max(int(self.lengths[idx]), 1)
+        item["input_ids"] = torch.from_numpy(np.array(cache.array("input_ids")[idx, :n]))
+        item["attention_mask"] = torch.from_numpy(np.array(cache.array("attention_mask")[idx, :n]))
+        item["teacher_topk_logits"] = torch.from_numpy(
+            np.asarray(cache.array("topk_logits")[idx, :n], dtype=np.float32)
+        )
+        item["teacher_topk_indices"] = torch.from_numpy(
+            np.asarray(cache.array("topk_indices")[idx, :n], dtype=np.int64)
+        )
+        item["teacher_logsumexp"] = torch.from_numpy(np.array(cache.array("logsumexp")[idx, :n]))
+        if self.hidden_layer is not None:
+            item["teacher_hidden"] = torch.from_numpy(
+                np.asarray(cache.hidden(self.hidden_layer)[idx, :n], dtype=np.float32)
+            )
+        return item
@@ -0,0 +1,235 @@
+"""Pre-tokenized distillation corpus with length bucketing (Stage 3).
+
+Tokenizes the corpus once into a memory-mapped ragged array (flat token
+ids + row offsets).  :class:`LengthBucketBatchSampler` groups records of
+similar length and :class:`DynamicPaddingCollator` pads each batch only to
+its own longest row, so neither the tokenizer nor the teacher/student
+forward pays for ``max_text_length`` padding on short reports.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+
+MANIFEST_FILENAME = "manifest.json"
+TOKENS_FILENAME = "tokens.bin"
+OFFSETS_FILENAME = "offsets.npy"
+
+
+def _tokenizer_fingerprint(tokenizer) -> str:
+    name = getattr(tokenizer, "name_or_path", type(tokenizer).__name__)
+    return f"{name}:{len(tokenizer)}"
+
+
+def tokenized_corpus_key(corpus_path: str | Path, tokenizer, *, max_text_length: int) -> str:
+    """Deterministic hash from corpus contents + tokenizer identity."""
+    h = hashlib.sha256()
+    h.update(Path(corpus_path).read_bytes())
+    h.update(_tokenizer_fingerprint(tokenizer).encode())
+    h.update(f"max_text_length={max_text_length}".encode())
+    return h.hexdigest()[:16]
+
+
+def build_tokenized_corpus(
+    corpus_path: str | Path,
+    tokenizer,
+    cache_dir: str | Path,
+    *,
+    max_text_length: int = 256,
+    batch_size: int = 1024,
+) -> Path:
+    """Tokenize every corpus record once, without padding.
+
+    Token ids are appended to a flat ``int32`` file as they are produced, so
+    memory stays bounded by ``batch_size`` records.  Returns the cache
+    directory; an existing complete cache is reused.
+    """
+    key = tokenized_corpus_key(corpus_path, tokenizer, max_text_length=max_text_length)
+    cache_path = Path(cache_dir) / f"tokens_{key}"
+    manifest_path = cache_path / MANIFEST_FILENAME
+    if manifest_path.exists():
+        return cache_path
+    cache_path.mkdir(parents=True, exist_ok=True)
+
+    texts = [
+        json.loads(line)["text"]
+        for line in Path(corpus_path).read_text().splitlines()
+        if line.strip()
+    ]
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    total = 0
+
+    with (cache_path / TOKENS_FILENAME).open("wb") as f:
+        for start in range(0, len(texts), batch_size):
+            tokenized = tokenizer(
+                texts[start : start + batch_size],
+                truncation=True,
+                max_length=max_text_length,
+            )
+            for row, ids in enumerate(tokenized["input_ids"], start=start):
+                ids = np.asarray(ids, dtype=np.int32)
+                f.write(ids.tobytes())
+                total += ids.size
+                offsets[row + 1] = total
+
+    np.save(cache_path / OFFSETS_FILENAME, offsets)
+    manifest_path.write_text(
+        json.dumps(
+            {
+                "cache_key": key,
+                "num_items": len(texts),
+                "num_tokens": int(total),
+                "max_text_length": max_text_length,
+                "tokenizer": _tokenizer_fingerprint(tokenizer),
+                "corpus_path": str(corpus_path),
+            },
+            indent=2,
+        )
+    )
+    return cache_path
+
+
+class TokenizedCorpus:
+    """Read-only ragged token view over a :func:`build_tokenized_corpus` cache."""
+
+    def __init__(self, cache_path: str | Path):
+        self.cache_path = Path(cache_path)
+        manifest_path = self.cache_path / MANIFEST_FILENAME
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"No complete tokenized corpus at {self.cache_path}")
+        self.manifest = json.loads(manifest_path.read_text())
+        self.offsets = np.load(self.cache_path / OFFSETS_FILENAME)
+        self._tokens: np.ndarray | None = None
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def __len__(self) -> int:
+        return int(self.offsets.size - 1)
+
+    def _token_array(self) -> np.ndarray:
+        if self._tokens is None:
+            if self.manifest["num_tokens"] == 0:
+                self._tokens = np.zeros(0, dtype=np.int32)
+            else:
+                self._tokens = np.memmap(self.cache_path / TOKENS_FILENAME, dtype=np.int32, mode="r")
+        return self._tokens
+
+    def __getitem__(self, idx: int) -> dict[str, torch.Tensor]:
+        start, stop = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        ids = torch.from_numpy(self._token_array()[start:stop].astype(np.int64))
+        return {"input_ids": ids, "attention_mask": torch.ones_like(ids)}
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = dict(self.__dict__)
+        state["_tokens"] = None
+        return state
+
+
+def tokenize_record(
+    text: str,
+    idx: int,
+    tokenizer,
+    tokenized_corpus: TokenizedCorpus | None,
+    *,
+    max_text_length: int,
+) -> dict[str, torch.Tensor]:
+    """Token ids for one record: unpadded from the corpus cache, else padded on the fly."""
+    if tokenized_corpus is not None:
+        return tokenized_corpus[idx]
+    tokenized = tokenizer(
+        text,
+        truncation=True,
+        max_length=max_text_length,
+        padding="max_length",
+        return_tensors="pt",
+    )
+    return {
+        "input_ids": tokenized["input_ids"].squeeze(0),
+        "attention_mask": tokenized["attention_mask"].squeeze(0),
+    }
+
+
+class LengthBucketBatchSampler(Sampler[list[int]]):
+    """Yield batches of indices with similar sequence lengths.
+
+    Indices are shuffled, split into pools of ``batch_size *
+    pool_multiplier``, sorted by length within each pool and cut into
+    batches; the batch order is then shuffled again.  Randomness is kept
+    while most batches need little padding.
+    """
+
+    def __init__(
+        self,
+        lengths: Sequence[int] | np.ndarray,
+        batch_size: int,
+        *,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        pool_multiplier: int = 50,
+        seed: int = 0,
+    ):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.pool_size = batch_size * pool_multiplier
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self) -> int:
+        n = self.lengths.size
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def __iter__(self) -> Iterator[list[int]]:
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1
+        order = rng.permutation(self.lengths.size) if self.shuffle else np.arange(self.lengths.size)
+
+        batches: list[np.ndarray] = []
+        for start in range(0, order.size, self.pool_size):
+            pool = order[start : start + self.pool_size]
+            pool = pool[np.argsort(self.lengths[pool], kind="stable")]
+            for b in range(0, pool.size, self.batch_size):
+                batches.append(pool[b : b + self.batch_size])
+
+        if self.drop_last:
+            batches = [b for b in batches if b.size == self.batch_size]
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        for batch in batches:
+            yield batch.tolist()
+
+
+class DynamicPaddingCollator:
+    """Stack a batch, right-padding variable-length tensors to the batch max.
+
+    Tensors whose shapes differ along dim 0 are padded with ``pad_token_id``
+    (``input_ids``) or zero (everything else, including attention masks).
+    The default pad id 0 matches the distillation CE ``ignore_index``.
+    """
+
+    def __init__(self, pad_token_id: int = 0):
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, items: list[dict[str, torch.Tensor]]) -> dict[str, torch.Tensor]:
+        batch: dict[str, torch.Tensor] = {}
+        for key in items[0]:
+            tensors = [item[key] for item in items]
+            if all(t.shape == tensors[0].shape for t in tensors):
+                batch[key] = torch.stack(tensors)
+                continue
+            pad_value = self.pad_token_id if key == "input_ids" else 0
+            batch[key] = torch.nn.utils.rnn.pad_sequence(
+                tensors, batch_first=True, padding_value=pad_value
+            )
+        return batch
@@ -54,26 +54,9 @@ def _run_narrator_rollout(
     world_step_hz: int,
 ) -> torch.Tensor:
     """Run narrator over world states and return narrator_state per step [B, T, N]."""
-    stride = max(1, int(round(world_step_hz / max(1, narrator.update_hz))))
-    B, T, _ = world_states.shape
-    narrator_dim = narrator.codes_per_step * narrator.code_dim
-    all_states: list[torch.Tensor] = []
-    hidden: torch.Tensor | None = None
-    current: torch.Tensor | None = None
-
     with torch.no_grad():
-        for t in range(T):
-            if t == 0 or t % stride == 0:
-                start = max(0, t + 1 - narrator.window_size)
-                window = world_states[:, start : t + 1]
-                out = narrator(window, hidden_state=hidden)
-                hidden = out.hidden_state
-                current = out.narrator_state
-            if current is None:
-                current = torch.zeros(B, narrator_dim, device=world_states.device)
-            all_states.append(current)
-
-    return torch.stack(all_states, dim=1)
+        rollout = narrator.rollout(world_states, update_stride=narrator.update_stride(world_step_hz))
+    return rollout.per_step(rollout.narrator_state)
 
 
 # ---------------------------------------------------------------------------
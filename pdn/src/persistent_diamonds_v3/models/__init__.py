@@ -5,18 +5,25 @@ from persistent_diamonds_v3.models.encoders import (
     TextEncoder,
     VisionEncoder,
 )
-from persistent_diamonds_v3.models.narrator import DiscreteNarrator, NarratorOutput
-from persistent_diamonds_v3.models.report_head import ReportHead
+from persistent_diamonds_v3.models.narrator import DiscreteNarrator, NarratorOutput, NarratorRollout
+from persistent_diamonds_v3.models.report_head import DecoderCache, GenerationOutput, ReportHead
+from persistent_diamonds_v3.models.session import InferenceSession, LatencyReport, SessionTick
 from persistent_diamonds_v3.models.world_model import ModularSSMWorldModel, WorldModelOutput
 
 __all__ = [
     "ControlHead",
     "ControlOutput",
+    "DecoderCache",
     "DiscreteNarrator",
+    "GenerationOutput",
+    "InferenceSession",
+    "LatencyReport",
     "ModalityEncoder",
     "NarratorOutput",
+    "NarratorRollout",
     "ProprioRewardEncoder",
     "ReportHead",
+    "SessionTick",
     "TextEncoder",
     "ModularSSMWorldModel",
     "VisionEncoder",
@@ -5,6 +5,7 @@ import math
 
 import torch
 from torch import nn
+from torch.nn.utils.rnn import pack_padded_sequence
 
 
 @dataclass(slots=True)
@@ -18,22 +19,180 @@ class NarratorOutput:
     hidden_state: torch.Tensor
 
 
+@dataclass(slots=True)
+class NarratorRollout:
+    """Narrator outputs at update rate plus the map back to world steps.
+
+    Update-rate tensors are [B, U, ...]; ``step_to_update`` [T] gives the
+    update slot in effect at every world step (see :meth:`per_step`).
+    """
+
+    update_indices: torch.Tensor
+    step_to_update: torch.Tensor
+    code_indices: torch.Tensor
+    narrator_state: torch.Tensor
+    uncertainty: torch.Tensor
+    predicted_next_state: torch.Tensor
+    vq_loss: torch.Tensor
+    # GRU hidden state [L, B, H] after the last update.
+    hidden_state: torch.Tensor | None = None
+
+    def per_step(self, updates: torch.Tensor) -> torch.Tensor:
+        """Broadcast an update-rate tensor [B, U, ...] to world rate [B, T, ...]."""
+        return updates.index_select(1, self.step_to_update)
+
+
+VQ_SEARCH_MODES = ("exact", "ivf")
+
+
+@dataclass(slots=True)
+class _CoarseIndex:
+    """Two-level (inverted-file) codebook index: centroids plus padded members."""
+
+    centroids: torch.Tensor  # [C, D]
+    members: torch.Tensor  # [C, M] code ids, -1 for padding
+
+
 class MultiCodeVectorQuantizer(nn.Module):
-    def __init__(self, codebook_size: int, code_dim: int, commitment_weight: float = 0.25):
+    """Multi-code VQ with memory-bounded nearest-neighbour search.
+
+    ``search="exact"`` scans the full codebook but processes queries in
+    chunks so the ``[queries, codebook]`` distance block stays under
+    ``memory_budget_mb``.  ``search="ivf"`` is an approximate two-level
+    search for large codebooks: codes are clustered into ``coarse_clusters``
+    groups (default ``sqrt(N)``) and each query only scans the members of its
+    ``probe`` nearest clusters.  While the codebook is being trained the
+    index would go stale after every optimizer step, so IVF is only used in
+    eval mode or for a frozen codebook; otherwise the exact search runs.
+
+    Codebook norms and the coarse index are cached and rebuilt whenever the
+    codebook parameter changes (tracked via its in-place version counter).
+    """
+
+    def __init__(
+        self,
+        codebook_size: int,
+        code_dim: int,
+        commitment_weight: float = 0.25,
+        *,
+        search: str = "exact",
+        memory_budget_mb: float = 64.0,
+        coarse_clusters: int = 0,
+        probe: int = 8,
+    ):
         super().__init__()
+        if search not in VQ_SEARCH_MODES:
+            raise ValueError(f"Unknown VQ search mode {search!r}. Choose from {VQ_SEARCH_MODES}.")
         self.codebook_size = codebook_size
         self.code_dim = code_dim
         self.commitment_weight = commitment_weight
+        self.search = search
+        self.memory_budget_mb = memory_budget_mb
+        self.coarse_clusters = coarse_clusters or max(1, round(math.sqrt(codebook_size)))
+        self.probe = probe
         self.embedding = nn.Parameter(torch.randn(codebook_size, code_dim) * 0.02)
 
+        self._norm_cache: tuple[tuple, torch.Tensor] | None = None
+        self._index_cache: tuple[tuple, _CoarseIndex] | None = None
+
+    def _codebook_key(self) -> tuple:
+        weight = self.embedding
+        return (weight._version, weight.data_ptr(), weight.device, weight.dtype)
+
+    def codebook_norms(self) -> torch.Tensor:
+        """Squared L2 norm of every code, cached until the codebook changes."""
+        key = self._codebook_key()
+        if self._norm_cache is None or self._norm_cache[0] != key:
+            with torch.no_grad():
+                norms = self.embedding.pow(2).sum(dim=-1)
+            self._norm_cache = (key, norms)
+        return self._norm_cache[1]
+
+    def _chunk_rows(self, columns: int, element_size: int) -> int:
+        budget = int(self.memory_budget_mb * 2**20)
+        return max(1, budget // max(1, columns * element_size))
+
+    @torch.no_grad()
+    def _exact_search(self, flat: torch.Tensor) -> torch.Tensor:
+        codebook = self.embedding.to(flat.dtype)
+        norms = self.codebook_norms().to(flat.dtype)
+        query_norms = flat.pow(2).sum(dim=-1, keepdim=True)
+        chunk = self._chunk_rows(self.codebook_size, flat.element_size())
+
+        indices = torch.empty(flat.size(0), dtype=torch.long, device=flat.device)
+        for start in range(0, flat.size(0), chunk):
+            stop = start + chunk
+            distances = query_norms[start:stop] + norms - 2.0 * (flat[start:stop] @ codebook.T)
+            indices[start:stop] = distances.argmin(dim=-1)
+        return indices
+
+    @torch.no_grad()
+    def _build_coarse_index(self, iterations: int = 10) -> _CoarseIndex:
+        codebook = self.embedding.detach().float()
+        clusters = min(self.coarse_clusters, self.codebook_size)
+        # Deterministic spread initialisation followed by a few Lloyd steps.
+        init = torch.linspace(0, self.codebook_size - 1, clusters, device=codebook.device).long()
+        centroids = codebook[init].clone()
+        for _ in range(iterations):
+            assign = torch.cdist(codebook, centroids).argmin(dim=-1)
+            sums = torch.zeros_like(centroids).index_add_(0, assign, codebook)
+            counts = torch.bincount(assign, minlength=clusters).unsqueeze(-1)
+            centroids = torch.where(counts > 0, sums / counts.clamp(min=1), centroids)
+        assign = torch.cdist(codebook, centroids).argmin(dim=-1)
+
+        order = torch.argsort(assign, stable=True)
+        counts = torch.bincount(assign, minlength=clusters)
+        offsets = torch.cumsum(counts, dim=0) - counts
+        rank = torch.arange(self.codebook_size, device=codebook.device) - offsets[assign[order]]
+        members = torch.full(
+            (clusters, int(counts.max().item())), -1, dtype=torch.long, device=codebook.device
+        )
+        members[assign[order], rank] = order
+        return _CoarseIndex(centroids=centroids, members=members)
+
+    def coarse_index(self) -> _CoarseIndex:
+        key = self._codebook_key()
+        if self._index_cache is None or self._index_cache[0] != key:
+            self._index_cache = (key, self._build_coarse_index())
+        return self._index_cache[1]
+
+    @torch.no_grad()
+    def _ivf_search(self, flat: torch.Tensor) -> torch.Tensor:
+        index = self.coarse_index()
+        codebook = self.embedding.detach().to(flat.dtype)
+        norms = self.codebook_norms().to(flat.dtype)
+        centroids = index.centroids.to(flat.dtype)
+        probe = min(self.probe, centroids.size(0))
+        width = probe * index.members.size(1)
+        # Candidate vectors dominate memory: [rows, width, code_dim].
+        chunk = self._chunk_rows(width * (self.code_dim + 1), flat.element_size())
+
+        indices = torch.empty(flat.size(0), dtype=torch.long, device=flat.device)
+        for start in range(0, flat.size(0), chunk):
+            queries = flat[start : start + chunk]
+            coarse = (centroids.pow(2).sum(-1) - 2.0 * (queries @ centroids.T)).topk(
+                probe, dim=-1, largest=False
+            ).indices
+            candidates = index.members[coarse].flatten(1)  # [rows, width]
+            valid = candidates >= 0
+            safe = candidates.clamp(min=0)
+            scores = norms[safe] - 2.0 * torch.bmm(
+                codebook[safe], queries.unsqueeze(-1)
+            ).squeeze(-1)
+            scores = scores.masked_fill(~valid, float("inf"))
+            best = scores.argmin(dim=-1, keepdim=True)
+            indices[start : start + chunk] = safe.gather(1, best).squeeze(-1)
+        return indices
+
     def forward(self, queries: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
         # queries: [B, K, C]
-        distances = (
-            queries.pow(2).sum(dim=-1, keepdim=True)
-            + self.embedding.pow(2).sum(dim=-1).view(1, 1, -1)
-            - 2.0 * torch.einsum("bkc,nc->bkn", queries, self.embedding)
-        )
-        code_indices = distances.argmin(dim=-1)
+        flat = queries.detach().reshape(-1, self.code_dim)
+        training_codebook = self.training and self.embedding.requires_grad
+        if self.search == "ivf" and not training_codebook:
+            code_indices = self._ivf_search(flat)
+        else:
+            code_indices = self._exact_search(flat)
+        code_indices = code_indices.view(queries.shape[:-1])
         quantized = self.embedding[code_indices]
 
         commit_loss = (queries.detach() - quantized).pow(2).mean()
@@ -56,6 +215,11 @@ class DiscreteNarrator(nn.Module):
         codebook_size: int,
         codes_per_step: int,
         code_dim: int,
+        *,
+        vq_search: str = "exact",
+        vq_memory_budget_mb: float = 64.0,
+        vq_coarse_clusters: int = 0,
+        vq_probe: int = 8,
     ):
         super().__init__()
         self.latent_dim = latent_dim
@@ -72,7 +236,14 @@ class DiscreteNarrator(nn.Module):
             batch_first=True,
         )
         self.query_projection = nn.Linear(hidden_dim, codes_per_step * code_dim)
-        self.quantizer = MultiCodeVectorQuantizer(codebook_size=codebook_size, code_dim=code_dim)
+        self.quantizer = MultiCodeVectorQuantizer(
+            codebook_size=codebook_size,
+            code_dim=code_dim,
+            search=vq_search,
+            memory_budget_mb=vq_memory_budget_mb,
+            coarse_clusters=vq_coarse_clusters,
+            probe=vq_probe,
+        )
 
         bottleneck_dim = codes_per_step * code_dim
         self.uncertainty_head = nn.Sequential(
@@ -90,6 +261,10 @@ class DiscreteNarrator(nn.Module):
     def bits_per_second(self) -> float:
         return float(self.codes_per_step * math.log2(self.codebook_size) * self.update_hz)
 
+    def update_stride(self, world_step_hz: int) -> int:
+        """World steps between narrator updates."""
+        return max(1, round(world_step_hz / max(1, self.update_hz)))
+
     def forward(
         self,
         state_window: torch.Tensor,
@@ -103,14 +278,139 @@ class DiscreteNarrator(nn.Module):
         if state_window.size(-1) != self.latent_dim:
             raise ValueError(f"Expected latent dim {self.latent_dim}, got {state_window.size(-1)}")
 
-        gru_out, final_hidden = self.window_gru(state_window, hidden_state)
+        _, final_hidden = self.window_gru(state_window, hidden_state)
+        return self._narrate(final_hidden, state_window[:, -1])
+
+    def forward_all_windows(self, states: torch.Tensor, *, chunk_steps: int = 256) -> NarratorOutput:
+        """Narrate every causal window of a state sequence in batched calls.
+
+        Equivalent to ``forward(states[:, max(0, t + 1 - W) : t + 1])`` with a
+        fresh hidden state for every ``t``.  Windows are gathered from a
+        strided ``unfold`` view ``chunk_steps`` timesteps at a time, so at most
+        a ``[B, chunk_steps, W, D]`` copy is live; the first ``W - 1`` windows
+        are shorter and are handled exactly via a packed sequence rather than
+        padding.  The output heads and quantizer run once over all windows.
+
+        Returns per-timestep tensors (``code_indices`` is [B, T, K],
+        ``narrator_state`` is [B, T, K*C], ``hidden_state`` is [L, B, T, H])
+        and ``vq_loss`` averaged over all windows.
+        """
+        if states.ndim != 3:
+            raise ValueError("Expected states as [B, T, D].")
+        if states.size(-1) != self.latent_dim:
+            raise ValueError(f"Expected latent dim {self.latent_dim}, got {states.size(-1)}")
+        if chunk_steps < 1:
+            raise ValueError("chunk_steps must be >= 1.")
+
+        batch, steps, latent_dim = states.shape
+        window = min(self.window_size, steps)
+
+        starts = (torch.arange(steps, device=states.device) + 1 - window).clamp(min=0)
+        lengths = torch.minimum(torch.arange(1, steps + 1), torch.tensor(window))
+        # [B, T-W+1, D, W] strided view; window t starts at starts[t].
+        strided = states.unfold(1, window, 1)
+
+        hiddens = []
+        for t0 in range(0, steps, chunk_steps):
+            t1 = min(steps, t0 + chunk_steps)
+            windows = strided[:, starts[t0:t1]].transpose(-1, -2).reshape(batch * (t1 - t0), window, latent_dim)
+            if t0 < window - 1:
+                windows = pack_padded_sequence(
+                    windows,
+                    lengths[t0:t1].repeat(batch),
+                    batch_first=True,
+                    enforce_sorted=False,
+                )
+            _, chunk_hidden = self.window_gru(windows)
+            hiddens.append(chunk_hidden.view(chunk_hidden.size(0), batch, t1 - t0, -1))
+        final_hidden = torch.cat(hiddens, dim=2).flatten(1, 2)
+
+        out = self._narrate(final_hidden, states.reshape(batch * steps, latent_dim))
+        return NarratorOutput(
+            code_indices=out.code_indices.view(batch, steps, -1),
+            quantized_codes=out.quantized_codes.view(batch, steps, self.codes_per_step, self.code_dim),
+            narrator_state=out.narrator_state.view(batch, steps, -1),
+            uncertainty=out.uncertainty.view(batch, steps, -1),
+            predicted_next_state=out.predicted_next_state.view(batch, steps, -1),
+            vq_loss=out.vq_loss,
+            hidden_state=out.hidden_state.view(out.hidden_state.size(0), batch, steps, -1),
+        )
+
+    def rollout(
+        self,
+        world_states: torch.Tensor,
+        *,
+        update_stride: int,
+        hidden_state: torch.Tensor | None = None,
+        history: torch.Tensor | None = None,
+    ) -> NarratorRollout:
+        """Run the narrator only at update steps ``0, stride, 2*stride, ...``.
+
+        Matches calling :meth:`forward` on the window ending at each update
+        step while carrying the GRU hidden state from one update to the next.
+        The update windows come from one strided gather; only the GRU
+        recurrence runs per update, and the output heads and quantizer run
+        once over all ``B*U`` updates.
+
+        To continue a longer sequence, pass the previous rollout's
+        ``hidden_state`` and up to ``window_size - 1`` world states
+        ``[B, H, D]`` preceding ``world_states`` as ``history``; when the
+        earlier part's length is a multiple of ``update_stride`` the updates
+        match one rollout over the whole sequence.
+        """
+        if world_states.ndim != 3:
+            raise ValueError("Expected world states as [B, T, D].")
+        if world_states.size(-1) != self.latent_dim:
+            raise ValueError(f"Expected latent dim {self.latent_dim}, got {world_states.size(-1)}")
+        if update_stride < 1:
+            raise ValueError("update_stride must be >= 1")
+
+        batch, steps, latent_dim = world_states.shape
+        device = world_states.device
+        past = 0
+        context = world_states
+        if history is not None and history.size(1) > 0:
+            history = history[:, max(0, history.size(1) - (self.window_size - 1)) :]
+            past = history.size(1)
+            context = torch.cat((history.to(world_states.dtype), world_states), dim=1)
+        window = min(self.window_size, past + steps)
+
+        update_indices = torch.arange(0, steps, update_stride, device=device)
+        step_to_update = torch.arange(steps, device=device) // update_stride
+        ends = update_indices + past
+        starts = (ends + 1 - window).clamp(min=0)
+        lengths = torch.clamp(ends + 1, max=window).tolist()
+        # [B, U, W, D]; a short window keeps its steps at the front.
+        windows = context.unfold(1, window, 1)[:, starts].transpose(-1, -2)
+
+        finals: list[torch.Tensor] = []
+        for update_window, length in zip(windows.unbind(1), lengths, strict=True):
+            _, hidden_state = self.window_gru(update_window[:, :length], hidden_state)
+            finals.append(hidden_state)
+
+        final_hidden = torch.stack(finals, dim=2).flatten(1, 2)
+        last_world_state = world_states[:, update_indices].reshape(-1, latent_dim)
+        out = self._narrate(final_hidden, last_world_state)
+
+        updates = update_indices.numel()
+        return NarratorRollout(
+            update_indices=update_indices,
+            step_to_update=step_to_update,
+            code_indices=out.code_indices.view(batch, updates, -1),
+            narrator_state=out.narrator_state.view(batch, updates, -1),
+            uncertainty=out.uncertainty.view(batch, updates, -1),
+            predicted_next_state=out.predicted_next_state.view(batch, updates, -1),
+            vq_loss=out.vq_loss,
+            hidden_state=hidden_state,
+        )
+
+    def _narrate(self, final_hidden: torch.Tensor, last_world_state: torch.Tensor) -> NarratorOutput:
         last_hidden = final_hidden[-1]
 
         queries = self.query_projection(last_hidden).view(-1, self.codes_per_step, self.code_dim)
         code_indices, quantized_codes, vq_loss = self.quantizer(queries)
         narrator_state = quantized_codes.flatten(start_dim=1)
 
-        last_world_state = state_window[:, -1]
         uncertainty = self.uncertainty_head(torch.cat([last_world_state, narrator_state], dim=-1))
         predicted_next_state = self.self_prediction_head(narrator_state)
 
@@ -1,7 +1,50 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+
 import torch
 from torch import nn
+from torch.nn import functional as F
+
+
+@dataclass(slots=True)
+class DecoderCache:
+    """Per-layer attention state for incremental decoding.
+
+    ``self_keys``/``self_values`` are preallocated ``[B, H, max_len, d]``
+    buffers filled up to ``length``; ``cross_keys``/``cross_values`` hold the
+    code-memory projections, computed once per ``generate`` call.
+    """
+
+    self_keys: list[torch.Tensor]
+    self_values: list[torch.Tensor]
+    cross_keys: list[torch.Tensor]
+    cross_values: list[torch.Tensor]
+    length: int = 0
+
+    def select(self, rows: torch.Tensor) -> None:
+        """Keep (or reorder/duplicate) batch rows in place, e.g. to retire finished sequences."""
+        for buffers in (self.self_keys, self.self_values, self.cross_keys, self.cross_values):
+            for idx, tensor in enumerate(buffers):
+                buffers[idx] = tensor.index_select(0, rows)
+
+
+@dataclass(slots=True)
+class GenerationOutput:
+    """Result of :meth:`ReportHead.generate_batch`.
+
+    ``sequences`` is ``[B, L]`` including the BOS token and padded with
+    ``pad_token_id`` after each sequence's EOS; ``lengths`` counts tokens up
+    to and including EOS; ``scores`` is the summed model log-probability of
+    the generated tokens.
+    """
+
+    sequences: torch.Tensor
+    lengths: torch.Tensor
+    scores: torch.Tensor
+
+
+GENERATION_STRATEGIES = ("greedy", "sample", "beam")
 
 
 class ReportHead(nn.Module):
@@ -44,6 +87,21 @@ class ReportHead(nn.Module):
         *,
         attention_mask: torch.Tensor | None = None,
     ) -> torch.Tensor:
+        hidden = self.forward_hidden(code_indices, input_ids, attention_mask=attention_mask)
+        return self.lm_head(hidden)
+
+    def forward_hidden(
+        self,
+        code_indices: torch.Tensor,
+        input_ids: torch.Tensor,
+        *,
+        attention_mask: torch.Tensor | None = None,
+    ) -> torch.Tensor:
+        """Final decoder states ``[B, T, D]`` before ``lm_head``.
+
+        Lets losses project to the vocabulary in chunks instead of holding
+        the full ``[B, T, V]`` logits.
+        """
         if code_indices.ndim != 3:
             raise ValueError("Expected `code_indices` as [B, S, K].")
         if input_ids.ndim != 2:
@@ -75,8 +133,84 @@ class ReportHead(nn.Module):
             tgt_mask=causal_mask,
             tgt_key_padding_mask=key_padding_mask,
         )
-        logits = self.lm_head(out.transpose(0, 1))
-        return logits
+        return out.transpose(0, 1)
+
+    def _split_heads(self, x: torch.Tensor, head_count: int) -> torch.Tensor:
+        # [B, T, D] -> [B, H, T, d]
+        batch, length, _ = x.shape
+        return x.view(batch, length, head_count, -1).transpose(1, 2)
+
+    def _merge_heads(self, x: torch.Tensor) -> torch.Tensor:
+        batch, _, length, _ = x.shape
+        return x.transpose(1, 2).reshape(batch, length, self.model_dim)
+
+    def init_cache(self, code_indices: torch.Tensor, max_length: int) -> DecoderCache:
+        """Embed the code memory and project cross-attention K/V once per layer."""
+        if code_indices.ndim != 3:
+            raise ValueError("Expected `code_indices` as [B, S, K].")
+        if max_length > self.max_seq_len:
+            raise ValueError(f"Input length {max_length} exceeds max_seq_len={self.max_seq_len}")
+
+        memory = self.code_embedding(code_indices).mean(dim=2)  # [B, S, D]
+        batch = memory.size(0)
+        cache = DecoderCache(self_keys=[], self_values=[], cross_keys=[], cross_values=[])
+        for layer in self.decoder.layers:
+            attn = layer.multihead_attn
+            heads = attn.num_heads
+            _, w_k, w_v = attn.in_proj_weight.chunk(3)
+            _, b_k, b_v = attn.in_proj_bias.chunk(3)
+            cache.cross_keys.append(self._split_heads(F.linear(memory, w_k, b_k), heads))
+            cache.cross_values.append(self._split_heads(F.linear(memory, w_v, b_v), heads))
+
+            head_dim = self.model_dim // heads
+            shape = (batch, heads, max_length, head_dim)
+            cache.self_keys.append(memory.new_empty(shape))
+            cache.self_values.append(memory.new_empty(shape))
+        return cache
+
+    def decode_step(self, input_ids: torch.Tensor, cache: DecoderCache) -> torch.Tensor:
+        """Run one decoder position against ``cache`` and return ``[B, V]`` logits.
+
+        Mirrors the post-norm ``nn.TransformerDecoderLayer`` math of
+        :meth:`forward`, so cached decoding matches re-running the full prefix.
+        """
+        position = cache.length
+        if position >= cache.self_keys[0].size(2):
+            raise ValueError(f"Input length {position + 1} exceeds max_seq_len={self.max_seq_len}")
+
+        pos = torch.full_like(input_ids, position)
+        x = (self.token_embedding(input_ids) + self.position_embedding(pos)).unsqueeze(1)  # [B, 1, D]
+
+        for idx, layer in enumerate(self.decoder.layers):
+            attn = layer.self_attn
+            heads = attn.num_heads
+            q, k, v = F.linear(x, attn.in_proj_weight, attn.in_proj_bias).chunk(3, dim=-1)
+            cache.self_keys[idx][:, :, position] = self._split_heads(k, heads).squeeze(2)
+            cache.self_values[idx][:, :, position] = self._split_heads(v, heads).squeeze(2)
+            keys = cache.self_keys[idx][:, :, : position + 1]
+            values = cache.self_values[idx][:, :, : position + 1]
+            sa = F.scaled_dot_product_attention(
+                self._split_heads(q, heads), keys, values, dropout_p=attn.dropout if self.training else 0.0
+            )
+            sa = attn.out_proj(self._merge_heads(sa))
+            x = layer.norm1(x + layer.dropout1(sa))
+
+            cross = layer.multihead_attn
+            w_q, _, _ = cross.in_proj_weight.chunk(3)
+            b_q, _, _ = cross.in_proj_bias.chunk(3)
+            q = self._split_heads(F.linear(x, w_q, b_q), cross.num_heads)
+            ca = F.scaled_dot_product_attention(
+                q, cache.cross_keys[idx], cache.cross_values[idx],
+                dropout_p=cross.dropout if self.training else 0.0,
+            )
+            ca = cross.out_proj(self._merge_heads(ca))
+            x = layer.norm2(x + layer.dropout2(ca))
+
+            ff = layer.linear2(layer.dropout(layer.activation(layer.linear1(x))))
+            x = layer.norm3(x + layer.dropout3(ff))
+
+        cache.length = position + 1
+        return self.lm_head(x.squeeze(1))
 
     @torch.no_grad()
     def generate(
@@ -86,9 +220,14 @@ class ReportHead(nn.Module):
         bos_token_id: int,
         eos_token_id: int,
         max_new_tokens: int = 128,
+        use_cache: bool = True,
     ) -> torch.Tensor:
         batch = code_indices.size(0)
         tokens = torch.full((batch, 1), bos_token_id, device=code_indices.device, dtype=torch.long)
+        if use_cache:
+            return self._generate_cached(
+                code_indices, tokens, eos_token_id=eos_token_id, max_new_tokens=max_new_tokens
+            )
 
         for _ in range(max_new_tokens):
             logits = self.forward(code_indices, tokens)
@@ -98,3 +237,197 @@ class ReportHead(nn.Module):
                 break
 
         return tokens
+
+    def _generate_cached(
+        self,
+        code_indices: torch.Tensor,
+        tokens: torch.Tensor,
+        *,
+        eos_token_id: int,
+        max_new_tokens: int,
+    ) -> torch.Tensor:
+        # Positions 0 .. max_new_tokens - 1 are decoded; the final token is never fed back.
+        cache = self.init_cache(code_indices, min(max_new_tokens, self.max_seq_len))
+        generated = [tokens]
+        next_token = tokens[:, 0]
+        for _ in range(max_new_tokens):
+            logits = self.decode_step(next_token, cache)
+            next_token = logits.argmax(dim=-1)
+            generated.append(next_token.unsqueeze(1))
+            if torch.all(next_token == eos_token_id):
+                break
+        return torch.cat(generated, dim=1)
+
+    @staticmethod
+    def _filter_logits(logits: torch.Tensor, *, top_k: int, top_p: float) -> torch.Tensor:
+        if top_k > 0 and top_k < logits.size(-1):
+            kth = logits.topk(top_k, dim=-1).values[:, -1:]
+            logits = logits.masked_fill(logits < kth, float("-inf"))
+        if top_p < 1.0:
+            sorted_logits, order = logits.sort(dim=-1, descending=True)
+            probs = sorted_logits.softmax(dim=-1)
+            # Drop a token once the mass before it already reaches top_p (the top token always survives).
+            drop = (probs.cumsum(dim=-1) - probs) >= top_p
+            sorted_logits = sorted_logits.masked_fill(drop, float("-inf"))
+            logits = torch.full_like(logits, float("-inf")).scatter(-1, order, sorted_logits)
+        return logits
+
+    @torch.no_grad()
+    def generate_batch(
+        self,
+        code_indices: torch.Tensor,
+        *,
+        bos_token_id: int,
+        eos_token_id: int,
+        max_new_tokens: int = 128,
+        strategy: str = "greedy",
+        temperature: float = 1.0,
+        top_k: int = 0,
+        top_p: float = 1.0,
+        num_beams: int = 4,
+        length_penalty: float = 1.0,
+        pad_token_id: int | None = None,
+        generator: torch.Generator | None = None,
+    ) -> GenerationOutput:
+        """Batched decoding with per-sequence stopping.
+
+        Finished sequences are retired from the active batch (and their KV
+        cache rows dropped), so the batch shrinks as reports complete instead
+        of decoding until the slowest one emits EOS.
+
+        ``strategy="sample"`` draws from ``softmax(logits / temperature)``
+        after optional top-k / nucleus (top-p) filtering. ``strategy="beam"``
+        runs a vectorized beam search over ``num_beams`` hypotheses per
+        sequence and returns the best one under ``score / generated_len **
+        length_penalty``.
+        """
+        if strategy not in GENERATION_STRATEGIES:
+            raise ValueError(f"Unknown generation strategy {strategy!r}. Choose from {GENERATION_STRATEGIES}.")
+        if temperature <= 0.0:
+            raise ValueError("`temperature` must be > 0.")
+        if not 0.0 < top_p <= 1.0:
+            raise ValueError("`top_p` must be in (0, 1].")
+        if num_beams < 1:
+            raise ValueError("`num_beams` must be >= 1.")
+        pad = eos_token_id if pad_token_id is None else pad_token_id
+
+        if strategy == "beam":
+            return self._beam_search(
+                code_indices,
+                bos_token_id=bos_token_id,
+                eos_token_id=eos_token_id,
+                max_new_tokens=max_new_tokens,
+                num_beams=num_beams,
+                length_penalty=length_penalty,
+                pad_token_id=pad,
+            )
+
+        batch = code_indices.size(0)
+        device = code_indices.device
+        sequences = torch.full((batch, max_new_tokens + 1), pad, device=device, dtype=torch.long)
+        sequences[:, 0] = bos_token_id
+        lengths = torch.full((batch,), max_new_tokens + 1, device=device, dtype=torch.long)
+        scores = torch.zeros(batch, device=device)
+
+        cache = self.init_cache(code_indices, min(max_new_tokens, self.max_seq_len))
+        active = torch.arange(batch, device=device)
+        next_token = sequences[:, 0]
+        for step in range(max_new_tokens):
+            logits = self.decode_step(next_token, cache).float()
+            if strategy == "greedy":
+                next_token = logits.argmax(dim=-1)
+            else:
+                filtered = self._filter_logits(logits / temperature, top_k=top_k, top_p=top_p)
+                next_token = torch.multinomial(filtered.softmax(dim=-1), 1, generator=generator).squeeze(-1)
+
+            log_probs = logits.log_softmax(dim=-1).gather(-1, next_token.unsqueeze(-1)).squeeze(-1)
+            scores.index_add_(0, active, log_probs)
+            sequences[active, step + 1] = next_token
+
+            finished = next_token == eos_token_id
+            if bool(finished.any()):
+                lengths[active[finished]] = step + 2
+                keep = (~finished).nonzero().squeeze(-1)
+                if keep.numel() == 0:
+                    break
+                active = active[keep]
+                next_token = next_token[keep]
+                cache.select(keep)
+
+        return GenerationOutput(
+            sequences=sequences[:, : int(lengths.max())],
+            lengths=lengths,
+            scores=scores,
+        )
+
+    def _beam_search(
+        self,
+        code_indices: torch.Tensor,
+        *,
+        bos_token_id: int,
+        eos_token_id: int,
+        max_new_tokens: int,
+        num_beams: int,
+        length_penalty: float,
+        pad_token_id: int,
+    ) -> GenerationOutput:
+        batch = code_indices.size(0)
+        device = code_indices.device
+        total = max_new_tokens + 1
+
+        beams = torch.full((batch, num_beams, total), pad_token_id, device=device, dtype=torch.long)
+        beams[..., 0] = bos_token_id
+        beam_scores = torch.zeros(batch, num_beams, device=device)
+        beam_scores[:, 1:] = float("-inf")  # all beams start identical; expand from the first only
+        beam_lengths = torch.ones(batch, num_beams, device=device, dtype=torch.long)
+        beam_done = torch.zeros(batch, num_beams, device=device, dtype=torch.bool)
+
+        cache = self.init_cache(code_indices.repeat_interleave(num_beams, dim=0), min(max_new_tokens, self.max_seq_len))
+        active = torch.arange(batch, device=device)
+        next_token = beams[:, :, 0].reshape(-1)
+        for step in range(max_new_tokens):
+            log_probs = self.decode_step(next_token, cache).float().log_softmax(dim=-1)
+            vocab = log_probs.size(-1)
+            rows = active.numel()
+
+            # Finished hypotheses keep their score and only extend with (padded) EOS.
+            done = beam_done[active].reshape(-1)
+            log_probs[done] = float("-inf")
+            log_probs[done, eos_token_id] = 0.0
+
+            candidates = (beam_scores[active].reshape(-1, 1) + log_probs).view(rows, num_beams * vocab)
+            top_scores, top_index = candidates.topk(num_beams, dim=-1)
+            source = torch.div(top_index, vocab, rounding_mode="floor")
+            token = top_index % vocab
+
+            prev_done = beam_done[active].gather(1, source)
+            history = beams[active].gather(1, source.unsqueeze(-1).expand(-1, -1, total))
+            history[..., step + 1] = torch.where(prev_done, torch.full_like(token, pad_token_id), token)
+            beams[active] = history
+            beam_lengths[active] = beam_lengths[active].gather(1, source) + (~prev_done).long()
+            beam_done[active] = prev_done | (token == eos_token_id)
+            beam_scores[active] = top_scores
+
+            flat_source = (torch.arange(rows, device=device).unsqueeze(-1) * num_beams + source).reshape(-1)
+            cache.select(flat_source)
+            next_token = token.reshape(-1)
+
+            finished = beam_done[active].all(dim=-1)
+            if bool(finished.any()):
+                keep = (~finished).nonzero().squeeze(-1)
+                if keep.numel() == 0:
+                    break
+                active = active[keep]
+                keep_rows = (keep.unsqueeze(-1) * num_beams + torch.arange(num_beams, device=device)).reshape(-1)
+                next_token = next_token[keep_rows]
+                cache.select(keep_rows)
+
+        generated = (beam_lengths - 1).clamp(min=1).to(beam_scores.dtype)
+        best = (beam_scores / generated.pow(length_penalty)).argmax(dim=-1)
+        pick = torch.arange(batch, device=device)
+        lengths = beam_lengths[pick, best]
+        return GenerationOutput(
+            sequences=beams[pick, best, : int(lengths.max())],
+            lengths=lengths,
+            scores=beam_scores[pick, best],
+        )
@@ -0,0 +1,203 @@
+"""Streaming inference for real-time world-model + narrator serving.
+
+The whole-sequence ``forward`` APIs need the full trajectory up front.  An
+:class:`InferenceSession` instead consumes one observation per world tick,
+keeps the recurrent world state and a ring buffer of the last
+``window_size`` states, and runs the narrator (and optional control head)
+only on narrator update ticks.  Per-tick work is O(1) in the session length.
+
+Each tick is timed against the world-step budget (``1 / world_step_hz``) so
+a preset can be checked against a real-time deadline.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+import torch
+from torch import nn
+
+from persistent_diamonds_v3.models.control_head import ControlHead, ControlOutput
+from persistent_diamonds_v3.models.narrator import DiscreteNarrator
+from persistent_diamonds_v3.models.world_model import ModularSSMWorldModel
+
+
+@dataclass(slots=True)
+class SessionTick:
+    tick: int
+    world_state: torch.Tensor
+    narrator_updated: bool
+    code_indices: torch.Tensor
+    narrator_state: torch.Tensor
+    control: ControlOutput | None
+    latency_s: float
+    deadline_missed: bool
+
+
+@dataclass(slots=True)
+class LatencyReport:
+    ticks: int
+    deadline_misses: int
+    budget_ms: float
+    mean_ms: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+
+    @property
+    def miss_rate(self) -> float:
+        return self.deadline_misses / max(1, self.ticks)
+
+
+class InferenceSession:
+    """Stateful one-observation-per-tick runner for world model + narrator.
+
+    The narrator fires on tick 0 and every ``world_step_hz / update_hz``
+    ticks after that, carrying its GRU hidden state across updates exactly
+    like the training rollouts.  Between updates the latest codes, narrator
+    state and control outputs are returned unchanged.
+
+    World-model weights are packed once per :meth:`reset`; call
+    :meth:`refresh_weights` after modifying model parameters mid-session.
+    """
+
+    def __init__(
+        self,
+        world_model: ModularSSMWorldModel,
+        narrator: DiscreteNarrator,
+        *,
+        control_head: ControlHead | None = None,
+        input_adapter: nn.Module | None = None,
+        world_step_hz: int = 100,
+        batch_size: int = 1,
+        device: str = "cpu",
+        latency_window: int = 4096,
+    ):
+        self.device = torch.device(device)
+        self.world_model = world_model.to(self.device).eval()
+        self.narrator = narrator.to(self.device).eval()
+        self.control_head = control_head.to(self.device).eval() if control_head is not None else None
+        self.input_adapter = input_adapter.to(self.device).eval() if input_adapter is not None else None
+
+        self.world_step_hz = world_step_hz
+        self.update_stride = narrator.update_stride(world_step_hz)
+        self.budget_s = 1.0 / max(1, world_step_hz)
+
+        window = narrator.window_size
+        # Row h lists ring slots oldest-to-newest when the write head is at h.
+        self._window_order = (
+            (torch.arange(window).unsqueeze(0) + torch.arange(window).unsqueeze(1)) % window
+        ).to(self.device)
+
+        self._latencies: deque[float] = deque(maxlen=latency_window)
+        self.reset(batch_size)
+
+    def refresh_weights(self) -> None:
+        """Re-pack world-model weights (needed after parameter updates)."""
+        with torch.no_grad():
+            self._packed = self.world_model.pack_dynamics()
+
+    def reset(self, batch_size: int | None = None) -> None:
+        """Clear world state, narrator memory and latency statistics."""
+        if batch_size is not None:
+            self.batch_size = batch_size
+        self.refresh_weights()
+        latent_dim = self.world_model.latent_dim
+        narrator_dim = self.narrator.codes_per_step * self.narrator.code_dim
+
+        self._state = torch.zeros(self.batch_size, latent_dim, device=self.device)
+        self._ring = torch.zeros(self.batch_size, self.narrator.window_size, latent_dim, device=self.device)
+        self._head = 0
+        self._filled = 0
+        self._hidden: torch.Tensor | None = None
+        self._codes = torch.zeros(
+            self.batch_size, self.narrator.codes_per_step, dtype=torch.long, device=self.device
+        )
+        self._narrator_state = torch.zeros(self.batch_size, narrator_dim, device=self.device)
+        self._control: ControlOutput | None = None
+
+        self.ticks = 0
+        self.deadline_misses = 0
+        self._latencies.clear()
+
+    def _window(self) -> torch.Tensor:
+        if self._filled < self.narrator.window_size:
+            return self._ring[:, : self._filled]
+        return self._ring.index_select(1, self._window_order[self._head])
+
+    @torch.no_grad()
+    def tick(self, observation: torch.Tensor, action: torch.Tensor | None = None) -> SessionTick:
+        """Advance one world step with a single observation [B, obs_dim] (or [obs_dim])."""
+        start = time.perf_counter()
+
+        observation = observation.to(self.device)
+        if observation.ndim == 1:
+            observation = observation.unsqueeze(0)
+        if observation.size(0) != self.batch_size:
+            raise ValueError(f"Expected batch size {self.batch_size}, got {observation.size(0)}.")
+        if action is not None:
+            action = action.to(self.device)
+            if action.ndim == 1:
+                action = action.unsqueeze(0)
+
+        input_t = self.input_adapter(observation) if self.input_adapter is not None else observation
+        self._state = self.world_model.step(input_t, self._state, action, packed=self._packed)
+
+        self._ring[:, self._head] = self._state
+        self._head = (self._head + 1) % self.narrator.window_size
+        self._filled = min(self._filled + 1, self.narrator.window_size)
+
+        updated = self.ticks % self.update_stride == 0
+        if updated:
+            out = self.narrator(self._window(), hidden_state=self._hidden)
+            self._hidden = out.hidden_state
+            self._codes = out.code_indices
+            self._narrator_state = out.narrator_state
+            if self.control_head is not None:
+                self._control = self.control_head(self._narrator_state)
+
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+        latency = time.perf_counter() - start
+        missed = latency > self.budget_s
+
+        result = SessionTick(
+            tick=self.ticks,
+            world_state=self._state,
+            narrator_updated=updated,
+            code_indices=self._codes,
+            narrator_state=self._narrator_state,
+            control=self._control,
+            latency_s=latency,
+            deadline_missed=missed,
+        )
+        self.ticks += 1
+        self.deadline_misses += int(missed)
+        self._latencies.append(latency)
+        return result
+
+    def latency_report(self) -> LatencyReport:
+        """Summarise per-tick latency over the most recent ``latency_window`` ticks."""
+        if not self._latencies:
+            return LatencyReport(
+                ticks=self.ticks,
+                deadline_misses=self.deadline_misses,
+                budget_ms=1e3 * self.budget_s,
+                mean_ms=0.0, p50_ms=0.0, p90_ms=0.0, p99_ms=0.0, max_ms=0.0,
+            )
+        ms = 1e3 * np.asarray(self._latencies, dtype=np.float64)
+        p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+        return LatencyReport(
+            ticks=self.ticks,
+            deadline_misses=self.deadline_misses,
+            budget_ms=1e3 * self.budget_s,
+            mean_ms=float(ms.mean()),
+            p50_ms=float(p50),
+            p90_ms=float(p90),
+            p99_ms=float(p99),
+            max_ms=float(ms.max()),
+        )
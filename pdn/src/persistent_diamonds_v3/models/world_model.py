@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import math
 from dataclasses import dataclass
 from typing import Iterable
 
 import torch
+import torch.nn.functional as F
 from torch import nn
+from torch.utils.checkpoint import checkpoint
 
 
 @dataclass(slots=True)
@@ -13,6 +16,23 @@ class WorldModelOutput:
     final_state: torch.Tensor
 
 
+@dataclass(slots=True)
+class _PackedDynamics:
+    """All module weights packed for one batched matmul per layer.
+
+    Module slices are zero-padded to the widest module so every module
+    shares the same ``[M, W, ...]`` layout.
+    """
+
+    input_weight: torch.Tensor  # [M*H, I]
+    action_weight: torch.Tensor | None  # [M*H, A]
+    bias: torch.Tensor  # [M*H]
+    state_weight: torch.Tensor  # [M, W, H]
+    local_state_weights: tuple[torch.Tensor, ...]  # per module [H, width_m]
+    out_weight: torch.Tensor  # [M, H, W]
+    out_bias: torch.Tensor  # [M, 1, W]
+
+
 class ModuleDynamics(nn.Module):
     """Single module dynamics for an overlapping state slice."""
 
@@ -47,12 +67,21 @@ class ModularSSMWorldModel(nn.Module):
         overlap_ratio: float,
         hidden_dim: int,
         action_dim: int = 0,
+        *,
+        fused: bool = False,
     ):
         super().__init__()
         self.input_dim = input_dim
         self.latent_dim = latent_dim
         self.module_count = module_count
+        self.hidden_dim = hidden_dim
         self.action_dim = action_dim
+        # Fused mode runs all module dynamics as one batched matmul per layer.
+        self.fused = fused
+        # Time-axis activation checkpointing; see ``set_time_checkpointing``.
+        self.time_checkpointing = False
+        self.checkpoint_segment_steps: int | None = None
+        self.checkpoint_memory_mb: float | None = None
 
         self.module_slices = self._build_module_slices(latent_dim, module_count, overlap_ratio)
         self.modules_dyn = nn.ModuleList(
@@ -74,6 +103,22 @@ class ModularSSMWorldModel(nn.Module):
 
         self.register_buffer("_persistent_state", torch.zeros(1, latent_dim), persistent=False)
 
+        # Overlap normalisation and packed slice indices depend only on the
+        # slice layout, so they are computed once.  Non-persistent buffers keep
+        # state_dicts unchanged.
+        counts = torch.zeros(latent_dim)
+        for start, end in self.module_slices:
+            counts[start:end] += 1.0
+        counts = torch.where(counts == 0, torch.ones_like(counts), counts)
+        self.register_buffer("_overlap_counts", counts, persistent=False)
+
+        max_width = max(end - start for start, end in self.module_slices)
+        # Padded slots point at an extra always-zero column (index latent_dim).
+        packed_index = torch.full((len(self.module_slices), max_width), latent_dim, dtype=torch.long)
+        for idx, (start, end) in enumerate(self.module_slices):
+            packed_index[idx, : end - start] = torch.arange(start, end)
+        self.register_buffer("_packed_index", packed_index, persistent=False)
+
     @staticmethod
     def _build_module_slices(
         latent_dim: int,
@@ -103,44 +148,207 @@ class ModularSSMWorldModel(nn.Module):
     def decay(self) -> torch.Tensor:
         return torch.sigmoid(self._decay_raw)
 
+    def set_time_checkpointing(
+        self,
+        enabled: bool = True,
+        *,
+        segment_steps: int | None = None,
+        memory_budget_mb: float | None = None,
+    ) -> None:
+        """Checkpoint the recurrence along time instead of keeping every step.
+
+        Under autograd, ``forward`` then keeps only the state entering each
+        segment of ``segment_steps`` steps and recomputes one segment at a
+        time during backward (about one extra forward pass).  Without
+        ``segment_steps`` the length is chosen per call: the longest segment
+        whose activations fit ``memory_budget_mb``, else ``ceil(sqrt(T))``.
+        """
+        self.time_checkpointing = enabled
+        self.checkpoint_segment_steps = segment_steps
+        self.checkpoint_memory_mb = memory_budget_mb
+
+    def _segment_steps(self, batch: int, steps: int, dtype: torch.dtype) -> int:
+        if self.checkpoint_segment_steps:
+            return max(1, min(steps, self.checkpoint_segment_steps))
+        if self.checkpoint_memory_mb:
+            # Per-step autograd activations: the [M, B, H] input projection,
+            # hidden layer and SiLU, the [M, B, W] local states and updates,
+            # and a few [B, D].
+            modules, width = self._packed_index.shape
+            per_step = torch.finfo(dtype).bits // 8 * batch * (
+                3 * modules * self.hidden_dim + 2 * modules * width + 4 * self.latent_dim
+            )
+            return max(1, min(steps, int(self.checkpoint_memory_mb * 2**20) // per_step))
+        return math.isqrt(max(steps - 1, 0)) + 1
+
     def reset_persistent_state(self, batch_size: int = 1, device: torch.device | None = None) -> None:
         state = torch.zeros(batch_size, self.latent_dim, device=device or self._persistent_state.device)
         self._persistent_state = state
 
+    def pack_dynamics(self) -> _PackedDynamics:
+        """Stack per-module weights into padded tensors (differentiable).
+
+        Pass the result to repeated :meth:`step` calls as ``packed=``; it
+        reflects the weights at packing time, so re-pack after updates.
+        """
+        modules = list(self.modules_dyn)
+        width = self._packed_index.size(1)
+        input_dim = self.input_dim
+
+        input_weights: list[torch.Tensor] = []
+        action_weights: list[torch.Tensor] = []
+        biases: list[torch.Tensor] = []
+        state_weights: list[torch.Tensor] = []
+        local_state_weights: list[torch.Tensor] = []
+        out_weights: list[torch.Tensor] = []
+        out_biases: list[torch.Tensor] = []
+
+        for (start, end), module in zip(self.module_slices, modules, strict=True):
+            local = end - start
+            first, second = module.net[0], module.net[2]
+            input_weights.append(first.weight[:, :input_dim])
+            if self.action_dim > 0:
+                action_weights.append(first.weight[:, input_dim + local :])
+            biases.append(first.bias)
+            local_state_weights.append(first.weight[:, input_dim : input_dim + local])
+            state_weights.append(F.pad(local_state_weights[-1].T, (0, 0, 0, width - local)))
+            out_weights.append(F.pad(second.weight.T, (0, width - local)))
+            out_biases.append(F.pad(second.bias, (0, width - local)))
+
+        return _PackedDynamics(
+            input_weight=torch.cat(input_weights, dim=0),
+            action_weight=torch.cat(action_weights, dim=0) if action_weights else None,
+            bias=torch.cat(biases, dim=0),
+            state_weight=torch.stack(state_weights, dim=0),
+            local_state_weights=tuple(local_state_weights),
+            out_weight=torch.stack(out_weights, dim=0),
+            out_bias=torch.stack(out_biases, dim=0).unsqueeze(1),
+        )
+
+    def _project_inputs(
+        self,
+        packed: _PackedDynamics,
+        inputs: torch.Tensor,
+        actions: torch.Tensor | None,
+    ) -> torch.Tensor:
+        """State-independent part of every module's first layer, shaped [..., M, H].
+
+        A missing action contributes exactly zero, so it is skipped.
+        """
+        projected = F.linear(inputs, packed.input_weight, packed.bias)
+        if actions is not None and packed.action_weight is not None:
+            projected = projected + F.linear(actions, packed.action_weight)
+        return projected.unflatten(-1, (self._packed_index.size(0), -1))
+
+    def _fused_update(
+        self,
+        packed: _PackedDynamics,
+        projected_t: torch.Tensor,
+        state_t: torch.Tensor,
+    ) -> torch.Tensor:
+        batch = state_t.size(0)
+        modules, width = self._packed_index.shape
+
+        padded_state = F.pad(state_t, (0, 1))
+        local_states = padded_state[:, self._packed_index].transpose(0, 1)
+        hidden = torch.baddbmm(projected_t.transpose(0, 1), local_states, packed.state_weight)
+        local_updates = torch.baddbmm(packed.out_bias, F.silu(hidden), packed.out_weight)
+
+        updates = state_t.new_zeros(batch, self.latent_dim + 1)
+        updates.index_add_(
+            1,
+            self._packed_index.flatten(),
+            local_updates.transpose(0, 1).reshape(batch, modules * width),
+        )
+        return updates[:, : self.latent_dim]
+
+    def _looped_update(
+        self,
+        packed: _PackedDynamics,
+        projected_t: torch.Tensor,
+        state_t: torch.Tensor,
+    ) -> torch.Tensor:
+        updates = torch.zeros_like(state_t)
+        for (start, end), module, local_weight, projected_m in zip(
+            self.module_slices,
+            self.modules_dyn,
+            packed.local_state_weights,
+            projected_t.unbind(1),
+            strict=True,
+        ):
+            hidden = projected_m + F.linear(state_t[:, start:end], local_weight)
+            updates[:, start:end] += module.net[2](module.net[1](hidden))
+        return updates
+
+    def _advance(
+        self,
+        packed: _PackedDynamics,
+        projected_t: torch.Tensor,
+        state_t: torch.Tensor,
+        decay: torch.Tensor,
+    ) -> torch.Tensor:
+        """One recurrence step given the precomputed input projection."""
+        if self.fused:
+            updates = self._fused_update(packed, projected_t, state_t)
+        else:
+            updates = self._looped_update(packed, projected_t, state_t)
+        return self._blend(updates, state_t, decay)
+
+    def _blend(self, updates: torch.Tensor, state_t: torch.Tensor, decay: torch.Tensor) -> torch.Tensor:
+        mean_update = updates / self._overlap_counts.to(dtype=updates.dtype).unsqueeze(0)
+        return decay * state_t + (1.0 - decay) * mean_update
+
+    def _module_update(
+        self,
+        input_t: torch.Tensor,
+        state_t: torch.Tensor,
+        action_t: torch.Tensor | None,
+    ) -> torch.Tensor:
+        """Per-module updates straight from the Linear layers, without packing."""
+        if action_t is None and self.action_dim > 0:
+            # A missing action contributes zero, as in the packed paths.
+            action_t = input_t.new_zeros(input_t.size(0), self.action_dim)
+        updates = torch.zeros_like(state_t)
+        for (start, end), module in zip(self.module_slices, self.modules_dyn, strict=True):
+            updates[:, start:end] += module(input_t, state_t[:, start:end], action_t)
+        return updates
+
     def step(
         self,
         input_t: torch.Tensor,
         state_t: torch.Tensor,
         action_t: torch.Tensor | None = None,
+        *,
+        packed: _PackedDynamics | None = None,
     ) -> torch.Tensor:
         if input_t.ndim != 2 or state_t.ndim != 2:
             raise ValueError("Expected `input_t` and `state_t` as [B, D] tensors.")
         if action_t is not None and action_t.ndim != 2:
             raise ValueError("Expected `action_t` as [B, A] tensor.")
 
-        # When action_dim > 0 but no action is provided, default to zeros.
-        if action_t is None and self.action_dim > 0:
-            action_t = torch.zeros(
-                input_t.size(0), self.action_dim,
-                device=input_t.device, dtype=input_t.dtype,
-            )
-
-        batch = input_t.size(0)
-        updates = torch.zeros(batch, self.latent_dim, device=input_t.device, dtype=input_t.dtype)
-        counts = torch.zeros(self.latent_dim, device=input_t.device, dtype=input_t.dtype)
-
-        for (start, end), module in zip(self.module_slices, self.modules_dyn, strict=True):
-            local_state = state_t[:, start:end]
-            local_update = module(input_t, local_state, action_t)
-            updates[:, start:end] += local_update
-            counts[start:end] += 1.0
-
-        counts = torch.where(counts == 0, torch.ones_like(counts), counts)
-        mean_update = updates / counts.unsqueeze(0)
-
         decay = self.decay.unsqueeze(0).to(dtype=input_t.dtype)
-        next_state = decay * state_t + (1.0 - decay) * mean_update
-        return next_state
+        if packed is None:
+            # Packing every call would cost more than the step itself; callers
+            # stepping repeatedly pack once via ``pack_dynamics``.
+            return self._blend(self._module_update(input_t, state_t, action_t), state_t, decay)
+        projected_t = self._project_inputs(packed, input_t, action_t)
+        return self._advance(packed, projected_t, state_t, decay)
+
+    def _rollout(
+        self,
+        packed: _PackedDynamics,
+        inputs: torch.Tensor,
+        actions: torch.Tensor | None,
+        state_t: torch.Tensor,
+        decay: torch.Tensor,
+    ) -> torch.Tensor:
+        """States ``[B, T, D]`` for ``inputs`` ``[B, T, I]`` from ``state_t``."""
+        projected = self._project_inputs(packed, inputs, actions)
+        state_seq: list[torch.Tensor] = []
+        for projected_t in projected.unbind(1):
+            state_t = self._advance(packed, projected_t, state_t, decay)
+            state_seq.append(state_t)
+        return torch.stack(state_seq, dim=1)
 
     def forward(
         self,
@@ -168,17 +376,53 @@ class ModularSSMWorldModel(nn.Module):
         else:
             state_t = initial_state
 
-        state_seq: list[torch.Tensor] = []
-        for t in range(steps):
-            action_t = actions[:, t] if actions is not None else None
-            state_t = self.step(inputs[:, t], state_t, action_t)
-            state_seq.append(state_t)
+        # Pack once per sequence, and hoist the input/action half of every
+        # first layer out of the recurrence as one [B*T] GEMM; the loop only
+        # runs the state-dependent matmuls.
+        packed = self.pack_dynamics()
+        decay = self.decay.unsqueeze(0).to(dtype=inputs.dtype)
+
+        # Under autograd, per-step slice writes into one buffer would clone the
+        # full gradient at every step, so states are stacked once instead.
+        track_grad = torch.is_grad_enabled() and any(
+            tensor is not None and tensor.requires_grad
+            for tensor in (inputs, actions, state_t, decay, packed.input_weight, packed.bias)
+        )
+        if track_grad and self.time_checkpointing:
+            # Each segment projects its own inputs, so no [B, T, M*H]
+            # projection outlives the segment that uses it.
+            segment = self._segment_steps(batch, steps, inputs.dtype)
+            segments: list[torch.Tensor] = []
+            for start in range(0, steps, segment):
+                window = slice(start, start + segment)
+                segments.append(
+                    checkpoint(
+                        self._rollout,
+                        packed,
+                        inputs[:, window],
+                        actions[:, window] if actions is not None else None,
+                        state_t,
+                        decay,
+                        use_reentrant=False,
+                    )
+                )
+                state_t = segments[-1][:, -1]
+            states = torch.cat(segments, dim=1) if len(segments) > 1 else segments[0]
+        elif track_grad:
+            states = self._rollout(packed, inputs, actions, state_t, decay)
+            state_t = states[:, -1]
+        else:
+            projected = self._project_inputs(packed, inputs, actions)
+            states = inputs.new_empty(batch, steps, self.latent_dim)
+            for t, projected_t in enumerate(projected.unbind(1)):
+                state_t = self._advance(packed, projected_t, state_t, decay)
+                states[:, t] = state_t
 
         final_state = state_t
         if persist_state:
             self._persistent_state = final_state.detach()
 
-        return WorldModelOutput(states=torch.stack(state_seq, dim=1), final_state=final_state)
+        return WorldModelOutput(states=states, final_state=final_state)
 
     def iter_module_views(self, states: torch.Tensor) -> Iterable[torch.Tensor]:
         """Yield per-module views of a latent state tensor [B, T, D] or [B, D]."""
@@ -1,30 +1,42 @@
 from persistent_diamonds_v3.training.distill import (
+    KL_MODES,
     DistillationResult,
     DistillationTrainer,
     NarratorTextDataset,
+    PrefetchBatchSampler,
     build_synthetic_distillation_corpus,
+    load_teacher,
     load_tokenizer,
+    sparse_distillation_losses,
+    teacher_topk_targets,
 )
 from persistent_diamonds_v3.training.infra import (
     apply_activation_checkpointing,
     autocast_context,
     build_accelerator,
     maybe_accumulate_step,
+    prepare_infra,
 )
 from persistent_diamonds_v3.training.stage1 import Stage1JEPATrainer, Stage1Result
 from persistent_diamonds_v3.training.stage2 import Stage2Result, Stage2ShapingTrainer
 from persistent_diamonds_v3.training.stage4 import Stage4EmbodiedTrainer, Stage4Result
 
 __all__ = [
+    "KL_MODES",
     "DistillationResult",
     "DistillationTrainer",
     "NarratorTextDataset",
+    "PrefetchBatchSampler",
     "build_synthetic_distillation_corpus",
+    "load_teacher",
     "load_tokenizer",
+    "sparse_distillation_losses",
+    "teacher_topk_targets",
     "apply_activation_checkpointing",
     "autocast_context",
     "build_accelerator",
     "maybe_accumulate_step",
+    "prepare_infra",
     "Stage1JEPATrainer",
     "Stage1Result",
     "Stage2Result",
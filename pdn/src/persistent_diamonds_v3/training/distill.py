@@ -1,18 +1,38 @@
 from __future__ import annotations
 
 import json
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
 from pathlib import Path
 
 import numpy as np
 import torch
 import torch.nn.functional as F
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.checkpoint import checkpoint
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler, Sampler
 from tqdm.auto import tqdm
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
-from persistent_diamonds_v3.config import DistillationConfig
+from persistent_diamonds_v3.config import DistillationConfig, InfraConfig
+from persistent_diamonds_v3.data.distill_cache import model_fingerprint
+from persistent_diamonds_v3.data.objectives import load_objective_arrays
+from persistent_diamonds_v3.data.prefetch import DevicePrefetcher, loader_options
+from persistent_diamonds_v3.data.teacher_cache import TeacherLogitCache
+from persistent_diamonds_v3.data.tokenized_corpus import (
+    DynamicPaddingCollator,
+    LengthBucketBatchSampler,
+    TokenizedCorpus,
+    tokenize_record,
+)
 from persistent_diamonds_v3.models import DiscreteNarrator, ModularSSMWorldModel, ReportHead
+from persistent_diamonds_v3.training.infra import (
+    autocast_context,
+    maybe_accumulate_step,
+    prepare_infra,
+)
+
+KL_MODES = ("dense", "topk")
 
 
 @dataclass(slots=True)
@@ -23,6 +43,9 @@ class DistillationResult:
     final_loss_kl: float = 0.0
     final_loss_ce: float = 0.0
     final_loss_hidden: float = 0.0
+    # Wall time blocked on the input pipeline vs. spent in training steps.
+    data_wait_seconds: float = 0.0
+    compute_seconds: float = 0.0
 
 
 def build_synthetic_distillation_corpus(
@@ -34,7 +57,7 @@ def build_synthetic_distillation_corpus(
 ) -> Path:
     """Generate a reusable code->text corpus from objective trajectories."""
 
-    payload = np.load(objective_npz_path)
+    payload = load_objective_arrays(objective_npz_path)
     observations = payload["observations"]
     task_signal = payload["task_signal"]
 
@@ -68,6 +91,19 @@ def build_synthetic_distillation_corpus(
 
 
 class NarratorTextDataset(Dataset):
+    """Corpus records with narrator codes encoded on the fly.
+
+    Codes are memoized per ``(trajectory_index, model fingerprint)`` in a
+    bounded LRU of ``code_memo_size`` trajectories (0 disables it), so a
+    trajectory shared by many records, or revisited next epoch, is encoded
+    once.  :meth:`prefetch` encodes the misses for upcoming records in
+    micro-batches of ``encode_batch_size``; :class:`PrefetchBatchSampler`
+    drives it from the batch order.  The memo lives in this process, so
+    :class:`DistillationTrainer` only prefetches with ``num_workers=0``.
+    Observations are read per encoded batch from the objective store,
+    which stays memory-mapped (``.npy``) or compressed (chunked).
+    """
+
     def __init__(
         self,
         corpus_path: str | Path,
@@ -78,10 +114,19 @@ class NarratorTextDataset(Dataset):
         *,
         device: str,
         max_text_length: int = 256,
+        tokenized_corpus: TokenizedCorpus | None = None,
+        code_memo_size: int = 1024,
+        encode_batch_size: int = 64,
     ):
         self.records = [json.loads(line) for line in Path(corpus_path).read_text().splitlines() if line.strip()]
-        payload = np.load(objective_npz_path)
-        self.observations = torch.from_numpy(payload["observations"]).float()
+        if tokenized_corpus is not None and len(tokenized_corpus) != len(self.records):
+            raise ValueError(
+                f"Tokenized corpus has {len(tokenized_corpus)} items but corpus has "
+                f"{len(self.records)} records — cache is stale."
+            )
+        self.tokenized_corpus = tokenized_corpus
+        self.objective_path = Path(objective_npz_path)
+        self._open_observations()
 
         self.world_model = world_model.to(device).eval()
         self.narrator = narrator.to(device).eval()
@@ -89,43 +134,265 @@ class NarratorTextDataset(Dataset):
         self.max_text_length = max_text_length
         self.device = torch.device(device)
 
+        self.code_memo_size = code_memo_size
+        self.encode_batch_size = encode_batch_size
+        self._code_memo: OrderedDict[tuple[int, str], torch.Tensor] = OrderedDict()
+
+    def _open_observations(self) -> None:
+        # Memory-mapped (.npy) or chunk-compressed stores stay on disk; only
+        # the rows being encoded are read.
+        self.observations = load_objective_arrays(self.objective_path, derive=False)["observations"]
+
     def __len__(self) -> int:
         return len(self.records)
 
+    @property
+    def lengths(self) -> np.ndarray | None:
+        """Per-record token counts when pre-tokenized (for length bucketing)."""
+        return self.tokenized_corpus.lengths if self.tokenized_corpus is not None else None
+
     @torch.no_grad()
-    def _encode_codes(self, trajectory_index: int) -> torch.Tensor:
-        obs = self.observations[trajectory_index : trajectory_index + 1].to(self.device)
+    def _encode_batch(self, trajectory_indices: list[int]) -> torch.Tensor:
+        rows = np.asarray(self.observations[trajectory_indices], dtype=np.float32)
+        obs = torch.from_numpy(rows).to(self.device)
         world = self.world_model(obs)
-        states = world.states
+        out = self.narrator.forward_all_windows(world.states)
+        return out.code_indices.cpu()
+
+    def _remember(self, key: tuple[int, str], codes: torch.Tensor) -> None:
+        if self.code_memo_size <= 0:
+            return
+        self._code_memo[key] = codes
+        self._code_memo.move_to_end(key)
+        while len(self._code_memo) > self.code_memo_size:
+            self._code_memo.popitem(last=False)
+
+    def prefetch(self, indices: list[int]) -> None:
+        """Encode, in micro-batches, every not-yet-memoized trajectory of ``indices``."""
+        if self.code_memo_size <= 0:
+            return
+        fingerprint = model_fingerprint(self.world_model, self.narrator)
+        missing = list(
+            dict.fromkeys(
+                int(self.records[i]["trajectory_index"])
+                for i in indices
+                if (int(self.records[i]["trajectory_index"]), fingerprint) not in self._code_memo
+            )
+        )
+        for start in range(0, len(missing), self.encode_batch_size):
+            chunk = missing[start : start + self.encode_batch_size]
+            for traj, codes in zip(chunk, self._encode_batch(chunk)):
+                self._remember((traj, fingerprint), codes)
 
-        indices = []
-        for t in range(states.size(1)):
-            start = max(0, t + 1 - self.narrator.window_size)
-            out = self.narrator(states[:, start : t + 1])
-            indices.append(out.code_indices)
-        code_seq = torch.stack(indices, dim=1).squeeze(0).cpu()
-        return code_seq
+    def _encode_codes(self, trajectory_index: int) -> torch.Tensor:
+        key = (trajectory_index, model_fingerprint(self.world_model, self.narrator))
+        codes = self._code_memo.get(key)
+        if codes is None:
+            codes = self._encode_batch([trajectory_index])[0]
+            self._remember(key, codes)
+        else:
+            self._code_memo.move_to_end(key)
+        return codes
+
+    def codes(self, idx: int) -> torch.Tensor:
+        """Code indices of record ``idx`` without tokenizing its text."""
+        return self._encode_codes(int(self.records[idx]["trajectory_index"]))
+
+    def __getstate__(self) -> dict[str, object]:
+        # Workers reopen the observation store rather than unpickling a copy.
+        state = dict(self.__dict__)
+        if self.objective_path.is_dir():
+            del state["observations"]
+        return state
+
+    def __setstate__(self, state: dict[str, object]) -> None:
+        self.__dict__.update(state)
+        if "observations" not in state:
+            self._open_observations()
 
     def __getitem__(self, idx: int) -> dict[str, torch.Tensor]:
-        record = self.records[idx]
-        codes = self._encode_codes(int(record["trajectory_index"]))
-        tokenized = self.tokenizer(
-            record["text"],
-            truncation=True,
-            max_length=self.max_text_length,
-            padding="max_length",
-            return_tensors="pt",
-        )
-
         return {
-            "code_indices": codes,
-            "input_ids": tokenized["input_ids"].squeeze(0),
-            "attention_mask": tokenized["attention_mask"].squeeze(0),
+            "code_indices": self.codes(idx),
+            **tokenize_record(
+                self.records[idx]["text"],
+                idx,
+                self.tokenizer,
+                self.tokenized_corpus,
+                max_text_length=self.max_text_length,
+            ),
         }
 
 
+class PrefetchBatchSampler(Sampler[list[int]]):
+    """Wrap a batch sampler and call ``prefetch`` on upcoming batches.
+
+    Every ``lookahead`` batches, the union of their indices is handed to
+    ``prefetch`` before they are yielded, so on-the-fly encoders can fill
+    their cache in large micro-batches instead of one item at a time.
+    """
+
+    def __init__(self, batch_sampler, prefetch, *, lookahead: int = 4):
+        self.batch_sampler = batch_sampler
+        self.prefetch = prefetch
+        self.lookahead = lookahead
+
+    def __len__(self) -> int:
+        return len(self.batch_sampler)
+
+    def __iter__(self):
+        window: list[list[int]] = []
+        for batch in self.batch_sampler:
+            window.append(list(batch))
+            if len(window) == self.lookahead:
+                self.prefetch([i for b in window for i in b])
+                yield from window
+                window = []
+        if window:
+            self.prefetch([i for b in window for i in b])
+            yield from window
+
+
+@torch.no_grad()
+def teacher_topk_targets(
+    teacher_logits: torch.Tensor,
+    top_k: int,
+    *,
+    temperature: float,
+    chunk_size: int = 1024,
+) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Top-k teacher logits, their indices and ``logsumexp(logits / T)``.
+
+    Rows are processed ``chunk_size`` positions at a time so no float32 copy
+    of the full ``[B, T, V]`` teacher logits is made.  Pass contiguous
+    logits: flattening a strided view copies it whole.
+    """
+    lead = teacher_logits.shape[:-1]
+    flat = teacher_logits.reshape(-1, teacher_logits.size(-1))
+    values, indices, lse = [], [], []
+    for start in range(0, flat.size(0), chunk_size):
+        chunk = flat[start : start + chunk_size].float()
+        v, i = chunk.topk(top_k, dim=-1)
+        values.append(v)
+        indices.append(i)
+        lse.append(torch.logsumexp(chunk / temperature, dim=-1))
+    return (
+        torch.cat(values).reshape(*lead, top_k),
+        torch.cat(indices).reshape(*lead, top_k),
+        torch.cat(lse).reshape(lead),
+    )
+
+
+def _sparse_chunk_losses(
+    hidden: torch.Tensor,
+    lm_head_weight: torch.Tensor,
+    labels: torch.Tensor,
+    teacher_topk_logits: torch.Tensor,
+    teacher_topk_indices: torch.Tensor,
+    teacher_logsumexp: torch.Tensor | None,
+    position_mask: torch.Tensor | None,
+    *,
+    temperature: float,
+    ignore_index: int,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    logits = (hidden @ lm_head_weight.t()).float()
+    scaled = logits / temperature
+    student_topk = scaled.gather(-1, teacher_topk_indices) - torch.logsumexp(
+        scaled, dim=-1, keepdim=True
+    )
+
+    teacher_scaled = teacher_topk_logits.float() / temperature
+    if teacher_logsumexp is None:
+        teacher_topk = F.log_softmax(teacher_scaled, dim=-1)
+    else:
+        teacher_topk = teacher_scaled - teacher_logsumexp.float().unsqueeze(-1)
+    teacher_probs = teacher_topk.exp()
+
+    # KL over the top-k support plus one bucket holding the remaining mass.
+    kl_rows = (teacher_probs * (teacher_topk - student_topk)).sum(dim=-1)
+    teacher_tail = (1.0 - teacher_probs.sum(dim=-1)).clamp_min(0.0)
+    student_tail = (1.0 - student_topk.exp().sum(dim=-1)).clamp_min(1e-8)
+    kl_rows = kl_rows + torch.xlogy(teacher_tail, teacher_tail) - teacher_tail * student_tail.log()
+    if position_mask is not None:
+        kl_rows = kl_rows * position_mask
+    kl = kl_rows.sum()
+
+    valid = labels != ignore_index
+    safe_labels = labels.masked_fill(~valid, 0).unsqueeze(-1)
+    ce_rows = torch.logsumexp(logits, dim=-1) - logits.gather(-1, safe_labels).squeeze(-1)
+    ce = (ce_rows * valid).sum()
+    return kl, ce
+
+
+def sparse_distillation_losses(
+    student_hidden: torch.Tensor,
+    lm_head_weight: torch.Tensor,
+    labels: torch.Tensor,
+    teacher_topk_logits: torch.Tensor,
+    teacher_topk_indices: torch.Tensor,
+    teacher_logsumexp: torch.Tensor | None = None,
+    position_mask: torch.Tensor | None = None,
+    *,
+    temperature: float,
+    chunk_size: int = 1024,
+    ignore_index: int = 0,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """Top-k + tail KL and cross-entropy without full-vocabulary tensors.
+
+    Student logits are projected from ``student_hidden`` ``chunk_size``
+    positions at a time, and each chunk is recomputed in backward, so peak
+    memory scales with ``chunk_size * V`` instead of ``B * T * V``. The
+    teacher keeps only its top-k probabilities plus a tail bucket
+    (``1 - sum(top-k)``, exact when ``teacher_logsumexp`` is given,
+    otherwise the top-k are renormalized and the tail is empty).
+
+    ``position_mask`` (``[B, T]``, 1 = real token) drops KL terms at padded
+    positions, whose teacher targets are filler after dynamic padding.
+
+    Returns ``(kl, ce)`` scaled like the dense losses: KL is summed per
+    batch row and multiplied by ``T^2``; CE is averaged over non-ignored
+    labels.
+    """
+    batch = student_hidden.size(0)
+    top_k = teacher_topk_indices.size(-1)
+    hidden = student_hidden.reshape(-1, student_hidden.size(-1))
+    flat_labels = labels.reshape(-1)
+    topk_logits = teacher_topk_logits.reshape(-1, top_k)
+    topk_indices = teacher_topk_indices.reshape(-1, top_k)
+    lse = teacher_logsumexp.reshape(-1) if teacher_logsumexp is not None else None
+    mask = position_mask.reshape(-1).float() if position_mask is not None else None
+
+    kl = hidden.new_zeros((), dtype=torch.float32)
+    ce = hidden.new_zeros((), dtype=torch.float32)
+    for start in range(0, hidden.size(0), chunk_size):
+        rows = slice(start, start + chunk_size)
+        args = (
+            hidden[rows],
+            lm_head_weight,
+            flat_labels[rows],
+            topk_logits[rows],
+            topk_indices[rows],
+            lse[rows] if lse is not None else None,
+            mask[rows] if mask is not None else None,
+        )
+        kwargs = {"temperature": temperature, "ignore_index": ignore_index}
+        if torch.is_grad_enabled():
+            chunk_kl, chunk_ce = checkpoint(_sparse_chunk_losses, *args, use_reentrant=False, **kwargs)
+        else:
+            chunk_kl, chunk_ce = _sparse_chunk_losses(*args, **kwargs)
+        kl = kl + chunk_kl
+        ce = ce + chunk_ce
+
+    label_count = (flat_labels != ignore_index).sum().clamp_min(1)
+    return kl / batch * (temperature**2), ce / label_count
+
+
 class DistillationTrainer:
-    """Distill report head from Qwen3-8B teacher (or configured fallback)."""
+    """Distill report head from Qwen3-8B teacher (or configured fallback).
+
+    Pass ``teacher_cache`` (from ``pdv3 cache-teacher``) to train from stored
+    top-k teacher logits instead of running the teacher every step.
+    ``kl_mode="topk"`` (implied by a cache) uses :func:`sparse_distillation_losses`.
+    """
 
     def __init__(
         self,
@@ -133,18 +400,39 @@ class DistillationTrainer:
         config: DistillationConfig,
         *,
         device: str,
+        teacher_cache: TeacherLogitCache | None = None,
+        infra: InfraConfig | None = None,
     ):
+        if config.kl_mode not in KL_MODES:
+            raise ValueError(f"Unknown kl_mode {config.kl_mode!r}. Choose from {KL_MODES}.")
         self.device = torch.device(device)
         self.report_head = report_head.to(self.device)
         self.config = config
+        self.teacher_cache = teacher_cache
+        self.infra = infra or InfraConfig()
 
-        self.teacher_model, self.teacher_name = self._load_teacher(config)
-        self.teacher_model.to(self.device).eval()
+        # With an offline cache the teacher is never loaded; batches carry its targets.
+        if teacher_cache is None:
+            self.teacher_model, self.teacher_name = self._load_teacher(config)
+            self.teacher_model.to(self.device).eval()
+            teacher_dim = self.teacher_model.config.hidden_size
+        else:
+            if config.hidden_alignment and not teacher_cache.hidden_layers:
+                raise ValueError(
+                    "hidden_alignment is enabled but the teacher cache stores no hidden layers."
+                )
+            if teacher_cache.temperature != config.temperature:
+                raise ValueError(
+                    f"Teacher cache was built at temperature {teacher_cache.temperature}, "
+                    f"but distillation uses {config.temperature}."
+                )
+            self.teacher_model = None
+            self.teacher_name = teacher_cache.teacher_name
+            teacher_dim = teacher_cache.hidden_size
 
         # Optional hidden-state alignment projection (teacher_dim -> student_dim)
         self.hidden_projection: torch.nn.Linear | None = None
         if config.hidden_alignment:
-            teacher_dim = self.teacher_model.config.hidden_size
             student_dim = report_head.model_dim
             proj_dim = config.hidden_projection_dim
             self.hidden_projection = torch.nn.Sequential(
@@ -162,41 +450,68 @@ class DistillationTrainer:
             lr=config.learning_rate,
             weight_decay=1e-2,
         )
+        modules = [self.report_head]
+        if self.hidden_projection is not None:
+            modules.append(self.hidden_projection)
+        self.device, self.optimizer, self.accelerator = prepare_infra(
+            self.infra, self.device, modules, self.optimizer
+        )
 
     def _load_teacher(self, config: DistillationConfig):
-        candidates = [config.teacher_model_name, *config.teacher_model_fallbacks]
-        errors: list[str] = []
-
-        for model_name in candidates:
-            try:
-                kwargs = {}
-                if self.device.type == "cuda":
-                    kwargs["torch_dtype"] = torch.bfloat16
-                    if config.use_flash_attention_if_available:
-                        kwargs["attn_implementation"] = "flash_attention_2"
-                teacher = AutoModelForCausalLM.from_pretrained(model_name, **kwargs)
-                return teacher, model_name
-            except Exception as exc:  # pragma: no cover - depends on runtime/model availability.
-                errors.append(f"{model_name}: {exc}")
-
-        detail = "\n".join(errors)
-        raise RuntimeError(f"Failed to load teacher model candidates.\n{detail}")
-
-    def train(self, dataset: Dataset) -> DistillationResult:
+        return load_teacher(config, device=str(self.device))
+
+    def _batch_sampler(self, dataset: Dataset, num_workers: int):
+        lengths = getattr(dataset, "lengths", None)
+        if self.config.length_bucketing and lengths is not None:
+            batch_sampler = LengthBucketBatchSampler(lengths, self.config.batch_size)
+        else:
+            batch_sampler = BatchSampler(
+                RandomSampler(dataset), self.config.batch_size, drop_last=False
+            )
+        # Workers hold their own copy of the dataset, so prefetching in this
+        # process would encode every batch twice and warm a memo no worker reads.
+        if num_workers == 0 and hasattr(dataset, "prefetch"):
+            batch_sampler = PrefetchBatchSampler(batch_sampler, dataset.prefetch)
+        return batch_sampler
+
+    def train(
+        self,
+        dataset: Dataset,
+        *,
+        num_workers: int = 0,
+        prefetch_factor: int | None = None,
+        persistent_workers: bool = False,
+        device_prefetch: int = 0,
+    ) -> DistillationResult:
         if len(dataset) == 0:
             raise ValueError("Distillation received an empty dataset.")
-        loader = DataLoader(dataset, batch_size=self.config.batch_size, shuffle=True, drop_last=False)
+        loader = DataLoader(
+            dataset,
+            batch_sampler=self._batch_sampler(dataset, num_workers),
+            collate_fn=DynamicPaddingCollator(),
+            **loader_options(
+                num_workers,
+                prefetch_factor=prefetch_factor,
+                persistent_workers=persistent_workers,
+                pin_memory=self.device.type == "cuda",
+            ),
+        )
+        pipeline = DevicePrefetcher(loader, self.device, depth=device_prefetch)
         final_loss = 0.0
         final_loss_kl = 0.0
         final_loss_ce = 0.0
         final_loss_hidden = 0.0
         steps = 0
+        micro_steps = 0
 
         use_hidden = self.config.hidden_alignment and self.hidden_projection is not None
+        # Cached teacher targets are already top-k, so they always use the sparse path.
+        use_sparse = self.teacher_model is None or self.config.kl_mode == "topk"
 
         progress = tqdm(total=self.config.max_steps, desc="stage3-distill")
+        start = time.perf_counter()
         while steps < self.config.max_steps:
-            for batch in loader:
+            for batch in pipeline:
                 if steps >= self.config.max_steps:
                     break
 
@@ -204,70 +519,122 @@ class DistillationTrainer:
                 input_ids = batch["input_ids"].to(self.device)
                 attention_mask = batch["attention_mask"].to(self.device)
 
-                with torch.no_grad():
-                    teacher_out = self.teacher_model(
-                        input_ids=input_ids,
-                        attention_mask=attention_mask,
-                        output_hidden_states=use_hidden,
-                    )
-                    teacher_logits = teacher_out.logits
-
-                student_logits = self.report_head(
-                    code_indices=code_indices,
-                    input_ids=input_ids,
-                    attention_mask=attention_mask,
-                )
-
-                student_step = student_logits[:, :-1]
-                teacher_step = teacher_logits[:, :-1]
-                labels = input_ids[:, 1:]
-
-                temp = self.config.temperature
-                loss_kl = F.kl_div(
-                    F.log_softmax(student_step / temp, dim=-1),
-                    F.softmax(teacher_step / temp, dim=-1),
-                    reduction="batchmean",
-                ) * (temp**2)
-
-                loss_ce = F.cross_entropy(
-                    student_step.reshape(-1, student_step.size(-1)),
-                    labels.reshape(-1),
-                    ignore_index=0,
-                )
+                with autocast_context(self.device, self.infra):
+                    teacher_hidden = None
+                    teacher_logits = None
+                    if self.teacher_model is not None:
+                        with torch.no_grad():
+                            teacher_out = self.teacher_model(
+                                input_ids=input_ids,
+                                attention_mask=attention_mask,
+                                output_hidden_states=use_hidden,
+                            )
+                            teacher_logits = teacher_out.logits
+                        if use_hidden:
+                            # Use the middle teacher hidden layer as the alignment target
+                            teacher_hidden_states = teacher_out.hidden_states
+                            mid_layer = len(teacher_hidden_states) // 2
+                            teacher_hidden = teacher_hidden_states[mid_layer].detach()
+                    elif use_hidden:
+                        teacher_hidden = batch["teacher_hidden"].to(self.device)
+
+                    labels = input_ids[:, 1:]
+                    temp = self.config.temperature
+
+                    if use_sparse:
+                        if teacher_logits is not None:
+                            # Select on the contiguous logits and trim the last
+                            # position afterwards: reshaping a [:, :-1] view
+                            # would copy the whole [B, T-1, V] tensor.
+                            topk_logits, topk_indices, teacher_lse = (
+                                target[:, :-1]
+                                for target in teacher_topk_targets(
+                                    teacher_logits,
+                                    self.config.teacher_top_k,
+                                    temperature=temp,
+                                    chunk_size=self.config.loss_chunk_size,
+                                )
+                            )
+                            del teacher_logits
+                        else:
+                            topk_logits = batch["teacher_topk_logits"][:, :-1].to(self.device)
+                            topk_indices = batch["teacher_topk_indices"][:, :-1].to(self.device)
+                            teacher_lse = batch["teacher_logsumexp"][:, :-1].to(self.device)
+
+                        student_hidden = self.report_head.forward_hidden(
+                            code_indices,
+                            input_ids,
+                            attention_mask=attention_mask,
+                        )
+                        loss_kl, loss_ce = sparse_distillation_losses(
+                            student_hidden[:, :-1],
+                            self.report_head.lm_head.weight,
+                            labels,
+                            topk_logits,
+                            topk_indices,
+                            teacher_lse,
+                            attention_mask[:, 1:],
+                            temperature=temp,
+                            chunk_size=self.config.loss_chunk_size,
+                        )
+                    else:
+                        student_logits = self.report_head(
+                            code_indices=code_indices,
+                            input_ids=input_ids,
+                            attention_mask=attention_mask,
+                        )
+
+                        student_step = student_logits[:, :-1]
+                        teacher_step = teacher_logits[:, :-1]
+                        loss_kl = F.kl_div(
+                            F.log_softmax(student_step / temp, dim=-1),
+                            F.softmax(teacher_step / temp, dim=-1),
+                            reduction="batchmean",
+                        ) * (temp**2)
+
+                        loss_ce = F.cross_entropy(
+                            student_step.reshape(-1, student_step.size(-1)),
+                            labels.reshape(-1),
+                            ignore_index=0,
+                        )
+
+                    loss = self.config.alpha_kl * loss_kl + self.config.alpha_ce * loss_ce
+
+                    # Optional intermediate hidden-state alignment
+                    loss_hidden = torch.tensor(0.0, device=self.device)
+                    if use_hidden:
+                        projected = self.hidden_projection(teacher_hidden)
+
+                        # Get student decoder's internal representation via the code memory
+                        # Align on the shared sequence dimension (truncate to match)
+                        student_memory = self.report_head.code_embedding(code_indices).mean(dim=2)
+                        min_len = min(projected.size(1), student_memory.size(1))
+                        loss_hidden = F.mse_loss(
+                            student_memory[:, :min_len],
+                            projected[:, :min_len],
+                        )
+                        loss = loss + self.config.alpha_hidden * loss_hidden
 
-                loss = self.config.alpha_kl * loss_kl + self.config.alpha_ce * loss_ce
-
-                # Optional intermediate hidden-state alignment
-                loss_hidden = torch.tensor(0.0, device=self.device)
-                if use_hidden:
-                    # Use the middle teacher hidden layer as the alignment target
-                    teacher_hidden_states = teacher_out.hidden_states
-                    mid_layer = len(teacher_hidden_states) // 2
-                    teacher_hidden = teacher_hidden_states[mid_layer].detach()
-                    projected = self.hidden_projection(teacher_hidden)
-
-                    # Get student decoder's internal representation via the code memory
-                    # Align on the shared sequence dimension (truncate to match)
-                    student_memory = self.report_head.code_embedding(code_indices).mean(dim=2)
-                    min_len = min(projected.size(1), student_memory.size(1))
-                    loss_hidden = F.mse_loss(
-                        student_memory[:, :min_len],
-                        projected[:, :min_len],
-                    )
-                    loss = loss + self.config.alpha_hidden * loss_hidden
-
-                self.optimizer.zero_grad(set_to_none=True)
-                loss.backward()
                 clip_params = list(self.report_head.parameters())
                 if self.hidden_projection is not None:
                     clip_params += list(self.hidden_projection.parameters())
-                torch.nn.utils.clip_grad_norm_(clip_params, self.config.gradient_clip_norm)
-                self.optimizer.step()
-
+                stepped = maybe_accumulate_step(
+                    self.optimizer,
+                    loss,
+                    micro_steps,
+                    self.infra,
+                    max_grad_norm=self.config.gradient_clip_norm,
+                    parameters=clip_params,
+                    accelerator=self.accelerator,
+                )
+                micro_steps += 1
                 final_loss = float(loss.item())
                 final_loss_kl = float(loss_kl.item())
                 final_loss_ce = float(loss_ce.item())
                 final_loss_hidden = float(loss_hidden.item())
+                if not stepped:
+                    continue
+
                 steps += 1
                 progress.update(1)
                 progress.set_postfix(loss=f"{final_loss:.4f}", teacher=self.teacher_name)
@@ -276,6 +643,7 @@ class DistillationTrainer:
                     break
 
         progress.close()
+        elapsed = time.perf_counter() - start
         return DistillationResult(
             final_loss=final_loss,
             teacher_model_name=self.teacher_name,
@@ -283,9 +651,32 @@ class DistillationTrainer:
             final_loss_kl=final_loss_kl,
             final_loss_ce=final_loss_ce,
             final_loss_hidden=final_loss_hidden,
+            data_wait_seconds=pipeline.wait_seconds,
+            compute_seconds=elapsed - pipeline.wait_seconds,
         )
 
 
+def load_teacher(config: DistillationConfig, *, device: str = "cpu"):
+    """Load the first available teacher candidate; returns ``(model, name)``."""
+    candidates = [config.teacher_model_name, *config.teacher_model_fallbacks]
+    errors: list[str] = []
+
+    for model_name in candidates:
+        try:
+            kwargs = {}
+            if torch.device(device).type == "cuda":
+                kwargs["torch_dtype"] = torch.bfloat16
+                if config.use_flash_attention_if_available:
+                    kwargs["attn_implementation"] = "flash_attention_2"
+            teacher = AutoModelForCausalLM.from_pretrained(model_name, **kwargs)
+            return teacher, model_name
+        except Exception as exc:  # pragma: no cover - depends on runtime/model availability.
+            errors.append(f"{model_name}: {exc}")
+
+    detail = "\n".join(errors)
+    raise RuntimeError(f"Failed to load teacher model candidates.\n{detail}")
+
+
 def load_tokenizer(config: DistillationConfig):
     model_name = config.teacher_model_name
     candidates = [model_name, *config.teacher_model_fallbacks]
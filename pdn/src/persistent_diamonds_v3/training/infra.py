@@ -10,6 +10,7 @@ Provides helpers for:
 from __future__ import annotations
 
 import contextlib
+from collections.abc import Iterable, Sequence
 from typing import TYPE_CHECKING
 
 import torch
@@ -37,16 +38,25 @@ def maybe_accumulate_step(
     scaler: torch.amp.GradScaler | None = None,
     max_grad_norm: float | None = None,
     parameters: list[nn.Parameter] | None = None,
+    clip_groups: Sequence[Iterable[nn.Parameter]] = (),
+    accelerator=None,
 ) -> bool:
     """Backward pass with optional gradient accumulation.
 
+    ``clip_groups`` are clipped to ``max_grad_norm`` separately, in
+    addition to ``parameters``.  With an ``accelerator`` the backward pass
+    goes through ``accelerator.backward`` (which applies its own
+    accumulation scaling) and clipping through ``accelerator.clip_grad_norm_``.
+
     Returns *True* when an optimiser step was actually taken (i.e. the
     accumulation boundary was reached).
     """
     accum = max(1, infra.gradient_accumulation_steps)
     scaled_loss = loss / accum
 
-    if scaler is not None:
+    if accelerator is not None:
+        accelerator.backward(loss)
+    elif scaler is not None:
         scaler.scale(scaled_loss).backward()
     else:
         scaled_loss.backward()
@@ -54,15 +64,22 @@ def maybe_accumulate_step(
     if (step + 1) % accum != 0:
         return False
 
+    groups = [list(group) for group in clip_groups]
+    if parameters:
+        groups.append(list(parameters))
+    clip = accelerator.clip_grad_norm_ if accelerator is not None else torch.nn.utils.clip_grad_norm_
+
     if scaler is not None:
-        if max_grad_norm is not None and parameters:
+        if max_grad_norm is not None and groups:
             scaler.unscale_(optimizer)
-            torch.nn.utils.clip_grad_norm_(parameters, max_grad_norm)
+            for group in groups:
+                clip(group, max_grad_norm)
         scaler.step(optimizer)
         scaler.update()
     else:
-        if max_grad_norm is not None and parameters:
-            torch.nn.utils.clip_grad_norm_(parameters, max_grad_norm)
+        if max_grad_norm is not None:
+            for group in groups:
+                clip(group, max_grad_norm)
         optimizer.step()
 
     optimizer.zero_grad(set_to_none=True)
@@ -70,15 +87,30 @@ def maybe_accumulate_step(
 
 
 def apply_activation_checkpointing(model: nn.Module, infra: InfraConfig) -> None:
-    """Wrap eligible sub-modules with activation checkpointing when enabled."""
+    """Wrap eligible sub-modules with activation checkpointing when enabled.
+
+    Recurrent models exposing ``set_time_checkpointing`` (the world model)
+    are additionally checkpointed along time, which is where their
+    activation memory grows.
+    """
     if not infra.activation_checkpointing:
         return
 
+    for module in model.modules():
+        if hasattr(module, "set_time_checkpointing"):
+            module.set_time_checkpointing(
+                segment_steps=infra.checkpoint_segment_steps or None,
+                memory_budget_mb=infra.activation_memory_mb or None,
+            )
+
     from torch.utils.checkpoint import checkpoint  # noqa: F401
 
     # Patch forward methods of nn.Sequential children to use checkpointing.
     for name, module in model.named_modules():
+        if getattr(module, "_activation_checkpointed", False):
+            continue
         if isinstance(module, nn.Sequential) and len(list(module.children())) > 1:
+            module._activation_checkpointed = True
             _orig_forward = module.forward
 
             def _make_ckpt_forward(orig):
@@ -107,3 +139,29 @@ def build_accelerator(infra: InfraConfig):
         gradient_accumulation_steps=infra.gradient_accumulation_steps,
         mixed_precision=mixed_precision,
     )
+
+
+def prepare_infra(
+    infra: InfraConfig,
+    device: torch.device,
+    modules: Sequence[nn.Module],
+    optimizer: torch.optim.Optimizer,
+):
+    """Apply ``infra`` to a trainer's modules and optimiser.
+
+    Enables activation checkpointing on ``modules`` and, with Accelerate,
+    moves them to the accelerator's device and wraps the optimiser.
+    Modules are not wrapped by ``accelerator.prepare`` because trainers
+    call their custom methods (``rollout``, ``step``, ...) directly.
+
+    Returns ``(device, optimizer, accelerator)``; ``accelerator`` is *None*
+    unless ``infra.use_accelerate`` is set.
+    """
+    for module in modules:
+        apply_activation_checkpointing(module, infra)
+    accelerator = build_accelerator(infra)
+    if accelerator is None:
+        return device, optimizer, None
+    for module in modules:
+        module.to(accelerator.device)
+    return accelerator.device, accelerator.prepare(optimizer), accelerator
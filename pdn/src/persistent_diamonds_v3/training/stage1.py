@@ -1,21 +1,35 @@
 from __future__ import annotations
 
 import copy
+import time
 from dataclasses import dataclass
 
 import torch
 import torch.nn.functional as F
 from torch import nn
-from torch.utils.data import DataLoader
+from torch.utils.data import IterableDataset
 from tqdm.auto import tqdm
 
+from persistent_diamonds_v3.config import InfraConfig
+from persistent_diamonds_v3.data.objectives import objective_loader
+from persistent_diamonds_v3.data.prefetch import DevicePrefetcher
 from persistent_diamonds_v3.models import ModularSSMWorldModel
+from persistent_diamonds_v3.training.infra import (
+    autocast_context,
+    maybe_accumulate_step,
+    prepare_infra,
+)
 
 
 @dataclass(slots=True)
 class Stage1Result:
     final_loss: float
     steps: int
+    # Wall time blocked on the input pipeline vs. spent in training steps.
+    data_wait_seconds: float = 0.0
+    compute_seconds: float = 0.0
+    # Loader batches consumed by this run; a stream resumes at ``start_step + batches``.
+    batches: int = 0
 
 
 class Stage1JEPATrainer:
@@ -30,10 +44,12 @@ class Stage1JEPATrainer:
         weight_decay: float,
         device: str,
         ema_decay: float = 0.99,
+        infra: InfraConfig | None = None,
     ):
         self.world_model = world_model.to(device)
         self.device = torch.device(device)
         self.ema_decay = ema_decay
+        self.infra = infra or InfraConfig()
 
         self.target_world_model = copy.deepcopy(world_model).to(device)
         self.target_world_model.eval()
@@ -51,6 +67,10 @@ class Stage1JEPATrainer:
             lr=learning_rate,
             weight_decay=weight_decay,
         )
+        self.device, self.optimizer, self.accelerator = prepare_infra(
+            self.infra, self.device, [self.world_model, self.predictor], self.optimizer
+        )
+        self.target_world_model.to(self.device)
 
     def _update_ema_target(self) -> None:
         with torch.no_grad():
@@ -69,11 +89,32 @@ class Stage1JEPATrainer:
         max_steps: int,
         horizon: int = 4,
         persist_state: bool = True,
+        num_workers: int = 0,
+        prefetch_factor: int | None = None,
+        persistent_workers: bool = False,
+        device_prefetch: int = 0,
+        chunk_length: int | None = None,
+        start_step: int = 0,
     ) -> Stage1Result:
-        if len(dataset) == 0:
+        if not isinstance(dataset, IterableDataset) and len(dataset) == 0:
             raise ValueError("Stage 1 received an empty dataset.")
-        loader = DataLoader(dataset, batch_size=batch_size, shuffle=not persist_state, drop_last=False)
+        if chunk_length and not persist_state:
+            raise ValueError("chunk_length trains with truncated BPTT and needs persist_state=True.")
+        loader = objective_loader(
+            dataset,
+            batch_size=batch_size,
+            # Chunked streams reset at sequence starts, so their order may be shuffled.
+            shuffle=not persist_state or bool(chunk_length),
+            num_workers=num_workers,
+            prefetch_factor=prefetch_factor,
+            persistent_workers=persistent_workers,
+            pin_memory=self.device.type == "cuda",
+            chunk_length=chunk_length,
+            start_step=start_step,
+        )
+        pipeline = DevicePrefetcher(loader, self.device, depth=device_prefetch)
         steps = 0
+        micro_steps = 0
         final_loss = 0.0
 
         if persist_state:
@@ -81,31 +122,41 @@ class Stage1JEPATrainer:
             self.target_world_model.reset_persistent_state(batch_size=batch_size, device=self.device)
 
         progress = tqdm(total=max_steps, desc="stage1-jepa")
+        start = time.perf_counter()
         while steps < max_steps:
-            for batch in loader:
+            for batch in pipeline:
                 if steps >= max_steps:
                     break
 
                 observations = batch["observations"].to(self.device)
-                online_outputs = self.world_model(observations, persist_state=persist_state)
-                online_states = online_outputs.states
-                with torch.no_grad():
-                    target_outputs = self.target_world_model(observations, persist_state=persist_state)
-                target_states = target_outputs.states
-
-                if online_states.size(1) <= horizon:
+                if batch.get("chunk_start") == 0:
+                    # Every stream starts a new sequence.
+                    for model in (self.world_model, self.target_world_model):
+                        model.reset_persistent_state(batch_size=observations.size(0), device=self.device)
+                with autocast_context(self.device, self.infra):
+                    online_outputs = self.world_model(observations, persist_state=persist_state)
+                    online_states = online_outputs.states
+                    with torch.no_grad():
+                        target_outputs = self.target_world_model(observations, persist_state=persist_state)
+                    target_states = target_outputs.states
+
+                    if online_states.size(1) <= horizon:
+                        continue
+
+                    pred = self.predictor(online_states[:, :-horizon])
+                    target = target_states[:, horizon:].detach()
+
+                    loss = F.mse_loss(pred, target)
+
+                stepped = maybe_accumulate_step(
+                    self.optimizer, loss, micro_steps, self.infra, accelerator=self.accelerator
+                )
+                micro_steps += 1
+                final_loss = float(loss.item())
+                if not stepped:
                     continue
-
-                pred = self.predictor(online_states[:, :-horizon])
-                target = target_states[:, horizon:].detach()
-
-                loss = F.mse_loss(pred, target)
-                self.optimizer.zero_grad(set_to_none=True)
-                loss.backward()
-                self.optimizer.step()
                 self._update_ema_target()
 
-                final_loss = float(loss.item())
                 steps += 1
                 progress.update(1)
                 progress.set_postfix(loss=f"{final_loss:.4f}")
@@ -114,4 +165,11 @@ class Stage1JEPATrainer:
                     break
 
         progress.close()
-        return Stage1Result(final_loss=final_loss, steps=steps)
+        elapsed = time.perf_counter() - start
+        return Stage1Result(
+            final_loss=final_loss,
+            steps=steps,
+            data_wait_seconds=pipeline.wait_seconds,
+            compute_seconds=elapsed - pipeline.wait_seconds,
+            batches=pipeline.batches,
+        )
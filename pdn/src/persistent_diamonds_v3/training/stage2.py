@@ -1,16 +1,24 @@
 from __future__ import annotations
 
+import time
 from dataclasses import dataclass
 
 import torch
 import torch.nn.functional as F
 from torch import nn
-from torch.utils.data import DataLoader
+from torch.utils.data import IterableDataset
 from tqdm.auto import tqdm
 
-from persistent_diamonds_v3.config import Stage2LossWeights
-from persistent_diamonds_v3.models import DiscreteNarrator, ModularSSMWorldModel
+from persistent_diamonds_v3.config import InfraConfig, Stage2LossWeights
+from persistent_diamonds_v3.data.objectives import objective_loader
+from persistent_diamonds_v3.data.prefetch import DevicePrefetcher
+from persistent_diamonds_v3.models import DiscreteNarrator, ModularSSMWorldModel, NarratorRollout
 from persistent_diamonds_v3.models.control_head import ControlHead
+from persistent_diamonds_v3.training.infra import (
+    autocast_context,
+    maybe_accumulate_step,
+    prepare_infra,
+)
 
 
 @dataclass(slots=True)
@@ -18,6 +26,11 @@ class Stage2Result:
     final_loss: float
     final_rate_bits_per_sec: float
     steps: int
+    # Wall time blocked on the input pipeline vs. spent in training steps.
+    data_wait_seconds: float = 0.0
+    compute_seconds: float = 0.0
+    # Loader batches consumed by this run; a stream resumes at ``start_step + batches``.
+    batches: int = 0
 
 
 def info_nce_multiscale(states: torch.Tensor, horizons: tuple[int, ...] = (1, 4, 8, 16)) -> torch.Tensor:
@@ -76,14 +89,16 @@ class Stage2ShapingTrainer:
         device: str,
         control_head: ControlHead | None = None,
         control_weight: float = 0.5,
+        infra: InfraConfig | None = None,
     ):
         self.device = torch.device(device)
+        self.infra = infra or InfraConfig()
         self.world_model = world_model.to(self.device)
         self.narrator = narrator.to(self.device)
         self.control_head = control_head.to(self.device) if control_head is not None else None
         self.control_weight = control_weight
         self.weights = stage2_weights
-        self.narrator_update_stride = max(1, int(round(world_step_hz / max(1, narrator.update_hz))))
+        self.narrator_update_stride = narrator.update_stride(world_step_hz)
 
         narrator_dim = narrator.codes_per_step * narrator.code_dim
         latent_dim = world_model.latent_dim
@@ -128,63 +143,62 @@ class Stage2ShapingTrainer:
             lr=learning_rate,
             weight_decay=weight_decay,
         )
+        modules = [
+            self.world_model,
+            self.narrator,
+            self.task_head,
+            self.obs_predictor,
+            self.world_self_predictor,
+            self.rd_decoder,
+        ]
+        if self.control_head is not None:
+            modules.append(self.control_head)
+        self.device, self.optimizer, self.accelerator = prepare_infra(
+            self.infra, self.device, modules, self.optimizer
+        )
 
-    def _run_narrator_rollout(self, world_states: torch.Tensor):
-        _, steps, _ = world_states.shape
-        step_states: list[torch.Tensor] = []
-        step_uncertainties: list[torch.Tensor] = []
-        update_states: list[torch.Tensor] = []
-        update_preds: list[torch.Tensor] = []
-        update_codes: list[torch.Tensor] = []
-        vq_losses: list[torch.Tensor] = []
-        hidden_state: torch.Tensor | None = None
-        current_state: torch.Tensor | None = None
-        current_uncertainty: torch.Tensor | None = None
-
-        for t in range(steps):
-            should_update = t == 0 or (t % self.narrator_update_stride == 0)
-            if should_update:
-                start = max(0, t + 1 - self.narrator.window_size)
-                window = world_states[:, start : t + 1]
-                out = self.narrator(window, hidden_state=hidden_state)
-                hidden_state = out.hidden_state
-                current_state = out.narrator_state
-                current_uncertainty = out.uncertainty
-
-                update_states.append(out.narrator_state)
-                update_preds.append(out.predicted_next_state)
-                update_codes.append(out.code_indices)
-                vq_losses.append(out.vq_loss)
-
-            if current_state is None or current_uncertainty is None:
-                raise RuntimeError("Narrator rollout expected initialized state.")
-            step_states.append(current_state)
-            step_uncertainties.append(current_uncertainty)
-
-        narrator_dim = self.narrator.codes_per_step * self.narrator.code_dim
-        bsz = world_states.size(0)
-        if update_states:
-            state_updates = torch.stack(update_states, dim=1)
-            pred_updates = torch.stack(update_preds, dim=1)
-            code_updates = torch.stack(update_codes, dim=1)
-        else:  # pragma: no cover - steps>=1 in practice.
-            state_updates = world_states.new_zeros((bsz, 0, narrator_dim))
-            pred_updates = world_states.new_zeros((bsz, 0, narrator_dim))
-            code_updates = torch.zeros(
-                (bsz, 0, self.narrator.codes_per_step),
-                device=world_states.device,
-                dtype=torch.long,
+    def _narrator_head_losses(
+        self,
+        narrator: NarratorRollout,
+        world_states: torch.Tensor,
+        task_signal: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Task, rate-distortion and control losses from the narrator rollout.
+
+        The narrator state only changes at update steps, so every head runs on
+        the U unique update states and its outputs (or per-update entropies)
+        are broadcast to world rate through ``step_to_update``.  The losses
+        equal those of running the heads on the per-step expansion.
+        """
+        narrator_state = narrator.narrator_state
+
+        task_features = torch.cat([narrator_state, narrator.uncertainty], dim=-1)
+        task_pred = narrator.per_step(self.task_head(task_features))
+        loss_task = F.mse_loss(task_pred, task_signal)
+
+        rd_pred = self.rd_decoder(narrator_state).index_select(1, narrator.step_to_update[:-1])
+        rd_target = world_states[:, 1:].detach()
+        distortion = F.mse_loss(rd_pred, rd_target)
+
+        # Control head loss: action-entropy regularised value prediction.
+        # The control head receives narrator state ONLY (no-bypass).
+        if self.control_head is not None:
+            ctrl = self.control_head(narrator_state)
+            value_estimate = narrator.per_step(ctrl.value_estimate)
+            # Value prediction trained against task signal magnitude.
+            loss_ctrl = F.mse_loss(
+                value_estimate,
+                task_signal.mean(dim=-1, keepdim=True).expand_as(value_estimate),
             )
-        vq_mean = torch.stack(vq_losses).mean() if vq_losses else world_states.new_tensor(0.0)
+            # Entropy bonus: encourage exploration in action space.
+            action_probs = F.softmax(ctrl.action_logits, dim=-1)
+            update_entropy = -(action_probs * torch.log(action_probs + 1e-8)).sum(dim=-1)
+            action_entropy = narrator.per_step(update_entropy).mean()
+            loss_ctrl = loss_ctrl - 0.01 * action_entropy
+        else:
+            loss_ctrl = world_states.new_tensor(0.0)
 
-        return {
-            "state_per_step": torch.stack(step_states, dim=1),
-            "uncertainty_per_step": torch.stack(step_uncertainties, dim=1),
-            "state_updates": state_updates,
-            "pred_updates": pred_updates,
-            "codes": code_updates,
-            "vq_loss": vq_mean,
-        }
+        return loss_task, distortion, loss_ctrl
 
     def _grounded_autonomy_loss(
         self,
@@ -209,105 +223,147 @@ class Stage2ShapingTrainer:
         bits_per_code = float(entropy.item())
         return bits_per_code * self.narrator.codes_per_step * self.narrator.update_hz
 
-    def train(self, dataset, *, batch_size: int, max_steps: int, persist_state: bool = True) -> Stage2Result:
-        if len(dataset) == 0:
+    def train(
+        self,
+        dataset,
+        *,
+        batch_size: int,
+        max_steps: int,
+        persist_state: bool = True,
+        num_workers: int = 0,
+        prefetch_factor: int | None = None,
+        persistent_workers: bool = False,
+        device_prefetch: int = 0,
+        chunk_length: int | None = None,
+        start_step: int = 0,
+    ) -> Stage2Result:
+        if not isinstance(dataset, IterableDataset) and len(dataset) == 0:
             raise ValueError("Stage 2 received an empty dataset.")
-        loader = DataLoader(dataset, batch_size=batch_size, shuffle=not persist_state, drop_last=False)
+        if chunk_length and not persist_state:
+            raise ValueError("chunk_length trains with truncated BPTT and needs persist_state=True.")
+        if chunk_length and chunk_length % self.narrator_update_stride:
+            raise ValueError(
+                f"chunk_length ({chunk_length}) must be a multiple of the narrator update stride "
+                f"({self.narrator_update_stride}) so updates keep their phase across chunks."
+            )
+        loader = objective_loader(
+            dataset,
+            batch_size=batch_size,
+            # Chunked streams reset at sequence starts, so their order may be shuffled.
+            shuffle=not persist_state or bool(chunk_length),
+            num_workers=num_workers,
+            prefetch_factor=prefetch_factor,
+            persistent_workers=persistent_workers,
+            pin_memory=self.device.type == "cuda",
+            chunk_length=chunk_length,
+            start_step=start_step,
+        )
+        pipeline = DevicePrefetcher(loader, self.device, depth=device_prefetch)
         final_loss = 0.0
         final_rate = 0.0
         steps = 0
+        micro_steps = 0
 
         if persist_state:
             self.world_model.reset_persistent_state(batch_size=batch_size, device=self.device)
+        # Narrator GRU state and trailing world states carried between chunks.
+        narrator_hidden: torch.Tensor | None = None
+        narrator_history: torch.Tensor | None = None
 
         progress = tqdm(total=max_steps, desc="stage2-shaping")
+        start = time.perf_counter()
         while steps < max_steps:
-            for batch in loader:
+            for batch in pipeline:
                 if steps >= max_steps:
                     break
 
                 observations = batch["observations"].to(self.device)
+                if batch.get("chunk_start") == 0:
+                    # Every stream starts a new sequence.
+                    self.world_model.reset_persistent_state(batch_size=observations.size(0), device=self.device)
+                    narrator_hidden = narrator_history = None
                 targets = batch["targets"].to(self.device)
                 external_drive = batch["external_drive"].to(self.device)
                 task_signal = batch["task_signal"].to(self.device)
 
-                world = self.world_model(observations, persist_state=persist_state)
-                world_states = world.states
-
-                narrator = self._run_narrator_rollout(world_states)
-                narrator_state = narrator["state_per_step"]
-                narrator_uncertainty = narrator["uncertainty_per_step"]
-                narrator_updates = narrator["state_updates"]
-                narrator_pred = narrator["pred_updates"]
-                code_indices = narrator["codes"]
-
-                jepa_pred = self.obs_predictor(world_states)
-                loss_jepa = F.mse_loss(jepa_pred, targets)
-
-                task_features = torch.cat([narrator_state, narrator_uncertainty], dim=-1)
-                task_pred = self.task_head(task_features)
-                loss_task = F.mse_loss(task_pred, task_signal)
-
-                loss_cpc = info_nce_multiscale(world_states)
-                loss_vicreg = vicreg_loss(world_states)
-                loss_auto = self._grounded_autonomy_loss(world_states, external_drive, loss_task)
-
-                rd_pred = self.rd_decoder(narrator_state[:, :-1])
-                rd_target = world_states[:, 1:].detach()
-                distortion = F.mse_loss(rd_pred, rd_target)
-
-                rate_bits = self._actual_rate_bits_per_sec(code_indices)
-                target_rate = self.narrator.bits_per_second
-                rate_penalty = torch.tensor(
-                    rate_bits / max(1.0, target_rate),
-                    device=self.device,
-                    dtype=distortion.dtype,
-                )
-                loss_rd = distortion + 0.01 * rate_penalty + narrator["vq_loss"]
-
-                if narrator_updates.size(1) > 1:
-                    loss_sp_n = F.mse_loss(narrator_pred[:, :-1], narrator_updates[:, 1:].detach())
-                else:
-                    loss_sp_n = world_states.new_tensor(0.0)
-                world_sp = self.world_self_predictor(world_states[:, :-1])
-                loss_sp_w = F.mse_loss(world_sp, world_states[:, 1:].detach())
-
-                # Control head loss: action-entropy regularised value prediction.
-                # The control head receives narrator state ONLY (no-bypass).
-                if self.control_head is not None:
-                    ctrl = self.control_head(narrator_state)
-                    # Value prediction trained against task signal magnitude.
-                    loss_ctrl = F.mse_loss(
-                        ctrl.value_estimate,
-                        task_signal.mean(dim=-1, keepdim=True).expand_as(ctrl.value_estimate),
+                with autocast_context(self.device, self.infra):
+                    world = self.world_model(observations, persist_state=persist_state)
+                    world_states = world.states
+
+                    narrator = self.narrator.rollout(
+                        world_states,
+                        update_stride=self.narrator_update_stride,
+                        hidden_state=narrator_hidden,
+                        history=narrator_history,
+                    )
+                    if chunk_length:
+                        # Truncated BPTT: continue the narrator next chunk, detached.
+                        narrator_hidden = narrator.hidden_state.detach()
+                        recent = world_states.detach()
+                        if narrator_history is not None:
+                            recent = torch.cat((narrator_history, recent), dim=1)
+                        keep = self.narrator.window_size - 1
+                        narrator_history = recent[:, max(0, recent.size(1) - keep) :]
+                    narrator_updates = narrator.narrator_state
+                    narrator_pred = narrator.predicted_next_state
+                    code_indices = narrator.code_indices
+
+                    jepa_pred = self.obs_predictor(world_states)
+                    loss_jepa = F.mse_loss(jepa_pred, targets)
+
+                    loss_task, distortion, loss_ctrl = self._narrator_head_losses(
+                        narrator, world_states, task_signal
                     )
-                    # Entropy bonus: encourage exploration in action space.
-                    action_probs = F.softmax(ctrl.action_logits, dim=-1)
-                    action_entropy = -(action_probs * torch.log(action_probs + 1e-8)).sum(dim=-1).mean()
-                    loss_ctrl = loss_ctrl - 0.01 * action_entropy
-                else:
-                    loss_ctrl = world_states.new_tensor(0.0)
-
-                total = (
-                    self.weights.jepa * loss_jepa
-                    + self.weights.task * loss_task
-                    + self.weights.cpc * loss_cpc
-                    + self.weights.vicreg * loss_vicreg
-                    + self.weights.autonomy * loss_auto
-                    + self.weights.rate_distortion * loss_rd
-                    + self.weights.selfpred_narrator * loss_sp_n
-                    + self.weights.selfpred_world * loss_sp_w
-                    + self.control_weight * loss_ctrl
-                )
 
-                self.optimizer.zero_grad(set_to_none=True)
-                total.backward()
-                torch.nn.utils.clip_grad_norm_(self.world_model.parameters(), 1.0)
-                torch.nn.utils.clip_grad_norm_(self.narrator.parameters(), 1.0)
-                self.optimizer.step()
+                    loss_cpc = info_nce_multiscale(world_states)
+                    loss_vicreg = vicreg_loss(world_states)
+                    loss_auto = self._grounded_autonomy_loss(world_states, external_drive, loss_task)
 
+                    rate_bits = self._actual_rate_bits_per_sec(code_indices)
+                    target_rate = self.narrator.bits_per_second
+                    rate_penalty = torch.tensor(
+                        rate_bits / max(1.0, target_rate),
+                        device=self.device,
+                        dtype=distortion.dtype,
+                    )
+                    loss_rd = distortion + 0.01 * rate_penalty + narrator.vq_loss
+
+                    if narrator_updates.size(1) > 1:
+                        loss_sp_n = F.mse_loss(
+                            narrator_pred[:, :-1], narrator_updates[:, 1:].detach()
+                        )
+                    else:
+                        loss_sp_n = world_states.new_tensor(0.0)
+                    world_sp = self.world_self_predictor(world_states[:, :-1])
+                    loss_sp_w = F.mse_loss(world_sp, world_states[:, 1:].detach())
+
+                    total = (
+                        self.weights.jepa * loss_jepa
+                        + self.weights.task * loss_task
+                        + self.weights.cpc * loss_cpc
+                        + self.weights.vicreg * loss_vicreg
+                        + self.weights.autonomy * loss_auto
+                        + self.weights.rate_distortion * loss_rd
+                        + self.weights.selfpred_narrator * loss_sp_n
+                        + self.weights.selfpred_world * loss_sp_w
+                        + self.control_weight * loss_ctrl
+                    )
+
+                stepped = maybe_accumulate_step(
+                    self.optimizer,
+                    total,
+                    micro_steps,
+                    self.infra,
+                    max_grad_norm=1.0,
+                    clip_groups=[self.world_model.parameters(), self.narrator.parameters()],
+                    accelerator=self.accelerator,
+                )
+                micro_steps += 1
                 final_loss = float(total.item())
                 final_rate = float(rate_bits)
+                if not stepped:
+                    continue
+
                 steps += 1
 
                 progress.update(1)
@@ -317,4 +373,12 @@ class Stage2ShapingTrainer:
                     break
 
         progress.close()
-        return Stage2Result(final_loss=final_loss, final_rate_bits_per_sec=final_rate, steps=steps)
+        elapsed = time.perf_counter() - start
+        return Stage2Result(
+            final_loss=final_loss,
+            final_rate_bits_per_sec=final_rate,
+            steps=steps,
+            data_wait_seconds=pipeline.wait_seconds,
+            compute_seconds=elapsed - pipeline.wait_seconds,
+            batches=pipeline.batches,
+        )
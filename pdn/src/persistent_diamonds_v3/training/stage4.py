@@ -26,11 +26,16 @@ import torch.nn.functional as F
 from torch import nn
 from tqdm.auto import tqdm
 
-from persistent_diamonds_v3.config import Stage4Config
+from persistent_diamonds_v3.config import InfraConfig, Stage4Config
 from persistent_diamonds_v3.data.env.gridworld import GridWorld, GridWorldConfig
 from persistent_diamonds_v3.models.control_head import ControlHead
 from persistent_diamonds_v3.models.narrator import DiscreteNarrator
 from persistent_diamonds_v3.models.world_model import ModularSSMWorldModel
+from persistent_diamonds_v3.training.infra import (
+    autocast_context,
+    maybe_accumulate_step,
+    prepare_infra,
+)
 
 
 @dataclass(slots=True)
@@ -67,8 +72,10 @@ class Stage4EmbodiedTrainer:
         learning_rate: float,
         weight_decay: float,
         device: str,
+        infra: InfraConfig | None = None,
     ):
         self.device = torch.device(device)
+        self.infra = infra or InfraConfig()
         self.world_model = world_model.to(self.device)
         self.narrator = narrator.to(self.device)
         self.control_head = control_head.to(self.device)
@@ -93,6 +100,12 @@ class Stage4EmbodiedTrainer:
         self.optimizer = torch.optim.AdamW(
             params, lr=learning_rate, weight_decay=weight_decay,
         )
+        self.device, self.optimizer, self.accelerator = prepare_infra(
+            self.infra,
+            self.device,
+            [self.world_model, self.narrator, self.control_head, self.obs_adapter],
+            self.optimizer,
+        )
 
     def _collect_episode(self, env: GridWorld) -> list[_Transition]:
         """Roll out one episode, collecting transitions."""
@@ -102,11 +115,13 @@ class Stage4EmbodiedTrainer:
 
         # Initialise world model state for batch-size 1.
         state_t = torch.zeros(1, self.world_model.latent_dim, device=self.device)
+        # Weights are fixed during collection, so pack them once per episode.
+        packed = self.world_model.pack_dynamics()
 
         for _ in range(self.cfg.max_episode_steps):
             # Encode observation and step world model.
             input_t = self.obs_adapter(obs.unsqueeze(0))  # [1, input_dim]
-            state_t = self.world_model.step(input_t, state_t)
+            state_t = self.world_model.step(input_t, state_t, packed=packed)
 
             # Run narrator on the current state (window of 1).
             narrator_out = self.narrator(
@@ -194,6 +209,7 @@ class Stage4EmbodiedTrainer:
         env = GridWorld(env_config)
 
         steps = 0
+        micro_steps = 0
         final_loss = 0.0
         episode_rewards: list[float] = []
         episode_lengths: list[int] = []
@@ -207,7 +223,8 @@ class Stage4EmbodiedTrainer:
             for _ in range(self.cfg.episodes_per_epoch):
                 if steps >= max_steps:
                     break
-                episode = self._collect_episode(env)
+                with autocast_context(self.device, self.infra):
+                    episode = self._collect_episode(env)
                 batch_transitions.append(episode)
 
                 ep_reward = sum(t.reward for t in episode)
@@ -219,79 +236,90 @@ class Stage4EmbodiedTrainer:
                 break
 
             # Compute loss over the batch.
-            total_policy_loss = torch.tensor(0.0, device=self.device)
-            total_value_loss = torch.tensor(0.0, device=self.device)
-            total_narrator_loss = torch.tensor(0.0, device=self.device)
-            total_grounded = torch.tensor(0.0, device=self.device)
-            total_entropy = torch.tensor(0.0, device=self.device)
-            count = 0
-
-            for episode in batch_transitions:
-                if len(episode) < 2:
+            with autocast_context(self.device, self.infra):
+                total_policy_loss = torch.tensor(0.0, device=self.device)
+                total_value_loss = torch.tensor(0.0, device=self.device)
+                total_narrator_loss = torch.tensor(0.0, device=self.device)
+                total_grounded = torch.tensor(0.0, device=self.device)
+                total_entropy = torch.tensor(0.0, device=self.device)
+                count = 0
+
+                for episode in batch_transitions:
+                    if len(episode) < 2:
+                        continue
+
+                    rewards = [t.reward for t in episode]
+                    values = [t.value for t in episode]
+                    dones = [t.done for t in episode]
+                    log_probs = torch.stack([t.log_prob for t in episode])
+                    narrator_states = torch.stack([t.narrator_state for t in episode])
+
+                    advantages, returns = self._compute_gae(rewards, values, dones)
+                    advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-8)
+
+                    # Policy gradient loss.
+                    policy_loss = -(log_probs * advantages.detach()).mean()
+
+                    # Value loss.
+                    value_preds = torch.stack(values)
+                    value_loss = F.mse_loss(value_preds, returns)
+
+                    # Narrator consistency: self-prediction across adjacent steps.
+                    narrator_pred = narrator_states[:-1]
+                    narrator_target = narrator_states[1:].detach()
+                    narrator_loss = F.mse_loss(narrator_pred, narrator_target)
+
+                    # Grounded-autonomy bonus.
+                    reward_tensor = torch.tensor(rewards, device=self.device, dtype=torch.float32)
+                    grounded_loss = self._grounded_autonomy_metric(narrator_states, reward_tensor)
+
+                    # Entropy bonus.
+                    # We can't recompute the full distribution cheaply, so we use
+                    # the approximation: H ≈ -mean(log_prob).
+                    entropy = -log_probs.mean()
+
+                    total_policy_loss = total_policy_loss + policy_loss
+                    total_value_loss = total_value_loss + value_loss
+                    total_narrator_loss = total_narrator_loss + narrator_loss
+                    total_grounded = total_grounded + grounded_loss
+                    total_entropy = total_entropy + entropy
+                    count += 1
+
+                if count == 0:
                     continue
 
-                rewards = [t.reward for t in episode]
-                values = [t.value for t in episode]
-                dones = [t.done for t in episode]
-                log_probs = torch.stack([t.log_prob for t in episode])
-                narrator_states = torch.stack([t.narrator_state for t in episode])
-
-                advantages, returns = self._compute_gae(rewards, values, dones)
-                advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-8)
-
-                # Policy gradient loss.
-                policy_loss = -(log_probs * advantages.detach()).mean()
-
-                # Value loss.
-                value_preds = torch.stack(values)
-                value_loss = F.mse_loss(value_preds, returns)
-
-                # Narrator consistency: self-prediction across adjacent steps.
-                narrator_pred = narrator_states[:-1]
-                narrator_target = narrator_states[1:].detach()
-                narrator_loss = F.mse_loss(narrator_pred, narrator_target)
-
-                # Grounded-autonomy bonus.
-                reward_tensor = torch.tensor(rewards, device=self.device, dtype=torch.float32)
-                grounded_loss = self._grounded_autonomy_metric(narrator_states, reward_tensor)
-
-                # Entropy bonus.
-                # We can't recompute the full distribution cheaply, so we use
-                # the approximation: H ≈ -mean(log_prob).
-                entropy = -log_probs.mean()
-
-                total_policy_loss = total_policy_loss + policy_loss
-                total_value_loss = total_value_loss + value_loss
-                total_narrator_loss = total_narrator_loss + narrator_loss
-                total_grounded = total_grounded + grounded_loss
-                total_entropy = total_entropy + entropy
-                count += 1
-
-            if count == 0:
-                continue
+                total_policy_loss = total_policy_loss / count
+                total_value_loss = total_value_loss / count
+                total_narrator_loss = total_narrator_loss / count
+                total_grounded = total_grounded / count
+                total_entropy = total_entropy / count
+
+                loss = (
+                    total_policy_loss
+                    + self.cfg.value_coeff * total_value_loss
+                    + self.cfg.narrator_consistency_coeff * total_narrator_loss
+                    + self.cfg.grounded_autonomy_coeff * total_grounded
+                    - self.cfg.entropy_coeff * total_entropy
+                )
 
-            total_policy_loss = total_policy_loss / count
-            total_value_loss = total_value_loss / count
-            total_narrator_loss = total_narrator_loss / count
-            total_grounded = total_grounded / count
-            total_entropy = total_entropy / count
-
-            loss = (
-                total_policy_loss
-                + self.cfg.value_coeff * total_value_loss
-                + self.cfg.narrator_consistency_coeff * total_narrator_loss
-                + self.cfg.grounded_autonomy_coeff * total_grounded
-                - self.cfg.entropy_coeff * total_entropy
+            stepped = maybe_accumulate_step(
+                self.optimizer,
+                loss,
+                micro_steps,
+                self.infra,
+                max_grad_norm=self.cfg.gradient_clip_norm,
+                clip_groups=[
+                    self.world_model.parameters(),
+                    self.narrator.parameters(),
+                    self.control_head.parameters(),
+                ],
+                accelerator=self.accelerator,
             )
-
-            self.optimizer.zero_grad(set_to_none=True)
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(self.world_model.parameters(), self.cfg.gradient_clip_norm)
-            torch.nn.utils.clip_grad_norm_(self.narrator.parameters(), self.cfg.gradient_clip_norm)
-            torch.nn.utils.clip_grad_norm_(self.control_head.parameters(), self.cfg.gradient_clip_norm)
-            self.optimizer.step()
-
+            micro_steps += 1
             final_loss = float(loss.item())
+            if not stepped:
+                continue
+
             steps += 1
             progress.update(1)
 
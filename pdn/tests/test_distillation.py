@@ -4,25 +4,42 @@ from __future__ import annotations
 
 import json
 from pathlib import Path
+from types import SimpleNamespace
 
 import numpy as np
-import torch
 import pytest
+import torch
 
-from persistent_diamonds_v3.config import DistillationConfig
+from persistent_diamonds_v3.config import DistillationConfig, InfraConfig
 from persistent_diamonds_v3.data.distill_cache import (
     CachedNarratorTextDataset,
-    build_code_cache,
     _cache_key,
+    build_code_cache,
+)
+from persistent_diamonds_v3.data.objectives import convert_npz_to_npy
+from persistent_diamonds_v3.data.teacher_cache import (
+    TeacherCachedDataset,
+    TeacherLogitCache,
+    build_teacher_cache,
+    find_teacher_cache,
+)
+from persistent_diamonds_v3.data.tokenized_corpus import (
+    DynamicPaddingCollator,
+    LengthBucketBatchSampler,
+    TokenizedCorpus,
+    build_tokenized_corpus,
 )
 from persistent_diamonds_v3.models import DiscreteNarrator, ModularSSMWorldModel, ReportHead
 from persistent_diamonds_v3.training.distill import (
     DistillationResult,
+    DistillationTrainer,
     NarratorTextDataset,
+    PrefetchBatchSampler,
     build_synthetic_distillation_corpus,
+    sparse_distillation_losses,
+    teacher_topk_targets,
 )
 
-
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
@@ -78,18 +95,49 @@ class _FakeTokenizer:
 
     def __call__(self, text, **kwargs):
         max_length = kwargs.get("max_length", 32)
-        ids = [hash(c) % 100 + 1 for c in text[:max_length]]
-        ids = ids + [0] * (max_length - len(ids))
-        mask = [1 if tok != 0 else 0 for tok in ids]
+        texts = [text] if isinstance(text, str) else list(text)
+        all_ids, all_mask = [], []
+        for t in texts:
+            ids = [hash(c) % 100 + 1 for c in t[:max_length]]
+            if kwargs.get("padding") == "max_length":
+                ids = ids + [0] * (max_length - len(ids))
+            all_ids.append(ids[:max_length])
+            all_mask.append([1 if tok != 0 else 0 for tok in ids[:max_length]])
+        if kwargs.get("return_tensors") is None:
+            return {"input_ids": all_ids, "attention_mask": all_mask}
         return {
-            "input_ids": torch.tensor([ids[:max_length]], dtype=torch.long),
-            "attention_mask": torch.tensor([mask[:max_length]], dtype=torch.long),
+            "input_ids": torch.tensor(all_ids, dtype=torch.long),
+            "attention_mask": torch.tensor(all_mask, dtype=torch.long),
         }
 
     def __len__(self):
         return 200
 
 
+class _FakeTeacher(torch.nn.Module):
+    """Tiny causal-LM stand-in exposing the HF output fields distillation uses."""
+
+    def __init__(self, vocab_size: int = 200, hidden_size: int = 24, layers: int = 3):
+        super().__init__()
+        self.config = SimpleNamespace(hidden_size=hidden_size, num_hidden_layers=layers)
+        self.embed = torch.nn.Embedding(vocab_size, hidden_size)
+        self.blocks = torch.nn.ModuleList(
+            torch.nn.Linear(hidden_size, hidden_size) for _ in range(layers)
+        )
+        self.lm_head = torch.nn.Linear(hidden_size, vocab_size)
+
+    def forward(self, input_ids, attention_mask=None, output_hidden_states=False):
+        h = self.embed(input_ids)
+        hidden_states = [h]
+        for block in self.blocks:
+            h = torch.tanh(block(h))
+            hidden_states.append(h)
+        return SimpleNamespace(
+            logits=self.lm_head(h),
+            hidden_states=tuple(hidden_states) if output_hidden_states else None,
+        )
+
+
 # ---------------------------------------------------------------------------
 # Config tests
 # ---------------------------------------------------------------------------
@@ -264,6 +312,147 @@ class TestCodeCache:
             torch.testing.assert_close(cached_codes[i], online_codes)
 
 
+    def test_builder_encodes_each_trajectory_once_in_batches(self, tmp_path):
+        world, narrator = _small_world_narrator()
+        npz_path = _make_objective_npz(tmp_path, n=8, t=10)
+        corpus_path = _make_corpus(tmp_path, npz_path, num=40)
+        unique = {json.loads(line)["trajectory_index"] for line in corpus_path.read_text().splitlines()}
+
+        batch_rows: list[int] = []
+        world.register_forward_hook(lambda mod, args, out: batch_rows.append(args[0].shape[0]))
+
+        cache_path = build_code_cache(
+            corpus_path=corpus_path,
+            objective_npz_path=npz_path,
+            world_model=world,
+            narrator=narrator,
+            cache_dir=tmp_path / "cache",
+            batch_size=3,
+        )
+
+        assert sum(batch_rows) == len(unique)
+        assert max(batch_rows) <= 3
+        assert not list((tmp_path / "cache").glob("*.codes.npy"))
+
+        data = np.load(cache_path)
+        codes = data["codes"]
+        traj = data["trajectory_indices"]
+        assert codes.shape[0] == 40
+        # Records that share a trajectory share its codes.
+        for t in unique:
+            rows = np.flatnonzero(traj == t)
+            assert (codes[rows] == codes[rows[0]]).all()
+
+
+# ---------------------------------------------------------------------------
+# On-the-fly encoding memo
+# ---------------------------------------------------------------------------
+
+class TestNarratorCodeMemo:
+    def _dataset(self, tmp_path, *, num=12, memo=1024, encode_batch=4):
+        world, narrator = _small_world_narrator()
+        npz_path = _make_objective_npz(tmp_path, n=8, t=10)
+        corpus_path = _make_corpus(tmp_path, npz_path, num=num)
+        ds = NarratorTextDataset(
+            corpus_path=corpus_path,
+            objective_npz_path=npz_path,
+            world_model=world,
+            narrator=narrator,
+            tokenizer=_FakeTokenizer(),
+            device="cpu",
+            max_text_length=32,
+            code_memo_size=memo,
+            encode_batch_size=encode_batch,
+        )
+        rows: list[int] = []
+        world.register_forward_hook(lambda mod, args, out: rows.append(args[0].shape[0]))
+        return ds, rows
+
+    def test_repeated_trajectories_encode_once(self, tmp_path):
+        ds, rows = self._dataset(tmp_path)
+        unique = {int(r["trajectory_index"]) for r in ds.records}
+        first = [ds[i]["code_indices"] for i in range(len(ds))]
+        assert sum(rows) == len(unique)
+
+        rows.clear()
+        second = [ds[i]["code_indices"] for i in range(len(ds))]
+        assert rows == []
+        for a, b in zip(first, second):
+            assert torch.equal(a, b)
+
+    def test_prefetch_encodes_misses_in_micro_batches(self, tmp_path):
+        ds, rows = self._dataset(tmp_path, encode_batch=3)
+        unique = {int(r["trajectory_index"]) for r in ds.records}
+        ds.prefetch(list(range(len(ds))))
+        assert sum(rows) == len(unique)
+        assert max(rows) <= 3
+
+        rows.clear()
+        for i in range(len(ds)):
+            ds[i]
+        assert rows == []
+
+    def test_weight_change_invalidates_memo(self, tmp_path):
+        ds, rows = self._dataset(tmp_path)
+        ds[0]
+        with torch.no_grad():
+            for p in ds.world_model.parameters():
+                p.add_(0.5)
+        rows.clear()
+        ds[0]
+        assert rows == [1]
+
+    def test_memo_is_bounded(self, tmp_path):
+        ds, _ = self._dataset(tmp_path, num=30, memo=2)
+        ds.prefetch(list(range(len(ds))))
+        assert len(ds._code_memo) == 2
+
+    def test_npy_observations_stay_memory_mapped(self, tmp_path):
+        import pickle
+
+        ds, _ = self._dataset(tmp_path)
+        npy_dir = convert_npz_to_npy(ds.objective_path, tmp_path / "objective_npy")
+        # Fresh copies: the forward hook on ``ds.world_model`` cannot be pickled.
+        world, narrator = _small_world_narrator()
+        world.load_state_dict(ds.world_model.state_dict())
+        narrator.load_state_dict(ds.narrator.state_dict())
+        mapped = NarratorTextDataset(
+            corpus_path=tmp_path / "corpus.jsonl",
+            objective_npz_path=npy_dir,
+            world_model=world,
+            narrator=narrator,
+            tokenizer=_FakeTokenizer(),
+            device="cpu",
+            max_text_length=32,
+        )
+        assert isinstance(mapped.observations, np.memmap)
+        for i in range(len(ds)):
+            assert torch.equal(mapped.codes(i), ds.codes(i))
+
+        restored = pickle.loads(pickle.dumps(mapped))
+        assert isinstance(restored.observations, np.memmap)
+        assert torch.equal(restored.codes(0), ds.codes(0))
+
+    def test_trainer_prefetches_only_without_workers(self, tmp_path, monkeypatch):
+        ds, _ = self._dataset(tmp_path)
+        monkeypatch.setattr(
+            DistillationTrainer, "_load_teacher", lambda self, config: (_FakeTeacher(), "fake/teacher")
+        )
+        trainer = DistillationTrainer(
+            _small_report_head(), DistillationConfig(batch_size=2), device="cpu"
+        )
+        assert isinstance(trainer._batch_sampler(ds, 0), PrefetchBatchSampler)
+        assert not isinstance(trainer._batch_sampler(ds, 2), PrefetchBatchSampler)
+
+    def test_prefetch_batch_sampler_preserves_batches(self):
+        calls: list[list[int]] = []
+        batches = [[0, 1], [2, 3], [4, 5], [6]]
+        sampler = PrefetchBatchSampler(batches, calls.append, lookahead=3)
+        assert list(sampler) == batches
+        assert len(sampler) == 4
+        assert calls == [[0, 1, 2, 3, 4, 5], [6]]
+
+
 # ---------------------------------------------------------------------------
 # CachedNarratorTextDataset tests
 # ---------------------------------------------------------------------------
@@ -331,6 +520,417 @@ class TestCachedNarratorTextDataset:
             )
 
 
+# ---------------------------------------------------------------------------
+# Offline teacher-logit cache tests
+# ---------------------------------------------------------------------------
+
+def _small_report_head() -> ReportHead:
+    return ReportHead(
+        codebook_size=32,
+        vocab_size=200,
+        model_dim=64,
+        layer_count=2,
+        head_count=4,
+        ff_dim=128,
+        dropout=0.0,
+        max_seq_len=64,
+    )
+
+
+class TestTeacherCache:
+    def _build(self, tmp_path, *, hidden_layers=(), top_k=8):
+        npz_path = _make_objective_npz(tmp_path)
+        corpus_path = _make_corpus(tmp_path, npz_path, num=5)
+        torch.manual_seed(0)
+        teacher = _FakeTeacher()
+        cache_path = build_teacher_cache(
+            corpus_path=corpus_path,
+            teacher_model=teacher,
+            tokenizer=_FakeTokenizer(),
+            cache_dir=tmp_path / "teacher",
+            teacher_name="fake/teacher",
+            top_k=top_k,
+            hidden_layers=hidden_layers,
+            max_text_length=32,
+            temperature=2.0,
+            batch_size=2,
+        )
+        return npz_path, corpus_path, teacher, cache_path
+
+    def test_cache_stores_teacher_topk(self, tmp_path):
+        _, _, teacher, cache_path = self._build(tmp_path, hidden_layers=(2,))
+        cache = TeacherLogitCache(cache_path)
+        assert len(cache) == 5
+        assert cache.teacher_name == "fake/teacher"
+        assert cache.hidden_layers == [2]
+
+        input_ids = torch.from_numpy(np.array(cache.array("input_ids")))
+        with torch.no_grad():
+            out = teacher(input_ids, output_hidden_states=True)
+        values, indices = out.logits.topk(8, dim=-1)
+        torch.testing.assert_close(
+            torch.from_numpy(np.array(cache.array("logsumexp"))),
+            torch.logsumexp(out.logits / 2.0, dim=-1),
+        )
+        torch.testing.assert_close(
+            torch.from_numpy(np.array(cache.array("topk_logits"))).float(),
+            values,
+            atol=1e-2,
+            rtol=1e-2,
+        )
+        assert torch.equal(torch.from_numpy(np.array(cache.array("topk_indices"))).long(), indices)
+        assert cache.hidden(2).shape == (5, 32, 24)
+
+    def test_cache_reused_and_found_by_teacher_name(self, tmp_path):
+        _, corpus_path, teacher, cache_path = self._build(tmp_path)
+        mtime = (cache_path / "topk_logits.npy").stat().st_mtime
+        again = build_teacher_cache(
+            corpus_path=corpus_path,
+            teacher_model=teacher,
+            tokenizer=_FakeTokenizer(),
+            cache_dir=tmp_path / "teacher",
+            teacher_name="fake/teacher",
+            top_k=8,
+            max_text_length=32,
+            temperature=2.0,
+        )
+        assert again == cache_path
+        assert (cache_path / "topk_logits.npy").stat().st_mtime == mtime
+
+        found = find_teacher_cache(
+            corpus_path, tmp_path / "teacher", ["missing/teacher", "fake/teacher"],
+            top_k=8, max_text_length=32, temperature=2.0,
+        )
+        assert found == cache_path
+        assert find_teacher_cache(
+            corpus_path, tmp_path / "teacher", ["fake/teacher"],
+            top_k=4, max_text_length=32, temperature=2.0,
+        ) is None
+
+    def test_trainer_runs_from_cache_without_teacher(self, tmp_path, monkeypatch):
+        npz_path, corpus_path, _, cache_path = self._build(tmp_path, hidden_layers=(1,))
+        world, narrator = _small_world_narrator()
+        code_cache = build_code_cache(
+            corpus_path=corpus_path,
+            objective_npz_path=npz_path,
+            world_model=world,
+            narrator=narrator,
+            cache_dir=tmp_path / "codes",
+        )
+        base = CachedNarratorTextDataset(
+            cache_path=code_cache,
+            corpus_path=corpus_path,
+            tokenizer=_FakeTokenizer(),
+            max_text_length=32,
+        )
+        cache = TeacherLogitCache(cache_path)
+        dataset = TeacherCachedDataset(base, cache)
+        item = dataset[0]
+        assert item["teacher_topk_logits"].shape == (32, 8)
+        assert item["teacher_hidden"].shape == (32, 24)
+
+        def _no_teacher(*args, **kwargs):
+            raise AssertionError("teacher must not be loaded when training from cache")
+
+        monkeypatch.setattr(DistillationTrainer, "_load_teacher", _no_teacher)
+        cfg = DistillationConfig(max_steps=2, batch_size=2, hidden_alignment=True)
+        trainer = DistillationTrainer(_small_report_head(), cfg, device="cpu", teacher_cache=cache)
+        result = trainer.train(dataset)
+
+        assert result.steps == 2
+        assert result.teacher_model_name == "fake/teacher"
+        assert np.isfinite(result.final_loss)
+        assert result.final_loss_hidden > 0.0
+
+    def test_cached_dataset_skips_base_tokenization(self, tmp_path):
+        npz_path, corpus_path, _, cache_path = self._build(tmp_path)
+        world, narrator = _small_world_narrator()
+        code_cache = build_code_cache(
+            corpus_path=corpus_path,
+            objective_npz_path=npz_path,
+            world_model=world,
+            narrator=narrator,
+            cache_dir=tmp_path / "codes",
+        )
+
+        class _RefusingTokenizer(_FakeTokenizer):
+            def __call__(self, text, **kwargs):
+                raise AssertionError("cached teacher rows must not be re-tokenized")
+
+        base = CachedNarratorTextDataset(
+            cache_path=code_cache,
+            corpus_path=corpus_path,
+            tokenizer=_RefusingTokenizer(),
+            max_text_length=32,
+        )
+        cache = TeacherLogitCache(cache_path)
+        item = TeacherCachedDataset(base, cache)[1]
+        assert torch.equal(item["code_indices"], base.codes(1))
+        n = int(np.asarray(cache.array("attention_mask"))[1].sum())
+        assert torch.equal(item["input_ids"], torch.from_numpy(np.array(cache.array("input_ids")[1, :n])))
+
+    def test_trainer_accumulates_under_bf16(self, tmp_path):
+        npz_path, corpus_path, _, cache_path = self._build(tmp_path)
+        world, narrator = _small_world_narrator()
+        code_cache = build_code_cache(
+            corpus_path=corpus_path,
+            objective_npz_path=npz_path,
+            world_model=world,
+            narrator=narrator,
+            cache_dir=tmp_path / "codes",
+        )
+        base = CachedNarratorTextDataset(
+            cache_path=code_cache,
+            corpus_path=corpus_path,
+            tokenizer=_FakeTokenizer(),
+            max_text_length=32,
+        )
+        dataset = TeacherCachedDataset(base, TeacherLogitCache(cache_path))
+        cfg = DistillationConfig(max_steps=2, batch_size=2)
+        trainer = DistillationTrainer(
+            _small_report_head(),
+            cfg,
+            device="cpu",
+            teacher_cache=TeacherLogitCache(cache_path),
+            infra=InfraConfig(bf16=True, gradient_accumulation_steps=2),
+        )
+        optimizer_steps: list[int] = []
+        step = trainer.optimizer.step
+
+        def _counting_step(*args, **kwargs):
+            optimizer_steps.append(1)
+            return step(*args, **kwargs)
+
+        trainer.optimizer.step = _counting_step
+        dtypes: list[torch.dtype] = []
+        # Attention ``out_proj`` is called functionally and never fires hooks.
+        ff_linear = trainer.report_head.decoder.layers[0].linear1
+        ff_linear.register_forward_hook(lambda m, args, out: dtypes.append(out.dtype))
+
+        result = trainer.train(dataset)
+
+        assert result.steps == 2
+        assert len(optimizer_steps) == 2
+        assert dtypes and set(dtypes) == {torch.bfloat16}
+        assert np.isfinite(result.final_loss)
+
+    def test_trainer_rejects_cache_built_at_other_temperature(self, tmp_path):
+        _, _, _, cache_path = self._build(tmp_path)
+        cfg = DistillationConfig(temperature=1.0)
+        with pytest.raises(ValueError, match="temperature"):
+            DistillationTrainer(
+                _small_report_head(), cfg, device="cpu", teacher_cache=TeacherLogitCache(cache_path)
+            )
+
+
+# ---------------------------------------------------------------------------
+# Sparse top-k KL tests
+# ---------------------------------------------------------------------------
+
+def _dense_losses(student_logits, teacher_logits, labels, temperature):
+    kl = torch.nn.functional.kl_div(
+        torch.log_softmax(student_logits / temperature, dim=-1),
+        torch.softmax(teacher_logits / temperature, dim=-1),
+        reduction="batchmean",
+    ) * temperature**2
+    ce = torch.nn.functional.cross_entropy(
+        student_logits.reshape(-1, student_logits.size(-1)), labels.reshape(-1), ignore_index=0
+    )
+    return kl, ce
+
+
+class TestSparseDistillationLosses:
+    def _inputs(self, vocab: int = 40):
+        torch.manual_seed(0)
+        hidden = torch.randn(3, 7, 16, requires_grad=True)
+        weight = torch.randn(vocab, 16, requires_grad=True)
+        teacher = torch.randn(3, 7, vocab) * 3.0
+        labels = torch.randint(0, vocab, (3, 7))
+        labels[0, -2:] = 0  # padding
+        return hidden, weight, teacher, labels
+
+    def test_full_support_matches_dense(self):
+        hidden, weight, teacher, labels = self._inputs()
+        values, indices, lse = teacher_topk_targets(teacher, 40, temperature=2.0, chunk_size=5)
+        kl, ce = sparse_distillation_losses(
+            hidden, weight, labels, values, indices, lse, temperature=2.0, chunk_size=4
+        )
+        dense_kl, dense_ce = _dense_losses(hidden @ weight.t(), teacher, labels, 2.0)
+        torch.testing.assert_close(kl, dense_kl, atol=1e-4, rtol=1e-4)
+        torch.testing.assert_close(ce, dense_ce)
+
+        sparse_grads = torch.autograd.grad(kl + ce, (hidden, weight))
+        dense_grads = torch.autograd.grad(dense_kl + dense_ce, (hidden, weight))
+        for got, expected in zip(sparse_grads, dense_grads):
+            torch.testing.assert_close(got, expected, atol=1e-4, rtol=1e-4)
+
+    def test_topk_with_tail_bucket_approximates_dense(self):
+        hidden, weight, teacher, labels = self._inputs(vocab=200)
+        values, indices, lse = teacher_topk_targets(teacher, 32, temperature=1.0)
+        kl, _ = sparse_distillation_losses(
+            hidden, weight, labels, values, indices, lse, temperature=1.0, chunk_size=8
+        )
+        dense_kl, _ = _dense_losses(hidden @ weight.t(), teacher, labels, 1.0)
+        # Collapsing the tail into one bucket can only lose information.
+        assert 0.0 <= kl.item() <= dense_kl.item() + 1e-4
+
+    def test_chunk_size_does_not_change_result(self):
+        hidden, weight, teacher, labels = self._inputs()
+        values, indices, lse = teacher_topk_targets(teacher, 8, temperature=2.0)
+        a = sparse_distillation_losses(
+            hidden, weight, labels, values, indices, lse, temperature=2.0, chunk_size=1
+        )
+        b = sparse_distillation_losses(
+            hidden, weight, labels, values, indices, lse, temperature=2.0, chunk_size=1024
+        )
+        for x, y in zip(a, b):
+            torch.testing.assert_close(x, y)
+
+    def test_trainer_selects_topk_on_contiguous_teacher_logits(self, monkeypatch):
+        from persistent_diamonds_v3.training import distill
+
+        seen: list[tuple[int, ...]] = []
+
+        def _checked(teacher_logits, *args, **kwargs):
+            assert teacher_logits.is_contiguous()
+            seen.append(tuple(teacher_logits.shape))
+            return teacher_topk_targets(teacher_logits, *args, **kwargs)
+
+        monkeypatch.setattr(distill, "teacher_topk_targets", _checked)
+        monkeypatch.setattr(
+            DistillationTrainer, "_load_teacher", lambda self, config: (_FakeTeacher(), "fake/teacher")
+        )
+        dataset = [
+            {
+                "code_indices": torch.randint(0, 32, (6, 4)),
+                "input_ids": torch.randint(1, 200, (12,)),
+                "attention_mask": torch.ones(12, dtype=torch.long),
+            }
+            for _ in range(4)
+        ]
+        cfg = DistillationConfig(max_steps=1, batch_size=2, kl_mode="topk", teacher_top_k=8)
+        result = DistillationTrainer(_small_report_head(), cfg, device="cpu").train(dataset)
+        assert result.steps == 1
+        assert seen == [(2, 12, 200)]
+        assert np.isfinite(result.final_loss_kl)
+
+    def test_report_head_forward_hidden_matches_logits(self):
+        report = _small_report_head().eval()
+        codes = torch.randint(0, 32, (2, 10, 4))
+        ids = torch.randint(1, 200, (2, 12))
+        hidden = report.forward_hidden(codes, ids)
+        torch.testing.assert_close(report.lm_head(hidden), report(codes, ids))
+
+
+# ---------------------------------------------------------------------------
+# Pre-tokenized corpus, length bucketing and dynamic padding
+# ---------------------------------------------------------------------------
+
+def _write_varied_corpus(tmp_path: Path, lengths: list[int]) -> Path:
+    corpus_path = tmp_path / "varied.jsonl"
+    with corpus_path.open("w") as f:
+        for i, n in enumerate(lengths):
+            f.write(json.dumps({"trajectory_index": i % 8, "text": "x" * n}) + "\n")
+    return corpus_path
+
+
+class TestTokenizedCorpus:
+    def test_ragged_tokens_match_tokenizer_and_are_reused(self, tmp_path):
+        corpus_path = _write_varied_corpus(tmp_path, [3, 40, 0, 17])
+        tokenizer = _FakeTokenizer()
+        path = build_tokenized_corpus(
+            corpus_path, tokenizer, tmp_path / "tokens", max_text_length=32, batch_size=3
+        )
+        mtime = (path / "tokens.bin").stat().st_mtime
+        assert build_tokenized_corpus(
+            corpus_path, tokenizer, tmp_path / "tokens", max_text_length=32
+        ) == path
+        assert (path / "tokens.bin").stat().st_mtime == mtime
+
+        corpus = TokenizedCorpus(path)
+        assert len(corpus) == 4
+        assert corpus.lengths.tolist() == [3, 32, 0, 17]
+        expected = tokenizer("x" * 17, max_length=32)["input_ids"][0]
+        assert corpus[3]["input_ids"].tolist() == expected
+        assert corpus[3]["attention_mask"].tolist() == [1] * 17
+
+    def test_cached_dataset_returns_unpadded_rows(self, tmp_path):
+        world, narrator = _small_world_narrator()
+        npz_path = _make_objective_npz(tmp_path)
+        corpus_path = _write_varied_corpus(tmp_path, [5, 12, 30, 9])
+        code_cache = build_code_cache(
+            corpus_path=corpus_path,
+            objective_npz_path=npz_path,
+            world_model=world,
+            narrator=narrator,
+            cache_dir=tmp_path / "codes",
+        )
+        tokenizer = _FakeTokenizer()
+        corpus = TokenizedCorpus(
+            build_tokenized_corpus(corpus_path, tokenizer, tmp_path / "tokens", max_text_length=32)
+        )
+        ds = CachedNarratorTextDataset(
+            cache_path=code_cache,
+            corpus_path=corpus_path,
+            tokenizer=tokenizer,
+            max_text_length=32,
+            tokenized_corpus=corpus,
+        )
+        assert ds.lengths.tolist() == [5, 12, 30, 9]
+        assert ds[1]["input_ids"].shape == (12,)
+
+        batch = DynamicPaddingCollator()([ds[0], ds[1]])
+        assert batch["input_ids"].shape == (2, 12)
+        assert batch["attention_mask"].sum(dim=1).tolist() == [5, 12]
+        assert batch["code_indices"].shape == (2, 10, narrator.codes_per_step)
+
+    def test_stale_tokenized_corpus_raises(self, tmp_path):
+        npz_path = _make_objective_npz(tmp_path)
+        corpus_path = _make_corpus(tmp_path, npz_path, num=4)
+        other = _write_varied_corpus(tmp_path, [1, 2])
+        corpus = TokenizedCorpus(build_tokenized_corpus(other, _FakeTokenizer(), tmp_path / "tokens"))
+        world, narrator = _small_world_narrator()
+        code_cache = build_code_cache(
+            corpus_path=corpus_path,
+            objective_npz_path=npz_path,
+            world_model=world,
+            narrator=narrator,
+            cache_dir=tmp_path / "codes",
+        )
+        with pytest.raises(ValueError, match="cache is stale"):
+            CachedNarratorTextDataset(
+                cache_path=code_cache,
+                corpus_path=corpus_path,
+                tokenizer=_FakeTokenizer(),
+                tokenized_corpus=corpus,
+            )
+
+
+class TestLengthBucketBatchSampler:
+    def test_covers_every_index_once(self):
+        lengths = np.random.default_rng(0).integers(1, 256, size=103)
+        sampler = LengthBucketBatchSampler(lengths, 8, pool_multiplier=4)
+        batches = list(sampler)
+        assert len(batches) == len(sampler) == 13
+        assert sorted(i for b in batches for i in b) == list(range(103))
+
+    def test_batches_have_less_padding_than_random(self):
+        lengths = np.random.default_rng(1).integers(1, 256, size=800)
+        bucketed = list(LengthBucketBatchSampler(lengths, 16, seed=3))
+        random_batches = np.random.default_rng(3).permutation(800).reshape(-1, 16)
+
+        def padded(batches):
+            return sum(len(b) * lengths[list(b)].max() for b in batches)
+
+        assert padded(bucketed) < 0.7 * padded(random_batches)
+
+    def test_drop_last(self):
+        sampler = LengthBucketBatchSampler(np.arange(10), 4, drop_last=True)
+        batches = list(sampler)
+        assert len(batches) == len(sampler) == 2
+        assert all(len(b) == 4 for b in batches)
+
+
 # ---------------------------------------------------------------------------
 # Hidden alignment projection shape tests
 # ---------------------------------------------------------------------------
@@ -1,3 +1,6 @@
+import gc
+
+import pytest
 import torch
 
 from persistent_diamonds_v3.models import (
@@ -188,3 +191,562 @@ def test_control_head_gradient_flows():
     loss = out.action_logits.sum() + out.value_estimate.sum()
     loss.backward()
     assert narrator_state.grad is not None
+
+
+# --- Fused module dynamics tests ---
+
+
+def _fused_pair(**overrides):
+    kwargs = {
+        "input_dim": 16, "latent_dim": 70, "module_count": 4,
+        "overlap_ratio": 0.25, "hidden_dim": 32,
+    }
+    kwargs.update(overrides)
+    looped = ModularSSMWorldModel(**kwargs)
+    fused = ModularSSMWorldModel(**kwargs, fused=True)
+    fused.load_state_dict(looped.state_dict())
+    return looped, fused
+
+
+def test_fused_world_model_matches_looped():
+    looped, fused = _fused_pair()
+    x = torch.randn(3, 12, 16)
+    init = torch.randn(3, 70)
+    ref = looped(x, initial_state=init)
+    out = fused(x, initial_state=init)
+    torch.testing.assert_close(out.states, ref.states, rtol=1e-5, atol=1e-6)
+    torch.testing.assert_close(out.final_state, ref.final_state, rtol=1e-5, atol=1e-6)
+
+
+def test_fused_world_model_matches_looped_with_actions():
+    looped, fused = _fused_pair(action_dim=5)
+    x = torch.randn(2, 8, 16)
+    actions = torch.randn(2, 8, 5)
+    init = torch.zeros(2, 70)
+    torch.testing.assert_close(
+        fused(x, actions=actions, initial_state=init).states,
+        looped(x, actions=actions, initial_state=init).states,
+        rtol=1e-5, atol=1e-6,
+    )
+    # Missing actions default to zeros in both paths.
+    torch.testing.assert_close(
+        fused(x, initial_state=init).states,
+        looped(x, initial_state=init).states,
+        rtol=1e-5, atol=1e-6,
+    )
+
+
+def test_fused_world_model_gradients_match_looped():
+    looped, fused = _fused_pair()
+    x = torch.randn(2, 6, 16)
+    looped(x, initial_state=torch.zeros(2, 70)).states.pow(2).sum().backward()
+    fused(x, initial_state=torch.zeros(2, 70)).states.pow(2).sum().backward()
+    for (name, p_ref), (_, p_fused) in zip(looped.named_parameters(), fused.named_parameters()):
+        torch.testing.assert_close(p_fused.grad, p_ref.grad, rtol=1e-4, atol=1e-6, msg=name)
+
+
+def test_world_model_autograd_and_no_grad_paths_identical():
+    # Stacked (autograd) and preallocated (no-grad) outputs run the same ops
+    # in the same order, so they must agree bit for bit.
+    for fused in (False, True):
+        model = ModularSSMWorldModel(
+            input_dim=16, latent_dim=70, module_count=4, overlap_ratio=0.25, hidden_dim=32, fused=fused
+        )
+        x = torch.randn(3, 12, 16)
+        init = torch.randn(3, 70)
+        tracked = model(x, initial_state=init)
+        assert tracked.states.requires_grad
+        with torch.no_grad():
+            untracked = model(x, initial_state=init)
+        assert torch.equal(tracked.states, untracked.states)
+        assert torch.equal(tracked.final_state, untracked.final_state)
+
+
+def test_fused_world_model_state_dict_unchanged():
+    looped, fused = _fused_pair()
+    assert list(fused.state_dict().keys()) == list(looped.state_dict().keys())
+
+
+# --- Hoisted input projection tests ---
+
+
+def _reference_rollout(model, x, state, actions=None):
+    """Unsplit per-module reference: each module sees cat([input, state, action])."""
+    counts = torch.zeros(model.latent_dim)
+    for start, end in model.module_slices:
+        counts[start:end] += 1.0
+    states = []
+    for t in range(x.size(1)):
+        updates = torch.zeros_like(state)
+        action_t = actions[:, t] if actions is not None else None
+        for (start, end), module in zip(model.module_slices, model.modules_dyn):
+            updates[:, start:end] += module(x[:, t], state[:, start:end], action_t)
+        state = model.decay * state + (1.0 - model.decay) * updates / counts
+        states.append(state)
+    return torch.stack(states, dim=1)
+
+
+def test_hoisted_projection_matches_unsplit_reference():
+    for fused in (False, True):
+        model = ModularSSMWorldModel(
+            input_dim=16, latent_dim=64, module_count=3, overlap_ratio=0.25,
+            hidden_dim=32, action_dim=4, fused=fused,
+        )
+        x = torch.randn(2, 9, 16)
+        actions = torch.randn(2, 9, 4)
+        init = torch.randn(2, 64)
+        with torch.no_grad():
+            out = model(x, actions=actions, initial_state=init)
+            ref = _reference_rollout(model, x, init, actions)
+        torch.testing.assert_close(out.states, ref, rtol=1e-5, atol=1e-6)
+
+
+def test_forward_matches_repeated_step():
+    model = ModularSSMWorldModel(input_dim=16, latent_dim=64, module_count=4, overlap_ratio=0.25, hidden_dim=32)
+    x = torch.randn(2, 7, 16)
+    state = torch.zeros(2, 64)
+    with torch.no_grad():
+        out = model(x, initial_state=state)
+        for t in range(7):
+            state = model.step(x[:, t], state)
+            torch.testing.assert_close(out.states[:, t], state, rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize("fused", [False, True])
+def test_step_with_packed_weights_matches_unpacked(fused: bool, monkeypatch):
+    model = ModularSSMWorldModel(
+        input_dim=8, latent_dim=32, module_count=3, overlap_ratio=0.25, hidden_dim=16, action_dim=2, fused=fused,
+    )
+    x = torch.randn(2, 8)
+    action = torch.randn(2, 2)
+    state = torch.randn(2, 32)
+    with torch.no_grad():
+        packed = model.pack_dynamics()
+        expected = model.step(x, state, action, packed=packed)
+        expected_no_action = model.step(x, state, packed=packed)
+        # Without ``packed`` the step must not repack every call.
+        monkeypatch.setattr(model, "pack_dynamics", lambda: pytest.fail("step() repacked weights"))
+        torch.testing.assert_close(model.step(x, state, action), expected, rtol=1e-5, atol=1e-6)
+        torch.testing.assert_close(model.step(x, state), expected_no_action, rtol=1e-5, atol=1e-6)
+
+
+# --- Time-axis checkpointing tests ---
+
+
+def _saved_activation_bytes(fn) -> int:
+    total = 0
+
+    def _pack(t):
+        nonlocal total
+        total += t.numel() * t.element_size()
+        return t
+
+    with torch.autograd.graph.saved_tensors_hooks(_pack, lambda t: t):
+        fn()
+    return total
+
+
+def _retained_activation_bytes(fn) -> int:
+    """Bytes a forward pass keeps alive for backward.
+
+    Counts storages saved by autograd plus new tensors still referenced
+    from Python, such as non-reentrant checkpoint arguments, which bypass
+    saved-tensor hooks.  Each storage is counted once.
+    """
+    def _live() -> dict[int, int]:
+        gc.collect()
+        return {
+            obj.untyped_storage().data_ptr(): obj.untyped_storage().nbytes()
+            for obj in gc.get_objects()
+            if isinstance(obj, torch.Tensor) and obj.device.type == "cpu"
+        }
+
+    before = _live()
+    retained: dict[int, int] = {}
+
+    def _pack(t):
+        retained[t.untyped_storage().data_ptr()] = t.untyped_storage().nbytes()
+        return t
+
+    with torch.autograd.graph.saved_tensors_hooks(_pack, lambda t: t):
+        out = fn()
+    for ptr, nbytes in _live().items():
+        if ptr not in before:
+            retained[ptr] = nbytes
+    del out
+    return sum(retained.values())
+
+
+def test_time_checkpointed_world_model_matches_plain():
+    for fused in (False, True):
+        kwargs = {
+            "input_dim": 16, "latent_dim": 70, "module_count": 4,
+            "overlap_ratio": 0.25, "hidden_dim": 32,
+        }
+        plain = ModularSSMWorldModel(**kwargs, fused=fused)
+        ckpt = ModularSSMWorldModel(**kwargs, fused=fused)
+        ckpt.load_state_dict(plain.state_dict())
+        ckpt.set_time_checkpointing(segment_steps=5)
+        x = torch.randn(3, 12, 16)
+        init = torch.randn(3, 70)
+
+        ref = plain(x, initial_state=init)
+        out = ckpt(x, initial_state=init)
+        torch.testing.assert_close(out.states, ref.states)
+        torch.testing.assert_close(out.final_state, ref.final_state)
+
+        (ref.states.pow(2).sum() + ref.final_state.sum()).backward()
+        (out.states.pow(2).sum() + out.final_state.sum()).backward()
+        for (name, p_ref), (_, p_ckpt) in zip(plain.named_parameters(), ckpt.named_parameters()):
+            torch.testing.assert_close(p_ckpt.grad, p_ref.grad, rtol=1e-5, atol=1e-6, msg=name)
+
+
+def test_time_checkpointing_bounds_saved_activations():
+    kwargs = {
+        "input_dim": 8, "latent_dim": 64, "module_count": 4,
+        "overlap_ratio": 0.25, "hidden_dim": 64,
+    }
+    model = ModularSSMWorldModel(**kwargs, fused=True)
+    x = torch.randn(2, 64, 8)
+
+    plain = _saved_activation_bytes(lambda: model(x, initial_state=torch.zeros(2, 64)))
+    model.set_time_checkpointing()
+    assert model._segment_steps(2, 64, torch.float32) == 8
+    checkpointed = _saved_activation_bytes(lambda: model(x, initial_state=torch.zeros(2, 64)))
+    assert checkpointed < plain / 4
+
+    model.set_time_checkpointing(memory_budget_mb=0.05)
+    modules, width = model._packed_index.shape
+    per_step = 4 * 2 * (3 * modules * 64 + 2 * modules * width + 4 * 64)
+    assert model._segment_steps(2, 64, torch.float32) == int(0.05 * 2**20) // per_step
+    assert model._segment_steps(2, 64, torch.bfloat16) == int(0.05 * 2**20) // (per_step // 2)
+    model.set_time_checkpointing(False)
+    assert model(x).states.shape == (2, 64, 64)
+
+
+def test_time_checkpointing_keeps_no_full_length_projection():
+    kwargs = {
+        "input_dim": 8, "latent_dim": 32, "module_count": 4,
+        "overlap_ratio": 0.25, "hidden_dim": 128,
+    }
+    model = ModularSSMWorldModel(**kwargs, fused=True)
+    model.set_time_checkpointing(segment_steps=8)
+
+    def _retained(steps: int) -> int:
+        x = torch.randn(2, steps, 8)
+        return _retained_activation_bytes(lambda: model(x, initial_state=torch.zeros(2, 32)))
+
+    # Beyond the [B, T, D] output, retained memory is one state per
+    # segment; a kept [B, T, M*H] projection would add 4 KiB per step.
+    short, long = _retained(64), _retained(256)
+    output_growth = 4 * 2 * 32 * (256 - 64)
+    projection_growth = 4 * 2 * 4 * 128 * (256 - 64)
+    assert long - short < output_growth + projection_growth // 4
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="peak allocator stats need CUDA")
+def test_time_checkpointing_bounds_peak_memory_cuda():
+    kwargs = {
+        "input_dim": 8, "latent_dim": 64, "module_count": 4,
+        "overlap_ratio": 0.25, "hidden_dim": 256,
+    }
+    model = ModularSSMWorldModel(**kwargs, fused=True).cuda()
+    x = torch.randn(4, 256, 8, device="cuda")
+
+    def _peak() -> int:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+        model(x, initial_state=torch.zeros(4, 64, device="cuda")).states.pow(2).sum().backward()
+        model.zero_grad(set_to_none=True)
+        torch.cuda.synchronize()
+        return torch.cuda.max_memory_allocated() - base
+
+    plain = _peak()
+    model.set_time_checkpointing()
+    assert _peak() < plain / 4
+
+
+# --- All-windows narrator tests ---
+
+
+def test_narrator_forward_all_windows_matches_per_step():
+    narrator = DiscreteNarrator(
+        latent_dim=32, hidden_dim=16, window_size=4, update_hz=10,
+        codebook_size=64, codes_per_step=4, code_dim=8,
+    )
+    states = torch.randn(3, 11, 32)
+    with torch.no_grad():
+        out = narrator.forward_all_windows(states)
+        assert out.code_indices.shape == (3, 11, 4)
+        assert out.narrator_state.shape == (3, 11, 32)
+        assert out.hidden_state.shape == (1, 3, 11, 16)
+        for t in range(11):
+            ref = narrator(states[:, max(0, t - 3) : t + 1])
+            assert torch.equal(out.code_indices[:, t], ref.code_indices)
+            torch.testing.assert_close(out.narrator_state[:, t], ref.narrator_state)
+            torch.testing.assert_close(out.uncertainty[:, t], ref.uncertainty, rtol=1e-5, atol=1e-5)
+            torch.testing.assert_close(out.hidden_state[:, :, t], ref.hidden_state, rtol=1e-5, atol=1e-5)
+
+
+def test_narrator_forward_all_windows_chunking_is_exact():
+    narrator = DiscreteNarrator(
+        latent_dim=32, hidden_dim=16, window_size=4, update_hz=10,
+        codebook_size=64, codes_per_step=4, code_dim=8,
+    )
+    states = torch.randn(2, 11, 32)
+    with torch.no_grad():
+        full = narrator.forward_all_windows(states)
+        for chunk_steps in (1, 2, 5):
+            out = narrator.forward_all_windows(states, chunk_steps=chunk_steps)
+            assert torch.equal(out.code_indices, full.code_indices)
+            torch.testing.assert_close(out.hidden_state, full.hidden_state)
+            torch.testing.assert_close(out.vq_loss, full.vq_loss)
+
+
+def test_narrator_forward_all_windows_short_sequence():
+    narrator = DiscreteNarrator(
+        latent_dim=32, hidden_dim=16, window_size=8, update_hz=10,
+        codebook_size=64, codes_per_step=4, code_dim=8,
+    )
+    states = torch.randn(2, 3, 32)
+    with torch.no_grad():
+        out = narrator.forward_all_windows(states)
+        for t in range(3):
+            assert torch.equal(out.code_indices[:, t], narrator(states[:, : t + 1]).code_indices)
+
+
+def test_narrator_rollout_matches_stepwise_loop():
+    narrator = DiscreteNarrator(
+        latent_dim=32, hidden_dim=16, window_size=4, update_hz=10,
+        codebook_size=64, codes_per_step=4, code_dim=8,
+    )
+    states = torch.randn(2, 17, 32)
+    stride = narrator.update_stride(30)
+    assert stride == 3
+
+    with torch.no_grad():
+        rollout = narrator.rollout(states, update_stride=stride)
+        hidden = None
+        ref_states, ref_codes, ref_preds, vq = [], [], [], []
+        for t in range(0, 17, stride):
+            out = narrator(states[:, max(0, t - 3) : t + 1], hidden_state=hidden)
+            hidden = out.hidden_state
+            ref_states.append(out.narrator_state)
+            ref_codes.append(out.code_indices)
+            ref_preds.append(out.predicted_next_state)
+            vq.append(out.vq_loss)
+
+    assert rollout.update_indices.tolist() == [0, 3, 6, 9, 12, 15]
+    assert torch.equal(rollout.code_indices, torch.stack(ref_codes, dim=1))
+    torch.testing.assert_close(rollout.narrator_state, torch.stack(ref_states, dim=1))
+    torch.testing.assert_close(rollout.predicted_next_state, torch.stack(ref_preds, dim=1), rtol=1e-5, atol=1e-6)
+    torch.testing.assert_close(rollout.vq_loss, torch.stack(vq).mean(), rtol=1e-5, atol=1e-7)
+
+    per_step = rollout.per_step(rollout.narrator_state)
+    assert per_step.shape == (2, 17, 32)
+    for t in range(17):
+        assert torch.equal(per_step[:, t], rollout.narrator_state[:, t // stride])
+
+
+def test_narrator_rollout_continues_across_chunks():
+    narrator = DiscreteNarrator(
+        latent_dim=32, hidden_dim=16, window_size=4, update_hz=10,
+        codebook_size=64, codes_per_step=4, code_dim=8,
+    )
+    states = torch.randn(2, 17, 32)
+    with torch.no_grad():
+        full = narrator.rollout(states, update_stride=3)
+        hidden, history, parts = None, None, []
+        # Chunk lengths are multiples of the stride, except the last.
+        for start, stop in ((0, 6), (6, 9), (9, 17)):
+            part = narrator.rollout(
+                states[:, start:stop], update_stride=3, hidden_state=hidden, history=history
+            )
+            hidden, history = part.hidden_state, states[:, :stop]
+            parts.append(part)
+
+    assert torch.equal(torch.cat([p.code_indices for p in parts], dim=1), full.code_indices)
+    torch.testing.assert_close(torch.cat([p.narrator_state for p in parts], dim=1), full.narrator_state)
+    torch.testing.assert_close(parts[-1].hidden_state, full.hidden_state)
+
+
+def test_vq_chunked_search_matches_full_distances():
+    from persistent_diamonds_v3.models.narrator import MultiCodeVectorQuantizer
+
+    torch.manual_seed(0)
+    quantizer = MultiCodeVectorQuantizer(codebook_size=128, code_dim=8, memory_budget_mb=0.001)
+    queries = torch.randn(3, 40, 8)
+    codes, quantized, _ = quantizer(queries)
+
+    distances = (
+        queries.pow(2).sum(-1, keepdim=True)
+        + quantizer.embedding.pow(2).sum(-1).view(1, 1, -1)
+        - 2.0 * torch.einsum("bkc,nc->bkn", queries, quantizer.embedding)
+    )
+    assert torch.equal(codes, distances.argmin(dim=-1))
+    torch.testing.assert_close(quantized, quantizer.embedding[codes])
+
+
+def test_vq_norm_cache_tracks_codebook_updates():
+    from persistent_diamonds_v3.models.narrator import MultiCodeVectorQuantizer
+
+    quantizer = MultiCodeVectorQuantizer(codebook_size=16, code_dim=4)
+    norms = quantizer.codebook_norms()
+    assert quantizer.codebook_norms() is norms
+
+    _, _, vq_loss = quantizer(torch.randn(2, 3, 4))
+    vq_loss.backward()
+    torch.optim.SGD(quantizer.parameters(), lr=1.0).step()
+    refreshed = quantizer.codebook_norms()
+    assert refreshed is not norms
+    torch.testing.assert_close(refreshed, quantizer.embedding.detach().pow(2).sum(-1))
+
+
+def test_vq_ivf_search_recall_and_gradients():
+    from persistent_diamonds_v3.models.narrator import MultiCodeVectorQuantizer
+
+    torch.manual_seed(0)
+    exact = MultiCodeVectorQuantizer(codebook_size=256, code_dim=8)
+    approx = MultiCodeVectorQuantizer(codebook_size=256, code_dim=8, search="ivf", probe=4)
+    approx.load_state_dict(exact.state_dict())
+    queries = torch.randn(4, 64, 8) * 0.02
+
+    # A codebook still being trained uses exact search and never builds the index.
+    train_codes, _, _ = approx(queries)
+    assert approx._index_cache is None
+
+    exact_codes, _, _ = exact(queries)
+    assert torch.equal(train_codes, exact_codes)
+    approx.eval()
+    approx_codes, _, vq_loss = approx(queries)
+    assert approx._index_cache is not None
+    recall = (exact_codes == approx_codes).float().mean().item()
+    assert recall > 0.8
+
+    vq_loss.backward()
+    assert approx.embedding.grad is not None
+    assert approx.embedding.grad.abs().sum() > 0
+
+
+def _small_report_head() -> ReportHead:
+    torch.manual_seed(0)
+    report = ReportHead(
+        codebook_size=64,
+        vocab_size=48,
+        model_dim=32,
+        layer_count=2,
+        head_count=4,
+        ff_dim=64,
+        dropout=0.1,
+        max_seq_len=24,
+    )
+    return report.eval()
+
+
+def test_report_head_decode_step_matches_forward():
+    report = _small_report_head()
+    code_indices = torch.randint(0, 64, (3, 5, 4))
+    input_ids = torch.randint(0, 48, (3, 10))
+
+    with torch.no_grad():
+        full = report(code_indices, input_ids)
+        cache = report.init_cache(code_indices, 10)
+        stepped = torch.stack([report.decode_step(input_ids[:, t], cache) for t in range(10)], dim=1)
+    torch.testing.assert_close(stepped, full, rtol=1e-4, atol=1e-5)
+
+
+def test_report_head_cached_generate_matches_uncached():
+    report = _small_report_head()
+    code_indices = torch.randint(0, 64, (3, 5, 4))
+
+    cached = report.generate(code_indices, bos_token_id=1, eos_token_id=2, max_new_tokens=16)
+    uncached = report.generate(code_indices, bos_token_id=1, eos_token_id=2, max_new_tokens=16, use_cache=False)
+    assert torch.equal(cached, uncached)
+
+
+def test_report_head_generate_batch_greedy_stops_per_sequence():
+    report = _small_report_head()
+    code_indices = torch.randint(0, 64, (6, 5, 4))
+    # Pick an EOS id that some, but not all, rows emit early.
+    reference = report.generate(code_indices, bos_token_id=1, eos_token_id=-1, max_new_tokens=12)
+    eos = int(reference[0, 3])
+
+    out = report.generate_batch(code_indices, bos_token_id=1, eos_token_id=eos, max_new_tokens=12, pad_token_id=0)
+    assert out.sequences.size(1) == int(out.lengths.max())
+    for row in range(6):
+        length = int(out.lengths[row])
+        ref = reference[row, :length]
+        assert torch.equal(out.sequences[row, :length], ref)
+        assert (out.sequences[row, length:] == 0).all()
+        stop = (ref[1:] == eos).nonzero()
+        assert length == (int(stop[0]) + 2 if stop.numel() else 13)
+
+    logits = report(code_indices[:1], reference[:1, :-1])
+    expected = logits.log_softmax(-1).gather(-1, reference[:1, 1:].unsqueeze(-1)).squeeze(-1)
+    length = int(out.lengths[0])
+    torch.testing.assert_close(out.scores[0], expected[0, : length - 1].sum(), rtol=1e-4, atol=1e-4)
+
+
+def test_report_head_generate_batch_sampling_filters():
+    report = _small_report_head()
+    code_indices = torch.randint(0, 64, (4, 5, 4))
+    greedy = report.generate_batch(code_indices, bos_token_id=1, eos_token_id=2, max_new_tokens=8)
+    top1 = report.generate_batch(
+        code_indices, bos_token_id=1, eos_token_id=2, max_new_tokens=8, strategy="sample", top_k=1
+    )
+    nucleus = report.generate_batch(
+        code_indices, bos_token_id=1, eos_token_id=2, max_new_tokens=8, strategy="sample", top_p=1e-6
+    )
+    assert torch.equal(top1.sequences, greedy.sequences)
+    assert torch.equal(nucleus.sequences, greedy.sequences)
+
+    gen = torch.Generator().manual_seed(0)
+    sampled = report.generate_batch(
+        code_indices, bos_token_id=1, eos_token_id=2, max_new_tokens=8,
+        strategy="sample", temperature=0.7, top_k=10, top_p=0.9, generator=gen,
+    )
+    assert sampled.sequences.shape[0] == 4
+    assert (sampled.lengths <= 9).all()
+
+
+def test_report_head_beam_search():
+    report = _small_report_head()
+    code_indices = torch.randint(0, 64, (3, 5, 4))
+    greedy = report.generate_batch(code_indices, bos_token_id=1, eos_token_id=2, max_new_tokens=10)
+    single = report.generate_batch(
+        code_indices, bos_token_id=1, eos_token_id=2, max_new_tokens=10, strategy="beam", num_beams=1
+    )
+    assert torch.equal(single.sequences, greedy.sequences)
+    torch.testing.assert_close(single.scores, greedy.scores)
+
+    beam = report.generate_batch(
+        code_indices, bos_token_id=1, eos_token_id=2, max_new_tokens=10,
+        strategy="beam", num_beams=4, length_penalty=0.0,
+    )
+    for row in range(3):
+        length = int(beam.lengths[row])
+        seq = beam.sequences[row : row + 1, :length]
+        logits = report(code_indices[row : row + 1], seq[:, :-1])
+        expected = logits.log_softmax(-1).gather(-1, seq[:, 1:].unsqueeze(-1)).sum()
+        torch.testing.assert_close(beam.scores[row], expected, rtol=1e-4, atol=1e-4)
+
+
+def test_report_head_exhaustive_beam_finds_best_two_token_report():
+    report = _small_report_head()
+    code_indices = torch.randint(0, 64, (2, 5, 4))
+    eos = 2
+    beam = report.generate_batch(
+        code_indices, bos_token_id=1, eos_token_id=eos, max_new_tokens=2,
+        strategy="beam", num_beams=48, length_penalty=0.0,
+    )
+
+    with torch.no_grad():
+        bos = torch.ones(2, 1, dtype=torch.long)
+        first = report(code_indices, bos)[:, -1].log_softmax(-1)  # [B, V]
+        prefixes = torch.cat([bos.repeat_interleave(48, 0), torch.arange(48).repeat(2).unsqueeze(1)], dim=1)
+        second = report(code_indices.repeat_interleave(48, 0), prefixes)[:, -1].log_softmax(-1).view(2, 48, 48)
+    totals = first.unsqueeze(-1) + second
+    totals[:, eos] = float("-inf")
+    best = torch.maximum(totals.flatten(1).max(dim=-1).values, first[:, eos])
+    torch.testing.assert_close(beam.scores, best, rtol=1e-4, atol=1e-4)
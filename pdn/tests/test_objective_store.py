@@ -1,6 +1,22 @@
+import json
+import pickle
 from pathlib import Path
 
-from persistent_diamonds_v3.data import IQTObjectiveDataStore, ObjectiveRequest, ObjectiveTensorDataset
+import numpy as np
+import torch
+
+from persistent_diamonds_v3.data import (
+    ChunkedArray,
+    IQTObjectiveDataStore,
+    ObjectiveBatchSampler,
+    ObjectiveRequest,
+    ObjectiveTensorDataset,
+    SequenceChunkSampler,
+    StreamingObjectiveDataset,
+    load_objective_arrays,
+    objective_loader,
+)
+from persistent_diamonds_v3.data.objectives import shift_targets
 
 
 def test_objective_store_reuse(tmp_path: Path):
@@ -25,3 +41,223 @@ def test_objective_store_reuse(tmp_path: Path):
     assert item["observations"].shape == (16, 12)
     assert item["targets"].shape == (16, 12)
     assert item["external_drive"].shape == (16, 12)
+
+
+def test_objective_generation_independent_of_sharding(tmp_path: Path):
+    request = ObjectiveRequest(
+        objective="compression",
+        num_sequences=150,
+        sequence_length=10,
+        feature_dim=16,
+        seed=3,
+    )
+    serial = IQTObjectiveDataStore(tmp_path / "serial", shard_size=1000).materialize(request)
+    sharded = IQTObjectiveDataStore(tmp_path / "sharded", workers=2, shard_size=64).materialize(request)
+
+    a, b = load_objective_arrays(serial.dataset_path), load_objective_arrays(sharded.dataset_path)
+    for key in ("observations", "targets", "external_drive", "task_signal"):
+        np.testing.assert_array_equal(np.asarray(a[key]), np.asarray(b[key]))
+    assert sorted(p.name for p in sharded.dataset_path.parent.iterdir()) == ["data.npz", "manifest.json"]
+
+
+def test_multi_timescale_latents_match_stepped_recurrence():
+    t, n, d = 45, 3, 5
+    x = IQTObjectiveDataStore._multi_timescale_latents(np.random.default_rng(7), n=n, t=t, d=d, block_size=16)
+
+    rng = np.random.default_rng(7)
+    state = rng.standard_normal(size=(3, n * d), dtype=np.float32) * np.float32(0.15)
+    decay = np.array([0.995, 0.97, 0.85], dtype=np.float32)[:, None]
+    scale = np.array([0.01, 0.04, 0.12], dtype=np.float32)[:, None]
+    expected = np.empty_like(x)
+    for start in range(0, t, 16):
+        length = min(16, t - start)
+        noise = rng.standard_normal(size=(length, 3, n * d), dtype=np.float32)
+        for j in range(length):
+            state = decay * state + scale * noise[j]
+            expected[:, start + j] = state.sum(axis=0).reshape(n, d)
+    np.testing.assert_allclose(x, expected, rtol=1e-4, atol=1e-6)
+
+
+def test_npy_storage_memory_maps_and_converts_npz(tmp_path: Path):
+    request = ObjectiveRequest(
+        objective="mixed",
+        num_sequences=6,
+        sequence_length=8,
+        feature_dim=4,
+        seed=5,
+    )
+    npz = IQTObjectiveDataStore(tmp_path / "cache").materialize(request)
+    expected = ObjectiveTensorDataset(npz.dataset_path)
+
+    store = IQTObjectiveDataStore(tmp_path / "cache", storage_format="npy")
+    converted = store.materialize(request)
+    assert converted.reused is True
+    assert converted.dataset_path.is_dir()
+    assert not npz.dataset_path.exists()
+    assert store.list_cached() == [converted.dataset_path]
+
+    ds = ObjectiveTensorDataset(converted.dataset_path)
+    assert isinstance(load_objective_arrays(converted.dataset_path)["observations"], np.memmap)
+    for i in range(len(ds)):
+        for key, value in ds[i].items():
+            assert torch.equal(value, expected[i][key])
+
+    restored = pickle.loads(pickle.dumps(ds))
+    assert torch.equal(restored[3]["targets"], ds[3]["targets"])
+
+
+def test_chunked_storage_random_access(tmp_path: Path):
+    request = ObjectiveRequest(
+        objective="persistence",
+        num_sequences=11,
+        sequence_length=6,
+        feature_dim=3,
+        seed=9,
+    )
+    expected = ObjectiveTensorDataset(IQTObjectiveDataStore(tmp_path / "npz").materialize(request).dataset_path)
+    store = IQTObjectiveDataStore(tmp_path / "chunked", storage_format="chunked", chunk_rows=4, chunk_codec="lzma")
+    ds = ObjectiveTensorDataset(store.materialize(request).dataset_path)
+
+    observations = ds.observations
+    assert isinstance(observations, ChunkedArray)
+    assert len(ds) == 11
+    assert torch.equal(ds[9]["targets"], expected[9]["targets"])
+    assert list(observations._chunks) == [2]
+    np.testing.assert_array_equal(observations[[10, 1, 5]], expected.observations[[10, 1, 5]].numpy())
+    np.testing.assert_array_equal(np.asarray(observations), expected.observations.numpy())
+
+
+def test_compact_store_derives_targets_and_zero_drive(tmp_path: Path):
+    observations = np.random.default_rng(0).standard_normal((5, 7, 3)).astype(np.float32)
+    source = tmp_path / "obs.npy"
+    np.save(source, observations)
+    request = ObjectiveRequest(source_path=str(source))
+
+    full = IQTObjectiveDataStore(tmp_path / "full", compact=False).materialize(request)
+    compact = IQTObjectiveDataStore(tmp_path / "compact", storage_format="npy").materialize(request)
+
+    manifest = json.loads(compact.manifest_path.read_text())
+    assert manifest["compact"] is True
+    assert manifest["stored_arrays"] == ["observations"]
+    assert sorted(p.name for p in compact.dataset_path.iterdir()) == ["observations.npy"]
+
+    expected = ObjectiveTensorDataset(full.dataset_path)
+    ds = ObjectiveTensorDataset(compact.dataset_path)
+    assert ds.targets is None and ds.external_drive is None
+    item = ds[2]
+    for key, value in item.items():
+        assert torch.equal(value, expected[2][key])
+    assert item["external_drive"].stride() == (0, 0)
+
+    arrays = load_objective_arrays(compact.dataset_path)
+    np.testing.assert_array_equal(arrays["targets"][1:3], expected.targets[1:3].numpy())
+    assert arrays["task_signal"].shape == (5, 7, 1)
+
+
+def test_streaming_dataset_is_deterministic_and_resumable():
+    request = ObjectiveRequest(objective="compression", sequence_length=6, feature_dim=8, seed=4)
+
+    def first_batches(num_workers: int, start_step: int = 0, count: int = 4):
+        ds = StreamingObjectiveDataset(request, batch_size=3, start_step=start_step)
+        loader = objective_loader(ds, batch_size=3, shuffle=True, num_workers=num_workers)
+        return [batch for batch, _ in zip(loader, range(count))]
+
+    serial = first_batches(0)
+    assert serial[0]["observations"].shape == (3, 6, 8)
+    assert not torch.equal(serial[0]["observations"], serial[1]["observations"])
+    for a, b in zip(serial, first_batches(2)):
+        for key in a:
+            assert torch.equal(a[key], b[key])
+    resumed = first_batches(0, start_step=2, count=2)
+    assert torch.equal(resumed[0]["targets"], serial[2]["targets"])
+    resumed = objective_loader(
+        StreamingObjectiveDataset(request, batch_size=3), batch_size=3, shuffle=True, start_step=2
+    )
+    assert torch.equal(next(iter(resumed))["targets"], serial[2]["targets"])
+
+
+def test_npy_source_ingested_in_bounded_chunks(tmp_path: Path):
+    observations = np.random.default_rng(1).standard_normal((9, 5, 4))
+    source = tmp_path / "obs.npy"
+    np.save(source, observations)
+    request = ObjectiveRequest(source_path=str(source))
+
+    # A 0 MB ceiling forces one sequence per chunk.
+    for storage_format in ("npz", "npy", "chunked"):
+        store = IQTObjectiveDataStore(
+            tmp_path / storage_format,
+            storage_format=storage_format,
+            compact=False,
+            memory_limit_mb=0,
+        )
+        arrays = load_objective_arrays(store.materialize(request).dataset_path)
+        expected = observations.astype(np.float32)
+        np.testing.assert_array_equal(np.asarray(arrays["observations"]), expected)
+        np.testing.assert_array_equal(np.asarray(arrays["targets"]), shift_targets(expected))
+        assert np.asarray(arrays["external_drive"]).dtype == np.float32
+
+
+def test_batch_loader_slices_views_and_gathers_shuffled(tmp_path: Path):
+    request = ObjectiveRequest(
+        objective="mixed",
+        num_sequences=10,
+        sequence_length=5,
+        feature_dim=3,
+        seed=2,
+    )
+    store = IQTObjectiveDataStore(tmp_path / "cache", storage_format="npy")
+    ds = ObjectiveTensorDataset(store.materialize(request).dataset_path)
+
+    batches = list(objective_loader(ds, batch_size=4, shuffle=False))
+    assert [b["observations"].shape[0] for b in batches] == [4, 4, 2]
+    second = batches[1]["observations"]
+    assert second.untyped_storage().data_ptr() == ds.observations.untyped_storage().data_ptr()
+    for key, value in batches[1].items():
+        assert torch.equal(value, torch.stack([ds[i][key] for i in range(4, 8)]))
+
+    sampler = ObjectiveBatchSampler(len(ds), 4, shuffle=True)
+    keys = list(sampler)
+    assert sorted(np.concatenate(keys).tolist()) == list(range(10))
+    assert not np.array_equal(np.concatenate(keys), np.concatenate(list(sampler)))
+    batch = ds[keys[0]]
+    for key, value in batch.items():
+        assert torch.equal(value, torch.stack([ds[int(i)][key] for i in keys[0]]))
+
+
+def test_worker_batches_copy_only_their_rows(tmp_path: Path):
+    request = ObjectiveRequest(objective="mixed", num_sequences=12, sequence_length=5, feature_dim=3, seed=2)
+    store = IQTObjectiveDataStore(tmp_path / "cache", storage_format="npy", compact=False)
+    ds = ObjectiveTensorDataset(store.materialize(request).dataset_path)
+
+    inline = list(objective_loader(ds, batch_size=4, shuffle=False))
+    workers = list(objective_loader(ds, batch_size=4, shuffle=False, num_workers=2))
+    assert len(workers) == len(inline) == 3
+    for got, expected in zip(workers, inline):
+        for key, value in got.items():
+            assert torch.equal(value, expected[key])
+            assert value.untyped_storage().nbytes() == value.numel() * value.element_size()
+
+
+def test_sequence_chunks_cover_sequences_with_continuous_targets(tmp_path: Path):
+    observations = np.random.default_rng(3).standard_normal((5, 10, 2)).astype(np.float32)
+    source = tmp_path / "obs.npy"
+    np.save(source, observations)
+    store = IQTObjectiveDataStore(tmp_path / "cache", storage_format="npy")
+    ds = ObjectiveTensorDataset(store.materialize(ObjectiveRequest(source_path=str(source))).dataset_path)
+
+    sampler = SequenceChunkSampler(len(ds), ds.sequence_length, 2, 4, shuffle=True)
+    keys = list(sampler)
+    assert len(keys) == len(sampler) == 6
+    assert [(k[1].start, k[1].stop) for k in keys[:3]] == [(0, 4), (4, 8), (8, 10)]
+    for start in (0, 3):
+        rows = keys[start][0]
+        assert all(np.array_equal(rows, k[0]) for k in keys[start : start + 3])
+        chunks = [ds[k] for k in keys[start : start + 3]]
+        assert [c["chunk_start"] for c in chunks] == [0, 4, 8]
+        for key in ("observations", "targets"):
+            expected = torch.stack([ds[int(r)][key] for r in rows])
+            assert torch.equal(torch.cat([c[key] for c in chunks], dim=1), expected)
+
+    batches = list(objective_loader(ds, batch_size=2, shuffle=False, chunk_length=4))
+    assert [b["chunk_start"] for b in batches] == [0, 4, 8, 0, 4, 8]
+    assert torch.equal(batches[1]["observations"], ds[0:2]["observations"][:, 4:8])
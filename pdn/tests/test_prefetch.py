@@ -0,0 +1,72 @@
+"""Tests for the background device-staging input pipeline."""
+
+import threading
+import time
+
+import pytest
+import torch
+
+from persistent_diamonds_v3.data import DevicePrefetcher, loader_options
+
+
+def _batches(count: int, delay: float = 0.0):
+    for i in range(count):
+        if delay:
+            time.sleep(delay)
+        yield {"observations": torch.full((2, 3), float(i)), "index": i}
+
+
+class _Loader:
+    def __init__(self, count: int, delay: float = 0.0):
+        self.count = count
+        self.delay = delay
+
+    def __iter__(self):
+        return _batches(self.count, self.delay)
+
+
+@pytest.mark.parametrize("depth", [0, 1, 3])
+def test_prefetcher_preserves_order_and_counts_batches(depth):
+    pipeline = DevicePrefetcher(_Loader(5), "cpu", depth=depth)
+    for _ in range(2):
+        assert [batch["index"] for batch in pipeline] == list(range(5))
+    assert pipeline.batches == 10
+
+
+def test_prefetcher_reports_time_blocked_on_loader():
+    pipeline = DevicePrefetcher(_Loader(3, delay=0.05), "cpu", depth=1)
+    batches = list(pipeline)
+    assert len(batches) == 3
+    assert pipeline.wait_seconds >= 0.1
+
+
+def test_prefetcher_stops_thread_on_early_exit():
+    before = threading.active_count()
+    pipeline = DevicePrefetcher(_Loader(100), "cpu", depth=2)
+    for batch in pipeline:
+        if batch["index"] == 3:
+            break
+    assert threading.active_count() == before
+
+
+def test_prefetcher_reraises_loader_errors():
+    class _Broken:
+        def __iter__(self):
+            yield {"index": 0}
+            raise RuntimeError("bad shard")
+
+    with pytest.raises(RuntimeError, match="bad shard"):
+        list(DevicePrefetcher(_Broken(), "cpu", depth=1))
+
+
+def test_loader_options_drop_worker_settings_without_workers():
+    assert loader_options(0, prefetch_factor=4, persistent_workers=True) == {
+        "num_workers": 0,
+        "pin_memory": False,
+    }
+    assert loader_options(2, prefetch_factor=4, persistent_workers=True) == {
+        "num_workers": 2,
+        "pin_memory": False,
+        "persistent_workers": True,
+        "prefetch_factor": 4,
+    }
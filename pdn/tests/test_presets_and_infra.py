@@ -12,8 +12,16 @@ from persistent_diamonds_v3.config import (
     InfraConfig,
     PRESET_NAMES,
     PersistentDiamondsConfig,
+    Stage2LossWeights,
+    Stage4Config,
+)
+from persistent_diamonds_v3.data import ObjectiveRequest, StreamingObjectiveDataset
+from persistent_diamonds_v3.models import ControlHead, DiscreteNarrator, ModularSSMWorldModel
+from persistent_diamonds_v3.training import (
+    Stage1JEPATrainer,
+    Stage2ShapingTrainer,
+    Stage4EmbodiedTrainer,
 )
-from persistent_diamonds_v3.models import DiscreteNarrator, ModularSSMWorldModel
 from persistent_diamonds_v3.training.infra import (
     apply_activation_checkpointing,
     autocast_context,
@@ -235,11 +243,140 @@ def test_activation_checkpointing_enabled():
     assert torch.allclose(ref, out, atol=1e-5)
 
 
+def test_activation_checkpointing_enables_world_model_time_segments():
+    world = ModularSSMWorldModel(
+        input_dim=8, latent_dim=32, module_count=2, overlap_ratio=0.25, hidden_dim=16,
+    )
+    apply_activation_checkpointing(world, InfraConfig(activation_checkpointing=False))
+    assert world.time_checkpointing is False
+
+    infra = InfraConfig(activation_checkpointing=True, checkpoint_segment_steps=6)
+    apply_activation_checkpointing(world, infra)
+    assert world.time_checkpointing is True
+    assert world._segment_steps(4, 256, torch.float32) == 6
+
+
 def test_build_accelerator_returns_none_when_disabled():
     infra = InfraConfig(use_accelerate=False)
     assert build_accelerator(infra) is None
 
 
+# ---------------------------------------------------------------------------
+# Trainer wiring tests
+# ---------------------------------------------------------------------------
+
+
+def _tiny_world_narrator() -> tuple[ModularSSMWorldModel, DiscreteNarrator]:
+    world = ModularSSMWorldModel(
+        input_dim=16, latent_dim=32, module_count=2, overlap_ratio=0.25, hidden_dim=16,
+    )
+    narrator = DiscreteNarrator(
+        latent_dim=32, hidden_dim=16, window_size=4, update_hz=10,
+        codebook_size=32, codes_per_step=2, code_dim=8,
+    )
+    return world, narrator
+
+
+def _streaming(batch_size: int) -> StreamingObjectiveDataset:
+    request = ObjectiveRequest(objective="mixed", sequence_length=12, feature_dim=16, seed=0)
+    return StreamingObjectiveDataset(request, batch_size=batch_size)
+
+
+def _count_optimizer_steps(trainer) -> list[int]:
+    calls: list[int] = []
+    step = trainer.optimizer.step
+
+    def _counting_step(*args, **kwargs):
+        calls.append(1)
+        return step(*args, **kwargs)
+
+    trainer.optimizer.step = _counting_step
+    return calls
+
+
+def _saved_activation_bytes(fn) -> int:
+    total = 0
+
+    def _pack(t):
+        nonlocal total
+        total += t.numel() * t.element_size()
+        return t
+
+    with torch.autograd.graph.saved_tensors_hooks(_pack, lambda t: t):
+        fn()
+    return total
+
+
+def test_stage1_trainer_accumulates_gradients():
+    world, _ = _tiny_world_narrator()
+    trainer = Stage1JEPATrainer(
+        world, latent_dim=32, learning_rate=1e-3, weight_decay=0.0, device="cpu",
+        infra=InfraConfig(gradient_accumulation_steps=2),
+    )
+    optimizer_steps = _count_optimizer_steps(trainer)
+    micro_batches: list[int] = []
+    world.register_forward_pre_hook(lambda module, args: micro_batches.append(1))
+
+    result = trainer.train(_streaming(4), batch_size=4, max_steps=3, persist_state=False)
+
+    assert result.steps == 3
+    assert len(optimizer_steps) == 3
+    assert len(micro_batches) == 6
+
+
+def test_stage2_trainer_runs_under_bf16_autocast():
+    world, narrator = _tiny_world_narrator()
+    trainer = Stage2ShapingTrainer(
+        world, narrator, input_dim=16, world_step_hz=40,
+        stage2_weights=Stage2LossWeights(), learning_rate=1e-3, weight_decay=0.0,
+        device="cpu", infra=InfraConfig(bf16=True, gradient_accumulation_steps=2),
+    )
+    dtypes: list[torch.dtype] = []
+    trainer.obs_predictor[0].register_forward_hook(lambda m, args, out: dtypes.append(out.dtype))
+    optimizer_steps = _count_optimizer_steps(trainer)
+
+    result = trainer.train(_streaming(2), batch_size=2, max_steps=2, persist_state=False)
+
+    assert result.steps == 2
+    assert len(optimizer_steps) == 2
+    assert len(dtypes) == 4
+    assert set(dtypes) == {torch.bfloat16}
+    assert all(p.dtype == torch.float32 for p in trainer.world_model.parameters())
+
+
+def test_stage4_trainer_checkpoints_activations():
+    world, narrator = _tiny_world_narrator()
+    control_head = ControlHead(narrator_dim=16, action_dim=4, hidden_dim=8)
+    reference = torch.nn.Sequential(
+        torch.nn.Linear(20, 16), torch.nn.SiLU(), torch.nn.Linear(16, 16), torch.nn.Tanh(),
+    )
+    assert not world.time_checkpointing
+    trainer = Stage4EmbodiedTrainer(
+        world_model=world,
+        narrator=narrator,
+        control_head=control_head,
+        stage4_cfg=Stage4Config(grid_size=4, max_episode_steps=6, episodes_per_epoch=2),
+        input_dim=16,
+        learning_rate=1e-3,
+        weight_decay=0.0,
+        device="cpu",
+        infra=InfraConfig(activation_checkpointing=True),
+    )
+    # The world model is checkpointed along time, not just the adapter layers.
+    assert trainer.world_model.time_checkpointing
+    reference.load_state_dict(trainer.obs_adapter.state_dict())
+    x = torch.randn(8, 20)
+
+    checkpointed = _saved_activation_bytes(lambda: trainer.obs_adapter(x).sum())
+    plain = _saved_activation_bytes(lambda: reference(x).sum())
+    assert trainer.obs_adapter._activation_checkpointed
+    assert checkpointed < plain
+    torch.testing.assert_close(trainer.obs_adapter(x), reference(x))
+
+    result = trainer.train(max_steps=2)
+    assert result.steps == 2
+
+
 # ---------------------------------------------------------------------------
 # Artifact validation tests
 # ---------------------------------------------------------------------------
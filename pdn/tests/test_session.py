@@ -0,0 +1,122 @@
+"""Tests for the streaming InferenceSession."""
+
+import pytest
+import torch
+
+from persistent_diamonds_v3.models import (
+    ControlHead,
+    DiscreteNarrator,
+    InferenceSession,
+    ModularSSMWorldModel,
+)
+
+
+def _small_models():
+    world = ModularSSMWorldModel(
+        input_dim=16, latent_dim=64, module_count=4, overlap_ratio=0.25, hidden_dim=32,
+    )
+    narrator = DiscreteNarrator(
+        latent_dim=64, hidden_dim=32, window_size=4, update_hz=10,
+        codebook_size=64, codes_per_step=4, code_dim=8,
+    )
+    control = ControlHead(narrator_dim=32, action_dim=5, hidden_dim=16)
+    return world, narrator, control
+
+
+def _reference_rollout(world, narrator, obs, stride):
+    """Whole-sequence reference: world forward, then strided narrator with hidden carry."""
+    with torch.no_grad():
+        states = world(obs, initial_state=torch.zeros(obs.size(0), world.latent_dim)).states
+        hidden = None
+        codes = {}
+        for t in range(0, obs.size(1), stride):
+            start = max(0, t + 1 - narrator.window_size)
+            out = narrator(states[:, start : t + 1], hidden_state=hidden)
+            hidden = out.hidden_state
+            codes[t] = out.code_indices
+    return states, codes
+
+
+def test_session_matches_whole_sequence_rollout():
+    world, narrator, control = _small_models()
+    obs = torch.randn(2, 23, 16)
+    session = InferenceSession(world, narrator, control_head=control, world_step_hz=30, batch_size=2)
+    assert session.update_stride == 3
+
+    ref_states, ref_codes = _reference_rollout(world, narrator, obs, stride=3)
+    for t in range(obs.size(1)):
+        out = session.tick(obs[:, t])
+        torch.testing.assert_close(out.world_state, ref_states[:, t], rtol=1e-5, atol=1e-6)
+        assert out.narrator_updated == (t in ref_codes)
+        if out.narrator_updated:
+            assert torch.equal(out.code_indices, ref_codes[t])
+            assert out.control is not None
+            assert out.control.action_logits.shape == (2, 5)
+
+
+def test_session_holds_outputs_between_updates():
+    world, narrator, _ = _small_models()
+    session = InferenceSession(world, narrator, world_step_hz=100)
+    first = session.tick(torch.randn(16))
+    second = session.tick(torch.randn(16))
+    assert first.narrator_updated and not second.narrator_updated
+    assert torch.equal(first.code_indices, second.code_indices)
+    assert second.control is None
+
+
+def test_session_latency_report_and_deadline_misses():
+    world, narrator, _ = _small_models()
+    session = InferenceSession(world, narrator, world_step_hz=100)
+    for _ in range(20):
+        session.tick(torch.randn(1, 16))
+    report = session.latency_report()
+    assert report.ticks == 20
+    assert report.budget_ms == pytest.approx(10.0)
+    assert 0.0 < report.p50_ms <= report.p90_ms <= report.p99_ms <= report.max_ms
+
+    # An impossible budget turns every tick into a deadline miss.
+    session.reset()
+    session.budget_s = 0.0
+    for _ in range(5):
+        assert session.tick(torch.randn(1, 16)).deadline_missed
+    assert session.latency_report().deadline_misses == 5
+
+
+def test_session_rejects_wrong_batch_size():
+    world, narrator, _ = _small_models()
+    session = InferenceSession(world, narrator, batch_size=2)
+    with pytest.raises(ValueError, match="batch size"):
+        session.tick(torch.randn(3, 16))
+
+
+def test_bench_session_cli_reports_latency(tmp_path):
+    import json
+
+    from typer.testing import CliRunner
+
+    from persistent_diamonds_v3.cli import app
+    from persistent_diamonds_v3.config import PersistentDiamondsConfig
+
+    cfg = PersistentDiamondsConfig()
+    cfg.world_model.input_dim = 8
+    cfg.world_model.latent_dim = 32
+    cfg.world_model.module_count = 2
+    cfg.world_model.hidden_dim = 16
+    cfg.narrator.hidden_dim = 16
+    cfg.narrator.window_size = 4
+    cfg.narrator.codebook_size = 32
+    cfg.narrator.codes_per_step = 2
+    cfg.narrator.code_dim = 4
+    cfg.control_head.hidden_dim = 8
+    cfg.train.device = "cpu"
+    config_path = tmp_path / "pdv3.yaml"
+    cfg.to_yaml(config_path)
+
+    result = CliRunner().invoke(
+        app,
+        ["bench-session", "--config-path", str(config_path), "--ticks", "12", "--warmup-ticks", "3"],
+    )
+    assert result.exit_code == 0, result.output
+    payload = json.loads(result.output)
+    assert payload["ticks"] == 12
+    assert 0.0 <= payload["miss_rate"] <= 1.0
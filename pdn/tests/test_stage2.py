@@ -0,0 +1,133 @@
+"""Tests for Stage 2 structural shaping."""
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from persistent_diamonds_v3.config import Stage2LossWeights
+from persistent_diamonds_v3.data import (
+    IQTObjectiveDataStore,
+    ObjectiveRequest,
+    ObjectiveTensorDataset,
+    StreamingObjectiveDataset,
+)
+from persistent_diamonds_v3.models import ControlHead, DiscreteNarrator, ModularSSMWorldModel
+from persistent_diamonds_v3.training.stage2 import Stage2Result, Stage2ShapingTrainer
+
+
+def _small_trainer(**overrides):
+    world = ModularSSMWorldModel(
+        input_dim=12, latent_dim=32, module_count=2, overlap_ratio=0.25, hidden_dim=16,
+    )
+    narrator = DiscreteNarrator(
+        latent_dim=32, hidden_dim=16, window_size=4, update_hz=10,
+        codebook_size=32, codes_per_step=2, code_dim=8,
+    )
+    kwargs = {
+        "input_dim": 12,
+        "world_step_hz": 40,
+        "stage2_weights": Stage2LossWeights(),
+        "learning_rate": 1e-3,
+        "weight_decay": 0.0,
+        "device": "cpu",
+        "control_head": ControlHead(narrator_dim=16, action_dim=4, hidden_dim=8),
+    }
+    kwargs.update(overrides)
+    return Stage2ShapingTrainer(world, narrator, **kwargs)
+
+
+def test_update_rate_head_losses_equal_per_step_losses():
+    trainer = _small_trainer()
+    world_states = torch.randn(3, 18, 32)
+    task_signal = torch.randn(3, 18, 1)
+    narrator = trainer.narrator.rollout(world_states, update_stride=trainer.narrator_update_stride)
+
+    loss_task, distortion, loss_ctrl = trainer._narrator_head_losses(narrator, world_states, task_signal)
+
+    # Reference: heads evaluated on the per-step expansion of the narrator outputs.
+    state = narrator.per_step(narrator.narrator_state)
+    uncertainty = narrator.per_step(narrator.uncertainty)
+    ref_task = F.mse_loss(trainer.task_head(torch.cat([state, uncertainty], dim=-1)), task_signal)
+    ref_rd = F.mse_loss(trainer.rd_decoder(state[:, :-1]), world_states[:, 1:])
+    ctrl = trainer.control_head(state)
+    ref_ctrl = F.mse_loss(
+        ctrl.value_estimate,
+        task_signal.mean(dim=-1, keepdim=True).expand_as(ctrl.value_estimate),
+    )
+    probs = F.softmax(ctrl.action_logits, dim=-1)
+    ref_ctrl = ref_ctrl - 0.01 * (-(probs * torch.log(probs + 1e-8)).sum(dim=-1).mean())
+
+    torch.testing.assert_close(loss_task, ref_task)
+    torch.testing.assert_close(distortion, ref_rd)
+    torch.testing.assert_close(loss_ctrl, ref_ctrl)
+
+
+def test_stage2_smoke(tmp_path):
+    store = IQTObjectiveDataStore(tmp_path / "cache")
+    data = store.materialize(
+        ObjectiveRequest(objective="mixed", num_sequences=4, sequence_length=12, feature_dim=12)
+    )
+    trainer = _small_trainer()
+    result = trainer.train(ObjectiveTensorDataset(data.dataset_path), batch_size=2, max_steps=3)
+    assert isinstance(result, Stage2Result)
+    assert result.steps == 3
+    assert torch.isfinite(torch.tensor(result.final_loss))
+
+
+def test_stage2_trains_on_streaming_dataset():
+    request = ObjectiveRequest(objective="mixed", sequence_length=12, feature_dim=12)
+    trainer = _small_trainer()
+    result = trainer.train(StreamingObjectiveDataset(request, batch_size=2), batch_size=2, max_steps=3)
+    assert result.steps == 3
+    assert torch.isfinite(torch.tensor(result.final_loss))
+
+
+def test_stage2_resumes_streaming_dataset_at_start_step():
+    request = ObjectiveRequest(objective="mixed", sequence_length=12, feature_dim=12)
+    stream = StreamingObjectiveDataset(request, batch_size=2)
+    trainer = _small_trainer()
+    first = trainer.train(stream, batch_size=2, max_steps=3)
+    assert first.batches == 3
+
+    seen: list[torch.Tensor] = []
+    trainer.world_model.register_forward_pre_hook(lambda module, args: seen.append(args[0].clone()))
+    trainer.train(stream, batch_size=2, max_steps=1, start_step=first.batches)
+    assert stream.start_step == 0
+    assert torch.equal(seen[0], stream.batch(3)["observations"])
+
+
+def test_stage2_truncated_bptt_carries_state_per_stream(tmp_path):
+    store = IQTObjectiveDataStore(tmp_path / "cache", storage_format="npy")
+    data = store.materialize(
+        ObjectiveRequest(objective="mixed", num_sequences=5, sequence_length=40, feature_dim=12)
+    )
+    trainer = _small_trainer()
+    resets: list[int] = []
+    reset = trainer.world_model.reset_persistent_state
+
+    def _counting_reset(*args, **kwargs):
+        resets.append(kwargs.get("batch_size", args[0] if args else 1))
+        return reset(*args, **kwargs)
+
+    trainer.world_model.reset_persistent_state = _counting_reset
+    # 5 sequences in 2 streams: 2 rounds of two 20-step windows per epoch.
+    result = trainer.train(
+        ObjectiveTensorDataset(data.dataset_path), batch_size=2, max_steps=6, chunk_length=20
+    )
+    assert result.steps == 6
+    # The initial reset, then one per round of sequences (windows 1, 3 and 5).
+    assert resets == [2, 2, 2, 2]
+    assert trainer.world_model._persistent_state.shape == (2, 32)
+
+
+def test_stage2_truncated_bptt_requires_stride_aligned_chunks(tmp_path):
+    store = IQTObjectiveDataStore(tmp_path / "cache", storage_format="npy")
+    data = store.materialize(
+        ObjectiveRequest(objective="mixed", num_sequences=4, sequence_length=40, feature_dim=12)
+    )
+    trainer = _small_trainer()
+    assert trainer.narrator_update_stride == 4
+    with pytest.raises(ValueError, match="multiple of the narrator update stride"):
+        trainer.train(
+            ObjectiveTensorDataset(data.dataset_path), batch_size=2, max_steps=1, chunk_length=10
+        )